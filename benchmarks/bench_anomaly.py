@@ -0,0 +1,68 @@
+# Anomaly detector cost: what scoring adds to a single report insert and to
+# bulk import throughput, and how fast replay rebuilds every patient's state
+# from existing reports.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import bench_import
+from benchmarks.bench_backup import percentiles
+from benchmarks.synthetic import fresh_db, generate
+from healthcare.anomaly import AnomalyDetector, replay
+from healthcare.bulk_import import import_reports
+from healthcare.service import HealthcareService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Anomaly detector overhead per insert, on import, and replay speed")
+    parser.add_argument("--scale", default="20000x24", help="PATIENTSxREPORTS")
+    parser.add_argument("--inserts", type=int, default=5000, help="single add_report calls")
+    parser.add_argument("--import-rows", type=int, default=200000)
+    parser.add_argument("--dir", help="where to create the databases")
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp(prefix="bench_anomaly_", dir=args.dir)
+    patients, per_patient = (int(x) for x in args.scale.lower().split("x"))
+    db = fresh_db(os.path.join(tmp, "bench.db"), readers=1)
+    ids = generate(db, patients, per_patient, 20)
+    service = HealthcareService(db)
+
+    result = replay(db, service.cold)
+    print(result.summary())
+    print(f"replay: {result.elapsed / result.reports * 1e6:.1f} us a report")
+
+    rnd = random.Random(1)
+    times = []
+    for _ in range(args.inserts):
+        pid = rnd.choice(ids)
+        bp = f"{rnd.randint(100, 170)}/{rnd.randint(65, 105)}"
+        t0 = time.perf_counter()
+        service.add_report(pid, "2026-01", bp, round(rnd.uniform(80, 200), 1), round(rnd.uniform(3, 11), 1))
+        times.append(time.perf_counter() - t0)
+    n, p50, p95, p99, worst = percentiles(times)
+    stats = service.anomaly.stats()
+    print(f"\nadd_report: n {n}, p50 {p50:.3f} ms, p99 {p99:.3f} ms; detector {stats['us_per_report']:.1f} us "
+          f"a report ({stats['us_per_report'] / 1000 / p50:.0%} of p50), {stats['raised']:,} alerts")
+    service.cold.close()
+    db.close()
+
+    src = os.path.join(tmp, "reports.csv")
+    bench_import.write_csv(src, args.import_rows, patients)
+    print(f"\n{'import':16} {'rows/s':>10} {'alerts':>8}")
+    rates = {}
+    for label, scored in (("without detector", False), ("with detector", True)):
+        db = bench_import.fresh_db(os.path.join(tmp, f"import_{scored}.db"), patients)
+        result = import_reports(db, src, "append", detector=AnomalyDetector(db) if scored else None)
+        db.close()
+        rates[label] = result.rows_per_sec
+        print(f"{label:16} {result.rows_per_sec:10,.0f} {result.alerts:8,}")
+    slower = 1 / rates["with detector"] - 1 / rates["without detector"]
+    print(f"detector adds {slower * 1e6:.1f} us a row on import")
+
+
+if __name__ == "__main__":
+    main()
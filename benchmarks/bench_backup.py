@@ -0,0 +1,85 @@
+# Online backup cost: how long a snapshot of a synthetic database takes and
+# what it does to foreground latency. A foreground thread alternates report
+# inserts and page reads, first with nothing else running, then while a
+# backup runs; per-phase latency percentiles are printed side by side.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import fresh_db, generate
+from healthcare.backup import STEP_PAGES, STEP_PAUSE, backup
+from healthcare.service import HealthcareService
+
+
+class Foreground(threading.Thread):
+    def __init__(self, service, ids):
+        super().__init__(daemon=True)
+        self.service = service
+        self.ids = ids
+        self.writes, self.reads = [], []
+        self.stopping = threading.Event()
+
+    def run(self):
+        rnd = random.Random(1)
+        while not self.stopping.is_set():
+            pid = rnd.choice(self.ids)
+            t0 = time.perf_counter()
+            self.service.add_report(pid, "2026-01", "128/84", 110.5, 6.1)
+            t1 = time.perf_counter()
+            self.service.list_reports(pid, None, 50)
+            t2 = time.perf_counter()
+            self.writes.append(t1 - t0)
+            self.reads.append(t2 - t1)
+            time.sleep(0.002)
+
+
+def percentiles(times):
+    times = sorted(times)
+    n = len(times)
+    pick = lambda q: times[min(n - 1, int(n * q))] * 1000
+    return n, pick(0.5), pick(0.95), pick(0.99), times[-1] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backup duration and foreground latency impact")
+    parser.add_argument("--scale", default="20000x24", help="PATIENTSxREPORTS")
+    parser.add_argument("--baseline", type=float, default=3.0, help="seconds of foreground-only load")
+    parser.add_argument("--step-pages", type=int, default=STEP_PAGES)
+    parser.add_argument("--pause-ms", type=float, default=STEP_PAUSE * 1000)
+    parser.add_argument("--dir", help="where to create the database and snapshot")
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp(prefix="bench_backup_", dir=args.dir)
+    patients, per_patient = (int(x) for x in args.scale.lower().split("x"))
+    db = fresh_db(os.path.join(tmp, "bench.db"), readers=2)
+    ids = generate(db, patients, per_patient, 200)
+    service = HealthcareService(db)
+
+    phases = {}
+    for phase in ("idle", "during backup"):
+        fg = Foreground(service, ids)
+        fg.start()
+        if phase == "idle":
+            time.sleep(args.baseline)
+        else:
+            result = backup(db, os.path.join(tmp, "snapshots"), args.step_pages, args.pause_ms / 1000)
+        fg.stopping.set()
+        fg.join()
+        phases[phase] = fg
+    db.close()
+
+    print(result.summary())
+    print(f"\n{'foreground':24} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for phase, fg in phases.items():
+        for kind, times in (("insert", fg.writes), ("read page", fg.reads)):
+            n, p50, p95, p99, worst = percentiles(times)
+            print(f"{kind + ', ' + phase:24} {n:6} {p50:8.2f} {p95:8.2f} {p99:8.2f} {worst:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
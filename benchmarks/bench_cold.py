@@ -0,0 +1,88 @@
+# Cold tier effect: database size, the page footprint of the reports table
+# and its indexes (what the page cache has to hold for per-patient reads),
+# and latency of the chart, comparison and export paths, before and after
+# moving everything older than the horizon to columnar segments.
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_backup import percentiles
+from benchmarks.synthetic import fresh_db, generate
+from healthcare.coldstore import COLD_AFTER_MONTHS, cold_dir, move_cold
+from healthcare.service import HealthcareService
+
+
+def footprint(db):
+    # (database bytes, pages of reports and its indexes or None without dbstat)
+    with db.reader() as con:
+        size = con.execute("PRAGMA page_count").fetchone()[0] * con.execute("PRAGMA page_size").fetchone()[0]
+        try:
+            pages = con.execute("SELECT COUNT(*) FROM dbstat WHERE name IN "
+                                "(SELECT name FROM sqlite_schema WHERE tbl_name = 'reports')").fetchone()[0]
+        except sqlite3.OperationalError:
+            pages = None
+    return size, pages
+
+
+def measure(service, ids, rounds, path):
+    rnd = random.Random(1)
+    chart, compare = [], []
+    for _ in range(rounds):
+        pid = rnd.choice(ids)
+        t0 = time.perf_counter()
+        service.chart_rows(pid)
+        t1 = time.perf_counter()
+        service.compare_reports(pid)
+        t2 = time.perf_counter()
+        chart.append(t1 - t0)
+        compare.append(t2 - t1)
+    t0 = time.perf_counter()
+    rows = service.export_reports(path)
+    return chart, compare, rows, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Database size and read latency before and after the cold move")
+    parser.add_argument("--scale", default="20000x60", help="PATIENTSxREPORTS")
+    parser.add_argument("--months", type=int, default=COLD_AFTER_MONTHS)
+    parser.add_argument("--rounds", type=int, default=2000, help="patients charted and compared per phase")
+    parser.add_argument("--dir", help="where to create the database")
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp(prefix="bench_cold_", dir=args.dir)
+    patients, per_patient = (int(x) for x in args.scale.lower().split("x"))
+    db = fresh_db(os.path.join(tmp, "bench.db"), readers=2)
+    ids = generate(db, patients, per_patient, 200)
+    service = HealthcareService(db)
+
+    phases = {}
+    for phase in ("before", "after"):
+        if phase == "after":
+            result = move_cold(db, months=args.months)
+        size, pages = footprint(db)
+        chart, compare, rows, export_s = measure(service, ids, args.rounds, os.path.join(tmp, f"{phase}.csv"))
+        phases[phase] = (size, pages, chart, compare, rows, export_s)
+    segments = sum(os.path.getsize(os.path.join(cold_dir(db.path), name)) for name in os.listdir(cold_dir(db.path)))
+    service.cold.close()
+    db.close()
+
+    print(result.summary())
+    print(f"\n{'phase':8} {'db MB':>8} {'reports pages':>14} {'segments MB':>12} {'export rows':>12} {'export s':>9}")
+    for phase, (size, pages, _, _, rows, export_s) in phases.items():
+        cold_mb = segments / 1e6 if phase == "after" else 0.0
+        print(f"{phase:8} {size / 1e6:8.1f} {pages if pages is not None else '-':>14} {cold_mb:12.1f} "
+              f"{rows:12,} {export_s:9.2f}")
+    print(f"\n{'latency':18} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for phase, (_, _, chart, compare, _, _) in phases.items():
+        for kind, times in (("chart", chart), ("compare", compare)):
+            n, p50, p95, p99, worst = percentiles(times)
+            print(f"{kind + ', ' + phase:18} {n:6} {p50:8.2f} {p95:8.2f} {p99:8.2f} {worst:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# History cache effect: the reports tab's open -> Compare -> Show BP Chart
+# sequence over a skewed stream of patients (most views go to a small hot
+# set), with the cache at its default budget versus disabled (budget 0, every
+# view reloads). Prints latency percentiles, SQL statements per sequence,
+# hit rate, and the memory of the cached arrays against the same histories
+# held as lists of row tuples.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_backup import percentiles
+from benchmarks.synthetic import fresh_db, generate
+from healthcare.db import QUERIES
+from healthcare.history import HISTORY_BUDGET, HistoryCache, HistoryPager
+from healthcare.service import HealthcareService
+
+
+def statements(db):
+    return sum(n for _, n, *_ in db.tracer.handler_stats())
+
+
+def run(service, ids, hot, sequences, visible=12):
+    rnd = random.Random(1)
+    times = []
+    db = service.db
+    db.tracer.reset()
+    for _ in range(sequences):
+        pid = rnd.choice(hot) if rnd.random() < 0.8 else rnd.choice(ids)
+        t0 = time.perf_counter()
+        pager = HistoryPager(service.history, pid)
+        pager.count()
+        pager.rows(0, visible)
+        service.compare_reports(pid)
+        service.chart_rows(pid)
+        times.append(time.perf_counter() - t0)
+    return times, statements(db) / sequences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Patient history cache: latency, SQL and memory")
+    parser.add_argument("--scale", default="5000x60", help="PATIENTSxREPORTS")
+    parser.add_argument("--hot", type=int, default=200, help="patients that get 80%% of the views")
+    parser.add_argument("--sequences", type=int, default=5000)
+    parser.add_argument("--budget-mb", type=float, default=HISTORY_BUDGET / 1e6)
+    parser.add_argument("--dir", help="where to create the database")
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp(prefix="bench_history_", dir=args.dir)
+    patients, per_patient = (int(x) for x in args.scale.lower().split("x"))
+    db = fresh_db(os.path.join(tmp, "bench.db"), readers=2)
+    ids = generate(db, patients, per_patient, 200)
+    service = HealthcareService(db)
+    hot = random.Random(2).sample(ids, min(args.hot, len(ids)))
+
+    phases = {}
+    for phase, budget in (("uncached", 0), ("cached", int(args.budget_mb * 1e6))):
+        service.history = HistoryCache(db, service.cold, budget)
+        times, per_sequence = run(service, ids, hot, args.sequences)
+        phases[phase] = (times, per_sequence, service.history.stats())
+
+    # The hot set's histories as arrays (what the cache holds) and as tuples.
+    cache = HistoryCache(db, service.cold, 1 << 40)
+    for pid in hot:
+        cache.get(pid)
+    tracemalloc.start()
+    with db.reader() as con:
+        tuples = [con.execute(QUERIES["history.rows"], (pid,)).fetchall() for pid in hot]
+    tuple_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    service.cold.close()
+    db.close()
+
+    print(f"{'sequence':10} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'SQL/seq':>8} {'hit rate':>9}")
+    for phase, (times, per_sequence, stats) in phases.items():
+        n, p50, p95, p99, worst = percentiles(times)
+        print(f"{phase:10} {n:6} {p50:8.2f} {p95:8.2f} {p99:8.2f} {worst:8.2f} {per_sequence:8.2f} "
+              f"{stats['hit_rate']:9.1%}")
+    stats = phases["cached"][2]
+    print(f"\ncache: {stats['entries']:,} patients, {stats['bytes'] / 1e6:.2f} MB, "
+          f"{stats['evictions']:,} evictions, {stats['invalidations']:,} invalidations")
+    rows = sum(len(t) for t in tuples)
+    print(f"{len(hot)} hot histories, {rows:,} reports: {cache.bytes / 1e6:.2f} MB as arrays, "
+          f"{tuple_bytes / 1e6:.2f} MB as row tuples")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# Hospital directory: load throughput of a synthetic national directory,
+# disease re-linking, and lookup latency by city, city and specialty, and
+# disease, cold (first read after a change) and from the lookup cache,
+# against the old whole-table read the Hospitals tab did on every click.
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_backup import percentiles
+from benchmarks.synthetic import fresh_db
+from healthcare.db import QUERIES
+from healthcare.hospitals import HospitalDirectory, load_directory
+
+SPECIALTIES = ["General", "Cardiology", "Oncology", "Orthopaedics", "Neurology", "Pulmonology", "Paediatrics",
+               "Nephrology", "Infectious Disease", "Maternity", "Eye Care", "Dental"]
+CHAINS = ["Apollo Hospitals", "Fortis", "Max Healthcare", "Manipal Hospital", "Narayana Health", "Medanta"]
+
+
+def write_directory(path, hospitals, cities, seed=1):
+    # Big cities get most hospitals; a few chains have a branch in many.
+    rnd = random.Random(seed)
+    names = [f"City {i}" for i in range(cities)]
+    weights = [1 / (i + 1) for i in range(cities)]
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["name", "city", "specialty", "contact"])
+        for i in range(hospitals):
+            city = rnd.choices(names, weights)[0]
+            name = rnd.choice(CHAINS) if rnd.random() < 0.05 else f"{rnd.choice(SPECIALTIES)} Care Centre {i}"
+            w.writerow([name, city, rnd.choice(SPECIALTIES), f"0{rnd.randrange(10 ** 9):09d}"])
+    return names
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    n, p50, p95, p99, worst = percentiles(times)
+    return p50, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hospital directory load and lookup latency")
+    parser.add_argument("--hospitals", type=int, default=50000)
+    parser.add_argument("--cities", type=int, default=800)
+    parser.add_argument("--diseases", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--dir", help="where to create the database")
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp(prefix="bench_hospitals_", dir=args.dir)
+    db = fresh_db(os.path.join(tmp, "bench.db"), readers=1)
+    src = os.path.join(tmp, "directory.csv")
+    cities = write_directory(src, args.hospitals, args.cities)
+    rnd = random.Random(2)
+    with db.writer() as con:
+        con.executemany(QUERIES["diseases.insert"],
+                        ((f"disease {i}", "", "", 0, "", ", ".join(rnd.sample(CHAINS + ["Nowhere Clinic"], 2)), "")
+                         for i in range(args.diseases)))
+    result = load_directory(db, src)
+    print(result.summary())
+    print(f"{result.inserted / result.elapsed:,.0f} hospitals/s including re-linking {result.diseases:,} diseases")
+
+    directory = HospitalDirectory(db)
+    big, small = cities[0], cities[-1]
+    lookups = [
+        (f"city {big}", lambda: directory.lookup(big)),
+        (f"city {small}", lambda: directory.lookup(small)),
+        (f"{big} + Cardiology", lambda: directory.lookup(big, "Cardiology")),
+        ("disease", lambda: directory.lookup(disease="disease 7")),
+        ("cities", directory.cities),
+    ]
+    print(f"\n{'lookup':22} {'rows':>6} {'cold p50':>9} {'cold p99':>9} {'cached p50':>11} {'cached p99':>11}")
+    for label, fn in lookups:
+        def cold():
+            directory._pages.clear()
+            return fn()
+        rows = len(fn())
+        c50, c99 = timed(cold, args.repeat)
+        h50, h99 = timed(fn, args.repeat)
+        print(f"{label:22} {rows:6,} {c50:9.3f} {c99:9.3f} {h50:11.3f} {h99:11.3f}")
+
+    def nearby():
+        pager = directory.pager(big)
+        pager.rows(0, 15, prefetch=0)
+    n50, n99 = timed(nearby, args.repeat)
+    print(f"\nnearby table (count + first page for {big}): p50 {n50:.3f} ms, p99 {n99:.3f} ms")
+
+    def whole_table():
+        with db.reader() as con:
+            con.execute("SELECT name, city, contact FROM hospitals").fetchall()
+    w50, w99 = timed(whole_table, max(5, args.repeat // 10))
+    print(f"old whole-table read ({args.hospitals:,} rows): p50 {w50:.1f} ms, p99 {w99:.1f} ms")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Bulk import throughput: generates a synthetic lab CSV (about 1% bad rows),
+# imports it into a fresh database in each mode through the app's path
+# (HealthcareService.import_reports, anomaly scoring included) and checks
+# rows/s against the target. Exits non-zero if a mode misses it.
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from healthcare.bulk_import import MODES
+from healthcare.db import QUERIES, Database, init_db, now_str
+from healthcare.service import HealthcareService
+
+TARGET_ROWS_PER_SEC = 40000   # append, the slowest mode, with anomaly scoring
+
+
+def write_csv(path, rows, patients, seed=1):
+    rnd = random.Random(seed)
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["patient_id", "month", "bp", "sugar", "uric_acid"])
+        for i in range(rows):
+            pid = rnd.randint(1, patients)
+            month = f"{rnd.randint(2015, 2025)}-{rnd.randint(1, 12):02d}"
+            bp = f"{rnd.randint(95, 170)}/{rnd.randint(60, 105)}"
+            sugar = f"{rnd.uniform(70, 220):.1f}"
+            uric = f"{rnd.uniform(2, 11):.1f}"
+            if i % 100 == 0:
+                bp = "high"  # rejected
+            w.writerow([pid, month, bp, sugar, uric])
+
+
+def fresh_db(path, patients):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db = Database(path, readers=1)
+    init_db(db)
+    with db.writer() as con:
+        con.executemany(QUERIES["patients.insert"],
+                        ((f"Patient {i}", 40, "F", "", now_str()) for i in range(patients)))
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import throughput through the app's import path")
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--patients", type=int, default=10000)
+    parser.add_argument("--target", type=int, default=TARGET_ROWS_PER_SEC)
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp(prefix="bench_import_")
+    src = os.path.join(tmp, "reports.csv")
+    write_csv(src, args.rows, args.patients)
+    failed = False
+    for mode in MODES:
+        db = fresh_db(os.path.join(tmp, "bench.db"), args.patients)
+        service = HealthcareService(db)
+        if mode != "append":
+            service.import_reports(src, "append")  # so skip/upsert hit existing rows
+        result = service.import_reports(src, mode)
+        db.close()
+        ok = result.rows_per_sec >= args.target
+        failed |= not ok
+        print(f"{mode:7} {result.rows_per_sec:>10,.0f} rows/s  {'OK' if ok else 'BELOW TARGET'}")
+        print("        " + result.summary().replace("\n", "\n        "))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
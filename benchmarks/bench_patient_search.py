@@ -0,0 +1,70 @@
+# Patient search latency: what the Patients tab pays per debounced keystroke
+# (the capped match count plus the first visible page) and per further page
+# as the table scrolls, for short and long, common and rare search texts
+# over name and contact.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_backup import percentiles
+from benchmarks.synthetic import fresh_db
+from healthcare.db import QUERIES, now_str
+from healthcare.search import PatientSearch
+
+FIRST = ["Aarav", "Vivaan", "Aditya", "Priya", "Ananya", "Rahul", "Sneha", "Rohan", "Kavya", "Arjun",
+         "Ishaan", "Meera", "Sanjay", "Pooja", "Vikram", "Neha", "Amit", "Divya", "Suresh", "Lakshmi",
+         "John", "Mary", "Farhan", "Zoya", "Ram"]
+LAST = ["Sharma", "Verma", "Gupta", "Kumar", "Singh", "Patel", "Reddy", "Nair", "Iyer", "Das",
+        "Mehta", "Joshi", "Rao", "Chopra", "Malhotra", "Bose", "Khan", "Smith", "Wong", "Fernandes"]
+# Common trigram, whole common word, two words, an exact name, contact
+# digits, a typed-out phone number, and text nothing matches.
+TEXTS = ["sha", "sharma", "priya sharma", "meera iyer", "9812", "9812345678", "kumar 4321", "xyzzy"]
+
+
+def populate(db, patients, seed=1):
+    rnd = random.Random(seed)
+    with db.writer() as con:
+        con.executemany(QUERIES["patients.insert"],
+                        ((f"{rnd.choice(FIRST)} {rnd.choice(LAST)}", rnd.randint(18, 90), rnd.choice("MF"),
+                          f"98{rnd.randrange(10 ** 8):08d}", now_str()) for _ in range(patients)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Patient trigram search latency")
+    parser.add_argument("--patients", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--visible", type=int, default=15, help="rows on screen")
+    parser.add_argument("--dir", help="where to create the database")
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp(prefix="bench_patient_search_", dir=args.dir)
+    db = fresh_db(os.path.join(tmp, "bench.db"), readers=1)
+    t0 = time.perf_counter()
+    populate(db, args.patients)
+    print(f"{args.patients:,} patients inserted and indexed in {time.perf_counter() - t0:.1f}s")
+    search = PatientSearch(db)
+
+    print(f"\n{'text':14} {'matches':>8} {'first p50':>10} {'first p99':>10} {'next p50':>9} {'next p99':>9}")
+    for text in TEXTS:
+        first, following = [], []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            pager = search.pager(text)
+            pager.rows(0, args.visible, prefetch=0)
+            matches = pager.count()
+            first.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            pager.rows(pager.page_size, args.visible, prefetch=0)
+            following.append(time.perf_counter() - t0)
+        _, f50, _, f99, _ = percentiles(first)
+        _, n50, _, n99, _ = percentiles(following)
+        print(f"{text:14} {matches:8,} {f50:10.2f} {f99:10.2f} {n50:9.2f} {n99:9.2f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
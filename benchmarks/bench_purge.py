@@ -0,0 +1,62 @@
+# Bulk purge cost: how long deleting (or archiving) a share of the patients
+# of a synthetic database takes, with their reports cascading, and what it
+# does to foreground latency. The foreground thread from bench_backup keeps
+# inserting reports for and reading pages of the surviving patients.
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_backup import Foreground, percentiles
+from benchmarks.synthetic import fresh_db, generate
+from healthcare.purge import LOCK_HOLD, purge_patients
+from healthcare.service import HealthcareService
+from healthcare.summary import check_summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk purge duration and foreground latency impact")
+    parser.add_argument("--scale", default="50000x10", help="PATIENTSxREPORTS")
+    parser.add_argument("--share", type=float, default=0.2, help="fraction of patients to purge")
+    parser.add_argument("--archive", action="store_true")
+    parser.add_argument("--baseline", type=float, default=3.0, help="seconds of foreground-only load")
+    parser.add_argument("--hold-ms", type=float, default=LOCK_HOLD * 1000)
+    parser.add_argument("--dir", help="where to create the database")
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp(prefix="bench_purge_", dir=args.dir)
+    patients, per_patient = (int(x) for x in args.scale.lower().split("x"))
+    db = fresh_db(os.path.join(tmp, "bench.db"), readers=2)
+    ids = generate(db, patients, per_patient, 200)
+    victims = ids[::max(1, round(1 / args.share))]
+    survivors = sorted(set(ids) - set(victims))
+    service = HealthcareService(db)
+
+    phases = {}
+    for phase in ("idle", "during purge"):
+        fg = Foreground(service, survivors)
+        fg.start()
+        if phase == "idle":
+            time.sleep(args.baseline)
+        else:
+            result = purge_patients(db, victims, args.archive, hold=args.hold_ms / 1000)
+        fg.stopping.set()
+        fg.join()
+        phases[phase] = fg
+    with db.reader() as con:
+        problems = check_summary(con)
+    db.close()
+
+    print(result.summary())
+    print("patient_summary consistent" if not problems else f"patient_summary: {len(problems)} differences")
+    print(f"\n{'foreground':24} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for phase, fg in phases.items():
+        for kind, times in (("insert", fg.writes), ("read page", fg.reads)):
+            n, p50, p95, p99, worst = percentiles(times)
+            print(f"{kind + ', ' + phase:24} {n:6} {p50:8.2f} {p95:8.2f} {p99:8.2f} {worst:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
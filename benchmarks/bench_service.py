@@ -0,0 +1,161 @@
+# Service-layer benchmark: builds a synthetic database per scale and times
+# each HealthcareService operation. Results go to a JSON file; with
+# --compare BASELINE.json an operation whose p50 got slower than the baseline
+# by more than --tolerance is reported and the exit status is non-zero.
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import SYMPTOMS, fresh_db, generate
+from healthcare.analytics import NUMPY_AVAILABLE
+from healthcare.service import HealthcareService
+
+DEFAULT_SCALES = "200x12,2000x24,10000x24"
+DEFAULT_DISEASES = 500
+DEFAULT_CALLS = 200
+HEAVY_CALLS = 3
+TOLERANCE = 1.25
+
+
+def parse_scales(text):
+    # "200x12,2000x24" -> [(patients, reports per patient), ...]
+    out = []
+    for part in text.split(","):
+        n, m = part.lower().split("x")
+        out.append((int(n), int(m)))
+    return out
+
+
+def scenarios(service, ids, diseases, tmp, rnd):
+    # (name, calls, fn); fn(i) performs one call. Writes undo themselves
+    # (reports added are deleted again) so later scenarios see the same data.
+    added = []
+    pick = lambda: rnd.choice(ids)
+    export_path = os.path.join(tmp, "export.csv")
+    return [
+        ("add_patient", DEFAULT_CALLS, lambda i: service.add_patient(f"Bench {i}", 40, "F", "")),
+        ("get_patient", DEFAULT_CALLS, lambda i: service.get_patient(pick())),
+        ("list_patients", DEFAULT_CALLS, lambda i: service.list_patients(None, 100)),
+        ("list_patients_deep", DEFAULT_CALLS, lambda i: service.list_patients(pick(), 100)),
+        ("search_patients", DEFAULT_CALLS, lambda i: service.search_patients(f"{rnd.randrange(1000):03d}")),
+        ("add_report", DEFAULT_CALLS,
+         lambda i: added.append(service.add_report(pick(), "2026-01", "128/84", 110.5, 6.1)[0])),
+        ("delete_report", DEFAULT_CALLS, lambda i: service.delete_report(added.pop() if added else 0)),
+        ("list_reports", DEFAULT_CALLS, lambda i: service.list_reports(pick(), None, 100)),
+        ("chart_rows", DEFAULT_CALLS, lambda i: service.chart_rows(pick())),
+        ("compare_reports", DEFAULT_CALLS, lambda i: service.compare_reports(pick())),
+        ("check_symptoms", DEFAULT_CALLS, lambda i: service.check_symptoms(rnd.sample(SYMPTOMS, 3))),
+        ("search_diseases", DEFAULT_CALLS, lambda i: service.search_diseases(rnd.choice(diseases)[:4])),
+        ("disease_info", DEFAULT_CALLS, lambda i: service.disease_info(rnd.choice(diseases))),
+        ("hospitals", DEFAULT_CALLS, lambda i: service.hospitals()),
+        ("hospitals_by_city", DEFAULT_CALLS, lambda i: service.hospitals(city="New Delhi")),
+        ("export_patient", DEFAULT_CALLS, lambda i: service.export_reports(export_path, [pick()])),
+        ("export_all", HEAVY_CALLS, lambda i: service.export_reports(export_path)),
+        ("triage", HEAVY_CALLS, lambda i: service.triage()),
+    ]
+
+
+def timed(fn, calls, scale_calls):
+    n = max(1, int(calls * scale_calls)) if calls > HEAVY_CALLS else calls
+    fn(-1)  # warm caches (symptom index, statement cache, pages)
+    times = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        fn(i)
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    return {
+        "calls": n,
+        "mean_ms": sum(times) / n * 1000,
+        "p50_ms": times[n // 2] * 1000,
+        "p95_ms": times[min(n - 1, int(n * 0.95))] * 1000,
+        "max_ms": times[-1] * 1000,
+        "ops_per_sec": n / sum(times) if sum(times) else None,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "numpy": NUMPY_AVAILABLE,
+    }
+
+
+def compare(results, baseline_path, tolerance):
+    # Returns [(scale, op, baseline p50, new p50)] for operations that regressed.
+    with open(baseline_path) as f:
+        baseline = {(r["scale"], r["op"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        old = baseline.get((r["scale"], r["op"]))
+        if old and r["p50_ms"] > old["p50_ms"] * tolerance:
+            regressions.append((r["scale"], r["op"], old["p50_ms"], r["p50_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time HealthcareService operations on synthetic data")
+    parser.add_argument("--scales", default=DEFAULT_SCALES, help="comma separated PATIENTSxREPORTS")
+    parser.add_argument("--diseases", type=int, default=DEFAULT_DISEASES)
+    parser.add_argument("--calls", type=float, default=1.0, help="multiplier for per-operation call counts")
+    parser.add_argument("--only", help="comma separated operation names")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="bench_service.json", help="JSON results file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="allowed p50 slowdown factor against the baseline")
+    args = parser.parse_args()
+    only = set(args.only.split(",")) if args.only else None
+    tmp = tempfile.mkdtemp(prefix="bench_service_")
+    results = []
+    for patients, per_patient in parse_scales(args.scales):
+        scale = f"{patients}x{per_patient}"
+        db = fresh_db(os.path.join(tmp, "bench.db"), readers=2)
+        t0 = time.perf_counter()
+        ids = generate(db, patients, per_patient, args.diseases, args.seed)
+        print(f"{scale}: generated {patients * per_patient:,} reports in {time.perf_counter() - t0:.1f}s",
+              file=sys.stderr)
+        service = HealthcareService(db)
+        with db.reader() as con:
+            diseases = [name for (name,) in con.execute("SELECT name FROM diseases")]
+        rnd = random.Random(args.seed)
+        for op, calls, fn in scenarios(service, ids, diseases, tmp, rnd):
+            if only and op not in only:
+                continue
+            r = {"scale": scale, "patients": patients, "reports": patients * per_patient,
+                 "diseases": args.diseases, "op": op}
+            r.update(timed(fn, calls, args.calls))
+            results.append(r)
+            print(f"{scale:>12} {op:20} p50 {r['p50_ms']:9.3f} ms  p95 {r['p95_ms']:9.3f} ms  "
+                  f"({r['calls']} calls)", file=sys.stderr)
+        db.close()
+    with open(args.out, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=1)
+    print(f"results written to {args.out}", file=sys.stderr)
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for scale, op, old, new in regressions:
+            print(f"REGRESSION {scale} {op}: p50 {old:.3f} -> {new:.3f} ms", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
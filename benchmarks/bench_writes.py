@@ -0,0 +1,83 @@
+# Insert throughput: one transaction per add_patient/add_report call (how
+# the GUI handlers used to write) against the same calls queued through
+# WriteBehind, which group-commits them. Each mode is run with the commit
+# fsynced (synchronous=FULL) so acknowledged rows are durable in both.
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import fresh_db
+from healthcare.service import HealthcareService
+from healthcare.writebehind import BATCH_DELAY, BATCH_ROWS, SYNCHRONOUS, WriteBehind
+
+
+def workload(service, i):
+    # Alternate patients and reports, like a data-entry session.
+    if i % 2:
+        return service.add_patient(f"Writer {i}", 30 + i % 50, "F", "")
+    return service.add_report(1, "2026-01", "128/84", 110.5, 6.1)
+
+
+def run_direct(service, count, producers):
+    service.db._writer.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+    def produce(start):
+        for i in range(start, count, producers):
+            workload(service, i)
+    return timed_threads(produce, producers)
+
+
+def run_write_behind(service, count, producers, max_rows, max_delay):
+    wb = WriteBehind(service.db, max_rows, max_delay)
+    def produce(start):
+        futures = [wb.submit(workload, service, i) for i in range(start, count, producers)]
+        for f in futures:
+            f.result()
+    elapsed = timed_threads(produce, producers)
+    wb.close()
+    return elapsed, wb.batches
+
+
+def timed_threads(target, producers):
+    threads = [threading.Thread(target=target, args=(p,)) for p in range(producers)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Insert throughput with and without group commit")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--producers", type=int, default=4, help="threads submitting writes")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    parser.add_argument("--batch-ms", type=float, default=BATCH_DELAY * 1000)
+    parser.add_argument("--dir", help="where to create the databases (fsync cost depends on the disk)")
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp(prefix="bench_writes_", dir=args.dir)
+
+    db = fresh_db(os.path.join(tmp, "direct.db"))
+    service = HealthcareService(db)
+    service.add_patient("Seed", 40)
+    direct = run_direct(service, args.rows, args.producers)
+    db.close()
+    print(f"one commit per write: {args.rows:,} rows in {direct:.2f}s = {args.rows / direct:,.0f} rows/s")
+
+    db = fresh_db(os.path.join(tmp, "grouped.db"))
+    service = HealthcareService(db)
+    service.add_patient("Seed", 40)
+    timed, batches = run_write_behind(service, args.rows, args.producers, args.batch_rows, args.batch_ms / 1000)
+    db.close()
+    print(f"write-behind:         {args.rows:,} rows in {timed:.2f}s = {args.rows / timed:,.0f} rows/s "
+          f"({batches} commits, {args.rows / batches:.0f} rows each)")
+    print(f"speedup: {direct / timed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# HTTP load test for healthcare.server: N keep-alive connections issue a
+# weighted mix of requests for a fixed duration and the requests/s and
+# per-endpoint latencies are reported. Clients remember ETags and send
+# If-None-Match, as a browser or terminal cache would. --spawn starts a
+# server on a fresh synthetic database instead of using --url.
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import SYMPTOMS, fresh_db, generate
+
+DEFAULT_MIX = "list_patients:3,list_reports:3,compare:2,symptoms:1,add_report:1"
+
+
+class Client:
+    # One keep-alive HTTP/1.1 connection.
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+        self.etags = {}
+
+    async def request(self, method, path, body=None, conditional=False):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        data = json.dumps(body).encode() if body is not None else b""
+        head = [f"{method} {path} HTTP/1.1", f"Host: {self.host}", f"Content-Length: {len(data)}"]
+        if conditional and path in self.etags:
+            head.append(f"If-None-Match: {self.etags[path]}")
+        self.writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + data)
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode().partition(":")
+            headers[name.strip().lower()] = value.strip()
+        payload = await self.reader.readexactly(int(headers.get("content-length", 0)))
+        if "etag" in headers:
+            self.etags[path] = headers["etag"]
+        if headers.get("connection") == "close":
+            self.close()
+        return status, payload
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def parse_mix(text):
+    ops = []
+    for part in text.split(","):
+        name, _, weight = part.partition(":")
+        ops.append((name.strip(), int(weight or 1)))
+    return ops
+
+
+def make_request(op, rnd, ids):
+    # -> (method, path, body, conditional)
+    pid = rnd.choice(ids)
+    if op == "list_patients":
+        return "GET", "/patients?limit=50", None, True
+    if op == "list_reports":
+        return "GET", f"/patients/{pid}/reports?limit=50", None, True
+    if op == "compare":
+        return "GET", f"/patients/{pid}/compare", None, False
+    if op == "symptoms":
+        return "POST", "/symptoms/check", {"symptoms": rnd.sample(SYMPTOMS, 3)}, False
+    if op == "add_report":
+        body = {"patient_id": pid, "month": "2026-01", "bp": f"{rnd.randint(100, 170)}/{rnd.randint(60, 100)}",
+                "sugar": round(rnd.uniform(80, 200), 1), "uric_acid": round(rnd.uniform(3, 10), 1)}
+        return "POST", "/reports", body, False
+    if op == "hospitals":
+        return "GET", "/hospitals", None, True
+    raise ValueError(f"unknown operation {op!r}")
+
+
+async def worker(host, port, ops, ids, deadline, seed, stats):
+    rnd = random.Random(seed)
+    client = Client(host, port)
+    names = [n for n, w in ops for _ in range(w)]
+    try:
+        while time.perf_counter() < deadline:
+            op = rnd.choice(names)
+            method, path, body, conditional = make_request(op, rnd, ids)
+            t0 = time.perf_counter()
+            status, _ = await client.request(method, path, body, conditional)
+            st = stats.setdefault(op, {"times": [], "status": {}})
+            st["times"].append(time.perf_counter() - t0)
+            st["status"][status] = st["status"].get(status, 0) + 1
+    finally:
+        client.close()
+
+
+async def run(host, port, ops, connections, duration, seed):
+    client = Client(host, port)
+    status, payload = await client.request("GET", "/patients?limit=1000")
+    client.close()
+    ids = [p["id"] for p in json.loads(payload)] if status == 200 else []
+    if not ids:
+        raise SystemExit("server has no patients to test against")
+    stats = {}
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker(host, port, ops, ids, t0 + duration, seed + i, stats)
+                           for i in range(connections)))
+    return stats, time.perf_counter() - t0
+
+
+def spawn_server(patients, reports, port):
+    tmp = tempfile.mkdtemp(prefix="load_test_")
+    path = os.path.join(tmp, "load.db")
+    db = fresh_db(path)
+    generate(db, patients, reports, 200)
+    db.close()
+    proc = subprocess.Popen([sys.executable, "-m", "healthcare.server", path, "--port", str(port), "--slow-log", ""],
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise SystemExit("server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a running healthcare server")
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation:weight,... "
+                        "(list_patients, list_reports, compare, symptoms, add_report, hospitals)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--spawn", metavar="PATIENTSxREPORTS",
+                        help="start a server on a fresh synthetic database of this size, e.g. 2000x24")
+    parser.add_argument("--out", help="write results as JSON")
+    args = parser.parse_args()
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    proc = None
+    if args.spawn:
+        patients, reports = (int(x) for x in args.spawn.lower().split("x"))
+        proc = spawn_server(patients, reports, port)
+    try:
+        stats, elapsed = asyncio.run(run(host, port, parse_mix(args.mix), args.connections, args.duration, args.seed))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+    total = sum(len(st["times"]) for st in stats.values())
+    print(f"{total:,} requests in {elapsed:.1f}s over {args.connections} connections: "
+          f"{total / elapsed:,.0f} requests/s")
+    results = {"url": args.url, "connections": args.connections, "duration": elapsed,
+               "requests": total, "requests_per_sec": total / elapsed, "ops": {}}
+    for op, st in sorted(stats.items()):
+        times = sorted(st["times"])
+        n = len(times)
+        r = {"requests": n, "p50_ms": times[n // 2] * 1000, "p95_ms": times[min(n - 1, int(n * 0.95))] * 1000,
+             "max_ms": times[-1] * 1000, "status": {str(k): v for k, v in sorted(st["status"].items())}}
+        results["ops"][op] = r
+        print(f"  {op:14} {n:7,}  p50 {r['p50_ms']:7.2f} ms  p95 {r['p95_ms']:7.2f} ms  status {r['status']}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Synthetic data for the benchmarks and load tests: N patients with M monthly
+# reports each and K diseases, deterministic for a given seed. Readings drift
+# around a per-patient baseline so every band (and band changes) shows up.
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from healthcare.db import QUERIES, Database, init_db, now_str
+from healthcare.summary import deferred
+
+SYMPTOMS = [
+    "fever", "chills", "headache", "cough", "sore throat", "sneezing", "fatigue", "nausea",
+    "vomiting", "rash", "joint pain", "back pain", "chest pain", "dizziness", "thirst",
+    "urination", "weight loss", "night sweats", "wheezing", "shortness of breath",
+    "loss of smell", "blurred vision", "swelling", "itching", "numbness", "palpitations",
+    "insomnia", "diarrhea", "constipation", "abdominal pain", "muscle ache", "confusion",
+]
+WORDS = ["acute", "chronic", "viral", "bacterial", "tropical", "seasonal", "hereditary", "allergic",
+         "renal", "cardiac", "hepatic", "pulmonary", "gastric", "neural", "dermal", "vascular"]
+LAST_YEAR = 2025
+BATCH_ROWS = 20000
+
+
+def fresh_db(path, readers=1):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db = Database(path, readers=readers)
+    init_db(db)
+    return db
+
+
+def months_back(count):
+    # The last `count` months up to December of LAST_YEAR, oldest first.
+    out = []
+    year, month = LAST_YEAR, 12
+    for _ in range(count):
+        out.append(f"{year}-{month:02d}")
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return out[::-1]
+
+
+def report_rows(rnd, patient_ids, per_patient):
+    months = months_back(per_patient)
+    created = now_str()
+    for pid in patient_ids:
+        sys_base, dia_base = rnd.randint(100, 170), rnd.randint(65, 105)
+        sugar_base, uric_base = rnd.uniform(80, 200), rnd.uniform(3, 11)
+        for month in months:
+            yield (pid, month, sys_base + rnd.randint(-15, 15), dia_base + rnd.randint(-10, 10),
+                   round(max(40.0, sugar_base + rnd.gauss(0, 20)), 1),
+                   round(max(1.0, uric_base + rnd.gauss(0, 1.2)), 1), created)
+
+
+def disease_rows(rnd, count):
+    for i in range(count):
+        name = f"{rnd.choice(WORDS)} {rnd.choice(WORDS)} disorder {i}"
+        symptoms = ",".join(rnd.sample(SYMPTOMS, rnd.randint(2, 6)))
+        treatable = rnd.random() < 0.5
+        yield (name, f"Synthetic {name}", symptoms, int(treatable),
+               "Rest, fluids" if treatable else "", "" if treatable else "City Hospital", "")
+
+
+def generate(db, patients, reports_per_patient, diseases, seed=1):
+    # Appends the data set to db (normally a fresh one); returns the new patient ids.
+    rnd = random.Random(seed)
+    with db.writer() as con, deferred(con):
+        first = con.execute("SELECT coalesce(MAX(id), 0) FROM patients").fetchone()[0] + 1
+        con.executemany(QUERIES["patients.insert"],
+                        ((f"Patient {i}", rnd.randint(18, 90), rnd.choice("MF"), f"98{i:08d}", now_str())
+                         for i in range(patients)))
+        ids = list(range(first, first + patients))
+        rows = report_rows(rnd, ids, reports_per_patient)
+        while True:
+            batch = [r for _, r in zip(range(BATCH_ROWS), rows)]
+            if not batch:
+                break
+            con.executemany(QUERIES["reports.insert"], batch)
+        con.executemany(QUERIES["diseases.insert"], disease_rows(rnd, diseases))
+    return ids
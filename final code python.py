@@ -1,20 +1,33 @@
-import sqlite3
+import os
 import sys
-import csv
-from datetime import datetime
+import time
+
+from healthcare.startup import PROFILE
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 
-try:
-    import matplotlib.pyplot as plt
-    MATPLOTLIB_AVAILABLE = True
-except Exception:
-    MATPLOTLIB_AVAILABLE = False
+from healthcare.db import SEARCH_COUNT_CAP, SLOW_LOG_FILE, KeysetPager, get_db, close_db, init_db, month_str
+from healthcare.analytics import METRICS, TRIAGE_COLUMNS, sort_rows
+from healthcare.anomaly import ALERT_FIELDS, AlertFeed, describe
+from healthcare.backup import BACKUP_DIR, STARTUP_DELAY, BackupThread, list_snapshots, snapshot
+from healthcare.chart import MATPLOTLIB_AVAILABLE, ReportChart
+from healthcare.coldstore import MoveThread
+from healthcare.history import HistoryPager
+from healthcare.hospitals import HOSPITAL_FIELDS
+from healthcare.reminders import REPEATS
+from healthcare.search import TRIGRAM, trigram_query
+from healthcare.service import HealthcareService
+from healthcare.tasks import TaskRunner
+from healthcare.widgets import VirtualTable
+from healthcare.writebehind import WriteBehind
 
 APP_TITLE = "💊 Python Project Healthcare (Full)"
-DB_FILE = "healthcare_full.db"
 DEFAULT_BG = "#e8f5e9"
 DARK_BG = "#2e2e2e"
+TYPEAHEAD_DELAY_MS = 150
+TRIAGE_DISPLAY_LIMIT = 2000
+DIAG_EVENT_LIMIT = 200
+ALERT_POLL_MS = 5000
 LANG_EN = "EN"
 LANG_HI = "HI"
 
@@ -34,147 +47,40 @@ LANG_MAP = {
     "mode": {LANG_EN: "Dark Mode", LANG_HI: "डार्क मोड"},
 }
 
-def get_conn():
-    return sqlite3.connect(DB_FILE)
-
-def now_str():
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-def month_str():
-    return datetime.now().strftime("%Y-%m")
-
-def parse_bp(bp_text):
-    if not bp_text:
-        return None, None
-    try:
-        if "/" in bp_text:
-            a, b = bp_text.split("/", 1)
-            return int(a.strip()), int(b.strip())
-        else:
-            return int(bp_text.strip()), None
-    except:
-        return None, None
-
-def init_db():
-    with get_conn() as con:
-        cur = con.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS users(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE,
-                password TEXT,
-                role TEXT DEFAULT 'patient'
-            );
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS patients(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                age INTEGER,
-                gender TEXT,
-                contact TEXT,
-                created_at TEXT
-            );
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS reports(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                patient_id INTEGER NOT NULL,
-                month TEXT NOT NULL,
-                bp_systolic INTEGER,
-                bp_diastolic INTEGER,
-                sugar REAL,
-                uric_acid REAL,
-                created_at TEXT,
-                FOREIGN KEY(patient_id) REFERENCES patients(id)
-            );
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS diseases(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE,
-                details TEXT,
-                symptoms TEXT,
-                treatable INTEGER,
-                medicines TEXT,
-                hospitals TEXT,
-                notes TEXT
-            );
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS reminders(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                patient_id INTEGER,
-                medicine TEXT,
-                remind_at TEXT,
-                done INTEGER DEFAULT 0,
-                created_at TEXT
-            );
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS hospitals(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT,
-                city TEXT,
-                contact TEXT
-            );
-        """)
-        con.commit()
-    seed_initial_data()
-
-def seed_initial_data():
-    with get_conn() as con:
-        cur = con.cursor()
-        cur.execute("SELECT id FROM users WHERE username = 'admin'")
-        if not cur.fetchone():
-            cur.execute("INSERT INTO users(username, password, role) VALUES (?,?,?)", ("admin", "admin123", "admin"))
-        cur.execute("SELECT COUNT(*) FROM hospitals")
-        if cur.fetchone()[0] == 0:
-            hospitals = [
-                ("AIIMS Delhi", "Delhi", "011-2658xxxx"),
-                ("Apollo Hospitals", "Chennai", "044-2829xxxx"),
-                ("Fortis", "New Delhi", "011-4706xxxx"),
-                ("Max Healthcare", "New Delhi", "011-4150xxxx"),
-            ]
-            cur.executemany("INSERT INTO hospitals(name, city, contact) VALUES(?,?,?)", hospitals)
-        cur.execute("SELECT COUNT(*) FROM diseases")
-        if cur.fetchone()[0] == 0:
-            defaults = [
-                ("fever", "Temporary rise in body temperature", "fever,chills,headache", 1, "Paracetamol, Ibuprofen", "", "Consult if >3 days"),
-                ("diabetes", "Chronic high blood sugar", "thirst,urination,fatigue", 0, "", "AIIMS Delhi, Apollo", "Long-term care"),
-                ("hypertension", "High blood pressure", "headache,breathlessness", 0, "", "Cardiology Centers", "Monitor regularly"),
-                ("common cold", "Viral URTI", "sneezing,cough,sore throat", 1, "Antihistamines, Decongestants", "", "Usually self-limited"),
-                ("malaria", "Mosquito-borne parasitic infection", "fever,chills", 1, "ACT, Chloroquine", "Infectious Disease Hospitals", "Diagnose with test"),
-                ("asthma", "Chronic airway inflammation", "wheezing,shortness of breath", 0, "Inhalers (Salbutamol)", "Pulmonology Centers", "Doctor plan needed"),
-                ("covid-19", "Viral infection SARS-CoV-2", "fever,cough,loss of smell", 0, "Supportive care", "COVID Hospitals", "Test and isolate"),
-                ("dengue", "Mosquito-borne viral infection", "fever,joint pain,rash", 0, "Supportive care (hydration)", "Dengue care units", "Avoid NSAIDs"),
-                ("tuberculosis", "Bacterial lung infection", "cough,weight loss,fever", 0, "DOTS therapy", "TB Centers", "Long supervised treatment"),
-                ("migraine", "Neurological headaches", "throbbing headache,nausea", 1, "Pain relievers, Triptans", "", "Avoid triggers"),
-            ]
-            cur.executemany(
-                "INSERT INTO diseases(name, details, symptoms, treatable, medicines, hospitals, notes) VALUES(?,?,?,?,?,?,?)",
-                defaults
-            )
-        con.commit()
-
-def get_band_simple(val, bands, labels):
-    if val is None:
-        return "N/A"
-    for idx, (low, high) in enumerate(bands):
-        if low <= val <= high:
-            return labels[idx]
-    return labels[-1]
-
 class HealthcareApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, db):
         super().__init__()
+        self.db = db
         self.title(APP_TITLE)
         self.geometry("980x700")
         self.lang = LANG_EN
         self.dark = False
         self.current_user = None
+        self.tasks = TaskRunner(self, on_busy=self.set_busy)
+        self.service = HealthcareService(db)
+        # Inserts and saves are group-committed; handlers get the ack later.
+        self.writes = WriteBehind(db)
+        # Compressed online snapshots every few hours, see healthcare.backup.
+        self.backups = BackupThread(db, delay=STARTUP_DELAY)
+        self.backups.start()
+        # Reports past the live horizon move to columnar segments once a day.
+        self.cold_moves = MoveThread(db, on_done=lambda r: self.tasks.post(self.cold_move_done, r),
+                                     delay=STARTUP_DELAY)
+        self.cold_moves.start()
+        self.symptoms = self.service.symptoms
+        self.disease_search = self.service.disease_search
+        self.patient_search = self.service.patient_search
+        self.reminders = self.service.reminders
+        self.reminder_after = None
+        self.hospital_directory = self.service.hospital_directory
+        self.nearby = None   # (city, pager) with the city's first page loaded
+        # Anomaly alerts from any writer (this app, the server, imports).
+        self.alert_feed = AlertFeed(db)
+        self.alert_after = None
+        self.alerts_win = None
         self.create_widgets()
+        self.wake_reminders()
+        self.poll_alerts()
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def create_widgets(self):
@@ -194,6 +100,13 @@ class HealthcareApp(tk.Tk):
         self.login_btn = ttk.Button(toolbar, text=LANG_MAP["login"][self.lang], width=10,
                                     command=self.open_login)
         self.login_btn.pack(side="right", padx=6)
+        ttk.Button(toolbar, text="Query Stats", width=12, command=self.show_query_stats).pack(side="right", padx=6)
+        self.cancel_btn = ttk.Button(toolbar, text="Cancel", width=8, command=self.tasks.cancel_all, state="disabled")
+        self.cancel_btn.pack(side="right", padx=6)
+        self.busy_bar = ttk.Progressbar(toolbar, mode="indeterminate", length=80)
+        self.busy_bar.pack(side="right", padx=6)
+        self.status_label = ttk.Label(toolbar, text="")
+        self.status_label.pack(side="right", padx=6)
         self.notebook = ttk.Notebook(self)
         self.notebook.pack(fill="both", expand=True, padx=12, pady=12)
         self.tab_patient = ttk.Frame(self.notebook)
@@ -204,13 +117,34 @@ class HealthcareApp(tk.Tk):
         self.notebook.add(self.tab_reports, text="Reports")
         self.tab_tools = ttk.Frame(self.notebook)
         self.notebook.add(self.tab_tools, text="Tools")
-        self.build_patients_tab()
-        self.build_diseases_tab()
-        self.build_reports_tab()
-        self.build_tools_tab()
+        self.tab_diag = ttk.Frame(self.notebook)
+        self.notebook.add(self.tab_diag, text="Diagnostics")
+        # Only the first tab is built now; the rest on first selection.
+        self.tab_builders = {
+            str(self.tab_patient): self.build_patients_tab,
+            str(self.tab_disease): self.build_diseases_tab,
+            str(self.tab_reports): self.build_reports_tab,
+            str(self.tab_tools): self.build_tools_tab,
+            str(self.tab_diag): self.build_diagnostics_tab,
+        }
+        self.build_tab(self.tab_patient)
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
         self.apply_theme()
         self.update_language()
 
+    def build_tab(self, tab):
+        build = self.tab_builders.pop(str(tab), None)
+        if build:
+            build()
+            return True
+    def on_tab_changed(self, event=None):
+        tab = self.notebook.select()
+        if self.build_tab(tab) is None and tab == str(self.tab_diag):
+            self.refresh_diagnostics()
+    def show_tab(self, tab):
+        self.build_tab(tab)
+        self.notebook.select(tab)
+
     # ------- Patients Tab -------
     def build_patients_tab(self):
         frm = self.tab_patient
@@ -225,48 +159,77 @@ class HealthcareApp(tk.Tk):
         ttk.Label(left, text="Contact:").grid(row=3, column=0, sticky="w", pady=4)
         self.p_contact = ttk.Entry(left, width=25); self.p_contact.grid(row=3, column=1, pady=4)
         ttk.Button(left, text="Add Patient", command=self.add_patient).grid(row=4, column=0, columnspan=2, pady=8)
-        ttk.Button(left, text="Delete Patient", command=self.delete_patient).grid(row=5, column=0, columnspan=2, pady=4)
+        ttk.Button(left, text="Delete Selected", command=self.delete_patient).grid(row=5, column=0, columnspan=2, pady=4)
+        ttk.Button(left, text="Archive Selected", command=self.archive_patients).grid(row=6, column=0, columnspan=2, pady=4)
+        ttk.Button(left, text="Purge Inactive...", command=self.purge_inactive_dialog).grid(row=7, column=0, columnspan=2, pady=4)
+        ttk.Label(left, text="Ctrl/Shift-click to select several").grid(row=8, column=0, columnspan=2, pady=4)
         right = ttk.Frame(frm)
         right.pack(side="left", fill="both", expand=True, padx=8, pady=8)
+        search = ttk.Frame(right)
+        search.pack(fill="x", pady=(0, 6))
+        ttk.Label(search, text="Search name / contact:").pack(side="left")
+        self.p_search = ttk.Entry(search, width=36); self.p_search.pack(side="left", padx=4)
+        self.p_search.bind("<KeyRelease>", self.on_patient_search)
+        self.p_search.bind("<Escape>", lambda e: self.clear_patient_search())
+        ttk.Button(search, text="Clear", command=self.clear_patient_search).pack(side="left", padx=4)
+        self.p_search_hint = ttk.Label(search, text="")
+        self.p_search_hint.pack(side="left", padx=6)
+        self._p_search_after = None
+        self.p_search_text = ""   # the text the table is filtered by; "" for every patient
         cols = ("id", "name", "age", "gender", "contact")
-        self.p_table = ttk.Treeview(right, columns=cols, show="headings", height=15)
-        for c in cols:
-            self.p_table.heading(c, text=c.upper())
-            self.p_table.column(c, width=100)
-        self.p_table.pack(fill="both", expand=True)
+        self.p_view = VirtualTable(right, cols, height=15, width=100, count_text="{:,} patients", runner=self.tasks)
+        self.p_view.pack(fill="both", expand=True)
+        self.p_table = self.p_view.tree
         self.p_table.bind("<Double-1>", lambda e: self.open_patient_reports())
         ttk.Button(right, text="Refresh List", command=self.refresh_patients).pack(pady=6)
         self.refresh_patients()
+    def write(self, fn, *args, on_done=None):
+        # Queue a write; on_done(result) runs once it has committed.
+        self.tasks.watch(self.writes.submit(fn, *args), on_done=on_done, on_error=self.write_failed)
+    def write_failed(self, exc):
+        messagebox.showerror("Error", str(exc))
     def add_patient(self):
         name = self.p_name.get().strip()
-        age = None
-        try:
-            age = int(self.p_age.get().strip())
-        except:
-            age = None
-        gender = self.p_gender.get().strip()
-        contact = self.p_contact.get().strip()
-        if not name:
-            messagebox.showerror("Error", "Name required")
-            return
-        with get_conn() as con:
-            con.execute(
-                "INSERT INTO patients(name, age, gender, contact, created_at) VALUES (?,?,?,?,?)",
-                (name, age, gender, contact, now_str())
-            )
-            con.commit()
-        messagebox.showinfo("Saved", f"Patient {name} added")
-        self.p_name.delete(0, "end"); self.p_age.delete(0, "end")
-        self.p_gender.delete(0, "end"); self.p_contact.delete(0, "end")
-        self.refresh_patients()
-    def refresh_patients(self):
-        for r in self.p_table.get_children():
-            self.p_table.delete(r)
-        with get_conn() as con:
-            cur = con.cursor()
-            cur.execute("SELECT id,name,age,gender,contact FROM patients ORDER BY id DESC")
-            for row in cur.fetchall():
-                self.p_table.insert("", "end", values=row)
+        def saved(pid):
+            messagebox.showinfo("Saved", f"Patient {name} added")
+            self.p_name.delete(0, "end"); self.p_age.delete(0, "end")
+            self.p_gender.delete(0, "end"); self.p_contact.delete(0, "end")
+            self.refresh_patients()
+        self.write(self.service.add_patient, name, self.p_age.get().strip(), self.p_gender.get(),
+                   self.p_contact.get(), on_done=saved)
+    def refresh_patients(self, reload=False):
+        if self.p_view.pager is not None and not reload:
+            # Only what changed since the last load reaches the Treeview.
+            self.tasks.submit(self.p_view.pager.changes, on_done=self.p_view.apply_changes, key="refresh_patients")
+            return
+        if self.p_search_text:
+            pager = self.patient_search.pager(self.p_search_text)
+            def count_text(n):
+                # Matches are only counted up to the cap.
+                return f"{n:,}{'+' if n >= SEARCH_COUNT_CAP else ''} matching patients"
+        else:
+            pager = KeysetPager(self.db, "patients.count", "patients.page", "patients.seek",
+                                version_query="patients.version", since_query="patients.since")
+            count_text = "{:,} patients"
+        # The table reads the count and the visible pages on a worker.
+        self.p_view.count_text = count_text
+        self.p_view.set_source(pager, 0 if reload else self.p_view.offset)
+    def on_patient_search(self, event=None):
+        if self._p_search_after is not None:
+            self.after_cancel(self._p_search_after)
+        self._p_search_after = self.after(TYPEAHEAD_DELAY_MS, self.run_patient_search)
+    def run_patient_search(self):
+        # Matches are read a page at a time as the table scrolls.
+        self._p_search_after = None
+        text = self.p_search.get().strip()
+        searched = text if trigram_query(text) else ""
+        self.p_search_hint.config(text=f"Type {TRIGRAM} or more characters" if text and not searched else "")
+        if searched != self.p_search_text:
+            self.p_search_text = searched
+            self.refresh_patients(reload=True)
+    def clear_patient_search(self):
+        self.p_search.delete(0, "end")
+        self.on_patient_search()
     def selected_patient(self):
         sel = self.p_table.selection()
         if not sel:
@@ -275,22 +238,73 @@ class HealthcareApp(tk.Tk):
         vals = self.p_table.item(sel[0], "values")
         return int(vals[0])
     def delete_patient(self):
-        pid = self.selected_patient()
-        if not pid:
+        self.purge_selected(archive=False)
+    def archive_patients(self):
+        self.purge_selected(archive=True)
+    def purge_selected(self, archive):
+        # Every selected row, including ones scrolled out of view.
+        ids = self.p_view.selected_ids()
+        if not ids:
+            messagebox.showwarning("Select", "Please select one or more patient rows first.")
             return
-        confirm = messagebox.askyesno("Confirm", "Are you sure you want to delete this patient and all their reports?")
-        if not confirm:
+        what = "this patient" if len(ids) == 1 else f"these {len(ids):,} patients"
+        verb = "archive" if archive else "delete"
+        if not messagebox.askyesno("Confirm", f"Are you sure you want to {verb} {what} and all their reports and reminders?"):
             return
-        with get_conn() as con:
-            con.execute("DELETE FROM reports WHERE patient_id=?", (pid,))
-            con.execute("DELETE FROM patients WHERE id=?", (pid,))
-            con.commit()
-        messagebox.showinfo("Deleted", "Patient and their reports deleted.")
-        self.refresh_patients()
+        self.run_purge(ids, archive)
+    def run_purge(self, ids, archive):
+        # Chunked on a worker; other windows keep reading and writing meanwhile.
+        verb = "Archived" if archive else "Deleted"
+        def progress(done, total):
+            self.tasks.post(self.set_status, f"{verb} {done:,} of {total:,} patients...")
+        def done(result):
+            if result.patients == len(ids):
+                self.p_view.delete_rows(ids)
+            else:
+                self.p_view.selected.clear()
+                self.refresh_patients()
+            self.refresh_reports_table()
+            messagebox.showinfo(verb, result.summary())
+        self.tasks.submit(self.service.purge_patients, ids, archive, progress=progress, with_cancel=True,
+                          key="purge_patients", on_done=done,
+                          on_error=lambda e: messagebox.showerror(verb, f"Failed: {e}"))
+    def purge_inactive_dialog(self):
+        dialog = tk.Toplevel(self)
+        dialog.title("Purge Inactive Patients")
+        dialog.geometry("360x240")
+        ttk.Label(dialog, text="No report since (YYYY-MM):").pack(pady=5)
+        month_entry = ttk.Entry(dialog, width=12)
+        month_entry.pack()
+        year, month = month_str().split("-")
+        month_entry.insert(0, f"{int(year) - 2}-{month}")
+        archive_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(dialog, text="Archive before deleting", variable=archive_var).pack(pady=5)
+        found = ttk.Label(dialog, text="")
+        found.pack(pady=5)
+        state = {"ids": []}
+        def show(ids):
+            state["ids"] = ids
+            found.config(text=f"{len(ids):,} inactive patients")
+            purge_btn.config(state="normal" if ids else "disabled")
+        def find():
+            purge_btn.config(state="disabled")
+            self.tasks.submit(self.service.inactive_patients, month_entry.get().strip(), on_done=show,
+                              key="inactive_patients")
+        def purge():
+            ids, archive = state["ids"], archive_var.get()
+            verb = "archive" if archive else "delete"
+            if not messagebox.askyesno("Confirm", f"Are you sure you want to {verb} {len(ids):,} patients "
+                                                  "and all their reports and reminders?", parent=dialog):
+                return
+            dialog.destroy()
+            self.run_purge(ids, archive)
+        ttk.Button(dialog, text="Find", command=find).pack(pady=5)
+        purge_btn = ttk.Button(dialog, text="Purge", command=purge, state="disabled")
+        purge_btn.pack(pady=5)
     def open_patient_reports(self):
         pid = self.selected_patient()
         if not pid: return
-        self.notebook.select(self.tab_reports)
+        self.show_tab(self.tab_reports)
         self.r_pid_var.set(pid)
         self.refresh_reports_table()
 
@@ -306,32 +320,42 @@ class HealthcareApp(tk.Tk):
         ttk.Button(top, text="Load Reports", command=self.refresh_reports_table).pack(side="left", padx=6)
         main = ttk.Frame(frm)
         main.pack(fill="both", expand=True, padx=10, pady=10)
+        # Embedded chart under the table, created on first use.
+        self.chart = None
+        self.chart_visible = False
+        self.chart_frame = ttk.Frame(frm)
         report_cols = ("id", "month", "bp_systolic", "bp_diastolic", "sugar", "uric_acid", "created_at")
-        self.r_table = ttk.Treeview(main, columns=report_cols, show="headings", height=12)
-        for c in report_cols:
-            self.r_table.heading(c, text=c.upper())
-            self.r_table.column(c, width=90)
-        self.r_table.pack(side="left", fill="both", expand=True)
+        self.r_view = VirtualTable(main, report_cols, height=12, width=90, count_text="{:,} reports", runner=self.tasks)
+        self.r_view.pack(side="left", fill="both", expand=True)
+        self.r_table = self.r_view.tree
         btn_frame = ttk.Frame(main)
         btn_frame.pack(side="left", fill="y", padx=10)
         ttk.Button(btn_frame, text="Add Report", command=self.add_report_dialog).pack(fill="x", pady=4)
         ttk.Button(btn_frame, text="Delete Report", command=self.delete_report).pack(fill="x", pady=4)
         ttk.Button(btn_frame, text="Compare Reports", command=self.compare_reports).pack(fill="x", pady=4)
         ttk.Button(btn_frame, text="Export CSV", command=self.export_reports_csv).pack(fill="x", pady=4)
+        ttk.Button(btn_frame, text="Export All...", command=self.export_all_reports_csv).pack(fill="x", pady=4)
+        ttk.Button(btn_frame, text="Import CSV...", command=self.import_reports_csv).pack(fill="x", pady=4)
         if MATPLOTLIB_AVAILABLE:
             ttk.Button(btn_frame, text="Show BP Chart", command=self.bp_chart_plot).pack(fill="x", pady=4)
+        ttk.Button(btn_frame, text="Clinic Triage", command=self.open_triage).pack(fill="x", pady=4)
+        ttk.Button(btn_frame, text="Health Alerts", command=self.open_alerts).pack(fill="x", pady=4)
         ttk.Button(btn_frame, text="Refresh", command=self.refresh_reports_table).pack(fill="x", pady=4)
     def refresh_reports_table(self):
+        if str(self.tab_reports) in self.tab_builders:
+            return   # not built yet; it loads fresh when first opened
         pid = self.r_pid_var.get()
-        for r in self.r_table.get_children():
-            self.r_table.delete(r)
         if not pid:
+            self.r_view.clear()
             return
-        with get_conn() as con:
-            cur = con.cursor()
-            cur.execute("SELECT id, month, bp_systolic, bp_diastolic, sugar, uric_acid, created_at FROM reports WHERE patient_id=? ORDER BY id DESC", (pid,))
-            for row in cur.fetchall():
-                self.r_table.insert("", "end", values=row)
+        current = self.r_view.pager
+        if current is not None and current.params == (pid,):
+            # Same patient: the cached history is kept unless it changed.
+            self.tasks.submit(current.changes, on_done=self.r_view.apply_changes, key="refresh_reports")
+        else:
+            # The table, Compare and the chart share one cached history.
+            self.r_view.set_source(HistoryPager(self.service.history, pid))
+        self.refresh_chart()
     def selected_report(self):
         sel = self.r_table.selection()
         if not sel:
@@ -346,11 +370,12 @@ class HealthcareApp(tk.Tk):
         confirm = messagebox.askyesno("Confirm", "Are you sure you want to delete this report?")
         if not confirm:
             return
-        with get_conn() as con:
-            con.execute("DELETE FROM reports WHERE id=?", (rid,))
-            con.commit()
-        messagebox.showinfo("Deleted", "Report deleted.")
-        self.refresh_reports_table()
+        def deleted(found):
+            if self.chart_visible:
+                self.chart.remove_report(rid)
+            self.r_view.delete_row(rid)
+            messagebox.showinfo("Deleted", "Report deleted." if found else "Report was already deleted.")
+        self.write(self.service.delete_report, rid, on_done=deleted)
     def add_report_dialog(self):
         pid = self.r_pid_var.get()
         if not pid:
@@ -372,30 +397,15 @@ class HealthcareApp(tk.Tk):
         ttk.Label(dialog, text="Uric Acid:").pack(pady=5)
         uric_entry = ttk.Entry(dialog, width=12)
         uric_entry.pack()
-        def submit():
-            month = month_entry.get().strip()
-            bp    = bp_entry.get().strip()
-            sugar = sugar_entry.get().strip()
-            uric  = uric_entry.get().strip()
-            try:
-                bp_sys, bp_dia = parse_bp(bp)
-                sugar_val = float(sugar) if sugar else None
-                uric_val = float(uric) if uric else None
-            except:
-                messagebox.showerror("Error", "Enter BP, Sugar, Uric Acid as numbers!")
-                return
-            if not month or bp_sys is None:
-                messagebox.showerror("Error", "Month and BP required.")
-                return
-            with get_conn() as con:
-                con.execute(
-                    "INSERT INTO reports(patient_id, month, bp_systolic, bp_diastolic, sugar, uric_acid, created_at) VALUES (?,?,?,?,?,?,?)",
-                    (pid, month, bp_sys, bp_dia, sugar_val, uric_val, now_str())
-                )
-                con.commit()
+        def saved(row):
+            if self.chart_visible and self.chart.patient_id == pid:
+                self.chart.add_report(row)
             messagebox.showinfo("Saved", "Report added.")
             dialog.destroy()
             self.refresh_reports_table()
+        def submit():
+            self.write(self.service.add_report, pid, month_entry.get(), bp_entry.get().strip(),
+                       sugar_entry.get(), uric_entry.get(), on_done=saved)
         ttk.Button(dialog, text="Submit", command=submit).pack(pady=12)
         ttk.Button(dialog, text="Cancel", command=dialog.destroy).pack(pady=2)
     def compare_reports(self):
@@ -403,49 +413,20 @@ class HealthcareApp(tk.Tk):
         if not pid:
             messagebox.showwarning("Compare", "No patient selected.")
             return
-        with get_conn() as con:
-            cur = con.cursor()
-            cur.execute("SELECT month, bp_systolic, bp_diastolic, sugar, uric_acid FROM reports WHERE patient_id=? ORDER BY month DESC", (pid,))
-            rows = cur.fetchall()
-        if len(rows) < 2:
+        self.tasks.submit(self.service.compare_reports, pid, on_done=self.show_comparison, key="compare_reports")
+    def show_comparison(self, result):
+        if result is None:
             messagebox.showinfo("Compare", "Need at least 2 reports for comparison.")
             return
-        latest = rows[0]
-        prev = rows[1]
-        # Band definitions
-        bp_s_bands = [(-1000,89),(90,120),(121,139),(140,180),(181,1000)]
-        bp_s_labels = ["Low","Good","Borderline","High","Extreme"]
-        bp_d_bands = [(-1000,59),(60,80),(81,90),(91,120),(121,1000)]
-        bp_d_labels = ["Low","Good","Borderline","High","Extreme"]
-        sugar_bands = [(-1000,69),(70,100),(101,125),(126,200),(201,10000)]
-        sugar_labels = ["Low","Good","Borderline","High","Extreme"]
-        uric_bands = [(-1000,2),(3,7),(8,8),(9,12),(13,1000)]
-        uric_labels = ["Low","Good","Borderline","High","Extreme"]
-        final_report = f"Latest ({latest[0]}) vs Previous ({prev[0]})\n\n"
-        metrics = [
-            ("BP Systolic", prev[1], latest[1], bp_s_bands, bp_s_labels),
-            ("BP Diastolic", prev[2], latest[2], bp_d_bands, bp_d_labels),
-            ("Sugar", prev[3], latest[3], sugar_bands, sugar_labels),
-            ("Uric Acid", prev[4], latest[4], uric_bands, uric_labels),
-        ]
-        for name, prev_v, latest_v, bands, labels in metrics:
-            prev_band = get_band_simple(prev_v, bands, labels)
-            latest_band = get_band_simple(latest_v, bands, labels)
-            if prev_band == "N/A" or latest_band == "N/A":
-                verdict = "N/A"
-            elif latest_band == prev_band:
-                verdict = "No Change"
-            elif latest_band == "Good":
-                verdict = "Improved"
-            elif prev_band == "Good" and latest_band != "Good":
-                verdict = "Degraded"
-            elif labels.index(latest_band) > labels.index(prev_band):
-                verdict = "Degraded"
-            elif labels.index(latest_band) < labels.index(prev_band):
-                verdict = "Improved"
-            else:
-                verdict = "No Change"
-            final_report += f"{name:12}: {latest_v} ({latest_band}) vs {prev_v} ({prev_band})  → {verdict}\n"
+        final_report = f"Latest ({result['latest_month']}) vs Previous ({result['previous_month']})\n\n"
+        for m in result["metrics"]:
+            final_report += (f"{m['name']:12}: {m['latest']} ({m['latest_band']}) vs {m['previous']} "
+                             f"({m['previous_band']})  → {m['verdict']}\n")
+        final_report += f"\nHistory ({result['report_count']} reports):\n"
+        for m in result["metrics"]:
+            if m["n"]:
+                final_report += (f"{m['name']:12}: min {m['min']:g}, max {m['max']:g}, "
+                                 f"avg {m['mean']:.1f} ± {m['stddev']:.1f}\n")
         final_report += (
             "\nBP Systolic: 90-120 Good, 121-139 Borderline, 140-180 High\n"
             "BP Diastolic: 60-80 Good, 81-90 Borderline, 91-120 High\n"
@@ -453,6 +434,104 @@ class HealthcareApp(tk.Tk):
             "Uric Acid: 3-7 Good, 8 Borderline, 9-12 High"
         )
         messagebox.showinfo("Report Feedback & Comparison", final_report)
+    def open_triage(self):
+        win = tk.Toplevel(self)
+        win.title("Clinic Triage - patients whose bands got worse")
+        win.geometry("900x420")
+        top = ttk.Frame(win)
+        top.pack(fill="x", padx=8, pady=6)
+        ttk.Label(top, text="Latest report month (blank = any):").pack(side="left")
+        month_entry = ttk.Entry(top, width=10)
+        month_entry.pack(side="left", padx=4)
+        month_entry.insert(0, month_str())
+        count_label = ttk.Label(top, text="")
+        count_label.pack(side="right")
+        cols = ["patient_id", "name", "latest_month", "degraded", "severity"] + [f"{m}_verdict" for m, _ in METRICS]
+        table = ttk.Treeview(win, columns=cols, show="headings")
+        state = {"rows": [], "sort": "severity", "desc": True}
+        def show():
+            table.delete(*table.get_children())
+            rows = sort_rows(state["rows"], TRIAGE_COLUMNS.index(state["sort"]), state["desc"])
+            for r in rows[:TRIAGE_DISPLAY_LIMIT]:
+                table.insert("", "end", values=[r[TRIAGE_COLUMNS.index(c)] for c in cols])
+            count_label.config(text=f"{len(rows):,} patients")
+        def sort_by(col):
+            state["desc"] = not state["desc"] if state["sort"] == col else True
+            state["sort"] = col
+            show()
+        for c in cols:
+            table.heading(c, text=c.replace("_verdict", "").upper(), command=lambda c=c: sort_by(c))
+            table.column(c, width=90)
+        table.pack(fill="both", expand=True, padx=8, pady=6)
+        table.bind("<Double-1>", lambda e: self.open_triage_patient(table))
+        def load():
+            def done(rows):
+                state["rows"] = rows
+                if win.winfo_exists():
+                    show()
+            self.tasks.submit(self.service.triage, month_entry.get().strip() or None,
+                              on_done=done, key="triage")
+        ttk.Button(top, text="Run Triage", command=load).pack(side="left", padx=6)
+        load()
+    def open_triage_patient(self, table):
+        sel = table.selection()
+        if not sel:
+            return
+        self.show_tab(self.tab_reports)   # builds the tab (and r_pid_var) if needed
+        self.r_pid_var.set(int(table.item(sel[0], "values")[0]))
+        self.refresh_reports_table()
+    def poll_alerts(self):
+        self.alert_after = None
+        self.tasks.submit(self.alert_feed.poll, on_done=self.show_new_alerts, on_error=self.alerts_failed)
+    def alerts_failed(self, exc):
+        self.set_status(f"Alerts: {exc}")
+        self.alert_after = self.after(ALERT_POLL_MS, self.poll_alerts)
+    def show_new_alerts(self, rows):
+        self.alert_after = self.after(ALERT_POLL_MS, self.poll_alerts)
+        if not rows:
+            return
+        self.bell()
+        self.set_status(f"{len(rows)} new health alert{'s' if len(rows) != 1 else ''}")
+        self.open_alerts()
+    def open_alerts(self):
+        if self.alerts_win is not None and self.alerts_win.winfo_exists():
+            self.alerts_win.lift()
+            self.load_alerts()
+            return
+        win = self.alerts_win = tk.Toplevel(self)
+        win.title("Health Alerts")
+        win.geometry("780x360")
+        top = ttk.Frame(win)
+        top.pack(fill="x", padx=8, pady=6)
+        self.alerts_count = ttk.Label(top, text="")
+        self.alerts_count.pack(side="right")
+        cols = ("patient_id", "name", "month", "alert")
+        table = self.alerts_table = ttk.Treeview(win, columns=cols, show="headings")
+        for c, w in zip(cols, (80, 150, 80, 440)):
+            table.heading(c, text=c.upper())
+            table.column(c, width=w, anchor="w")
+        table.pack(fill="both", expand=True, padx=8, pady=6)
+        table.bind("<Double-1>", lambda e: self.open_triage_patient(table))
+        ttk.Button(top, text="Acknowledge Selected",
+                   command=lambda: self.acknowledge_alerts(table.selection())).pack(side="left")
+        ttk.Button(top, text="Acknowledge All",
+                   command=lambda: self.acknowledge_alerts(table.get_children())).pack(side="left", padx=6)
+        ttk.Button(top, text="Open Patient", command=lambda: self.open_triage_patient(table)).pack(side="left")
+        self.load_alerts()
+    def load_alerts(self):
+        def show(rows):
+            if not self.alerts_win.winfo_exists():
+                return
+            self.alerts_table.delete(*self.alerts_table.get_children())
+            for row in rows:
+                a = dict(zip(ALERT_FIELDS, row))
+                self.alerts_table.insert("", "end", iid=str(a["id"]),
+                                         values=(a["patient_id"], a["name"], a["month"], describe(row)))
+            self.alerts_count.config(text=f"{len(rows):,} open")
+        self.tasks.submit(self.service.open_alerts, on_done=show, key="alerts")
+    def acknowledge_alerts(self, iids):
+        if iids:
+            self.write(self.service.acknowledge_alerts, [int(i) for i in iids], on_done=lambda n: self.load_alerts())
     def export_reports_csv(self):
         pid = self.r_pid_var.get()
         if not pid:
@@ -465,42 +544,74 @@ class HealthcareApp(tk.Tk):
         )
         if not filename:
             return
-        with get_conn() as con:
-            cur = con.cursor()
-            cur.execute("SELECT * FROM reports WHERE patient_id=? ORDER BY month DESC", (pid,))
-            rows = cur.fetchall()
-            columns = [desc[0] for desc in cur.description]
-            with open(filename, "w", newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(columns)
-                for row in rows:
-                    writer.writerow(row)
-        messagebox.showinfo("CSV Export", f"Exported {len(rows)} reports to {filename}")
+        self.run_export(filename, [pid])
+    def export_all_reports_csv(self):
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("Compressed CSV", "*.csv.gz")],
+            title="Export All Reports"
+        )
+        if not filename:
+            return
+        self.run_export(filename, None)
+    def run_export(self, filename, patient_ids):
+        def progress(n):
+            self.tasks.post(self.set_status, f"Exported {n:,} reports...")
+        def done(n):
+            messagebox.showinfo("CSV Export", f"Exported {n} reports to {filename}")
+        self.tasks.submit(self.service.export_reports, filename, patient_ids, progress=progress,
+                          with_cancel=True, on_done=done, on_error=lambda e: self.export_failed(filename, e))
+    def export_failed(self, filename, exc):
+        messagebox.showerror("CSV Export", f"Export to {filename} failed: {exc}")
+    def import_reports_csv(self):
+        filename = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")], title="Import Reports")
+        if not filename:
+            return
+        replace = messagebox.askyesnocancel(
+            "Import", "Update existing reports for the same patient and month?\n\n"
+                      "Yes = update them, No = keep them and skip those rows")
+        if replace is None:
+            return
+        mode = "upsert" if replace else "skip"
+        rejects = os.path.splitext(filename)[0] + ".rejects.csv"
+        def progress(result):
+            self.tasks.post(self.set_status, f"Imported {result.read:,} rows...")
+        def done(result):
+            text = result.summary()
+            if result.rejected:
+                text += f"\n\nRejected rows written to {rejects}"
+            messagebox.showinfo("Import", text)
+            self.refresh_reports_table()
+            self.refresh_chart(force=True)
+        self.tasks.submit(self.service.import_reports, filename, mode, rejects, progress=progress,
+                          with_cancel=True, on_done=done,
+                          on_error=lambda e: messagebox.showerror("Import", f"Import failed: {e}"))
     def bp_chart_plot(self):
         pid = self.r_pid_var.get()
         if not pid or not MATPLOTLIB_AVAILABLE:
             messagebox.showwarning("Chart", "Matplotlib not available or no patient selected.")
             return
-        with get_conn() as con:
-            cur = con.cursor()
-            cur.execute("SELECT month, bp_systolic, bp_diastolic FROM reports WHERE patient_id=? ORDER BY month ASC", (pid,))
-            data = cur.fetchall()
-        if not data:
-            messagebox.showwarning("Chart", "No data for chart.")
-            return
-        months = [r[0] for r in data]
-        systolic = [r[1] for r in data]
-        diastolic = [r[2] for r in data]
-        plt.figure(figsize=(8,5))
-        plt.plot(months, systolic, label="Systolic")
-        plt.plot(months, diastolic, label="Diastolic")
-        plt.xlabel("Month")
-        plt.ylabel("Value")
-        plt.title("Blood Pressure Trend")
-        plt.legend()
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.show()
+        if self.chart_visible and self.chart.patient_id == pid:
+            # Second click on the same patient hides the panel.
+            self.chart_frame.pack_forget()
+            self.chart_visible = False
+            return
+        if self.chart is None:
+            self.chart = ReportChart(self.chart_frame)
+            self.chart.widget.pack(fill="both", expand=True)
+        if not self.chart_visible:
+            self.chart_frame.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+            self.chart_visible = True
+        self.refresh_chart(force=True)
+    def refresh_chart(self, force=False):
+        pid = self.r_pid_var.get()
+        if not self.chart_visible or not pid or (pid == self.chart.patient_id and not force):
+            return
+        self.tasks.submit(self.service.chart_rows, pid, on_done=lambda rows: self.show_bp_chart(pid, rows), key="bp_chart")
+    def show_bp_chart(self, pid, rows):
+        self.chart.set_rows(pid, rows)
+        if not rows:
+            self.set_status("No reports to chart for this patient.")
 
     # ---- Diseases Tab ----
     def build_diseases_tab(self):
@@ -510,63 +621,92 @@ class HealthcareApp(tk.Tk):
         ttk.Label(top, text="Disease Name:").grid(row=0, column=0, sticky="w")
         self.d_name = ttk.Entry(top, width=30); self.d_name.grid(row=0, column=1, padx=4)
         ttk.Button(top, text="Search", command=self.search_disease).grid(row=0, column=2, padx=4)
-        ttk.Label(top, text="Add / Update Disease").grid(row=1, column=0, columnspan=3, pady=8)
-        ttk.Label(top, text="Name:").grid(row=2, column=0, sticky="w")
-        self.d_add_name = ttk.Entry(top, width=30); self.d_add_name.grid(row=2, column=1)
-        ttk.Label(top, text="Details:").grid(row=3, column=0, sticky="w")
-        self.d_add_details = ttk.Entry(top, width=60); self.d_add_details.grid(row=3, column=1, columnspan=2, pady=4)
-        ttk.Label(top, text="Symptoms (csv):").grid(row=4, column=0, sticky="w")
-        self.d_add_symp = ttk.Entry(top, width=60); self.d_add_symp.grid(row=4, column=1, columnspan=2, pady=4)
-        ttk.Label(top, text="Medicines:").grid(row=5, column=0, sticky="w")
-        self.d_add_med = ttk.Entry(top, width=60); self.d_add_med.grid(row=5, column=1, columnspan=2, pady=4)
-        ttk.Label(top, text="Hospitals:").grid(row=6, column=0, sticky="w")
-        self.d_add_hosp = ttk.Entry(top, width=60); self.d_add_hosp.grid(row=6, column=1, columnspan=2, pady=4)
+        self.d_name.bind("<KeyRelease>", self.on_disease_typing)
+        self.d_name.bind("<Return>", lambda e: self.search_disease())
+        self.d_suggest = tk.Listbox(top, height=5, width=60)
+        self.d_suggest.grid(row=1, column=1, columnspan=2, sticky="w", padx=4)
+        self.d_suggest.bind("<<ListboxSelect>>", self.on_disease_suggestion)
+        self._suggest_names = []
+        self._typeahead_after = None
+        ttk.Label(top, text="Add / Update Disease").grid(row=2, column=0, columnspan=3, pady=8)
+        ttk.Label(top, text="Name:").grid(row=3, column=0, sticky="w")
+        self.d_add_name = ttk.Entry(top, width=30); self.d_add_name.grid(row=3, column=1)
+        ttk.Label(top, text="Details:").grid(row=4, column=0, sticky="w")
+        self.d_add_details = ttk.Entry(top, width=60); self.d_add_details.grid(row=4, column=1, columnspan=2, pady=4)
+        ttk.Label(top, text="Symptoms (csv):").grid(row=5, column=0, sticky="w")
+        self.d_add_symp = ttk.Entry(top, width=60); self.d_add_symp.grid(row=5, column=1, columnspan=2, pady=4)
+        ttk.Label(top, text="Medicines:").grid(row=6, column=0, sticky="w")
+        self.d_add_med = ttk.Entry(top, width=60); self.d_add_med.grid(row=6, column=1, columnspan=2, pady=4)
+        ttk.Label(top, text="Hospitals:").grid(row=7, column=0, sticky="w")
+        self.d_add_hosp = ttk.Entry(top, width=60); self.d_add_hosp.grid(row=7, column=1, columnspan=2, pady=4)
         self.treat_var = tk.IntVar()
-        ttk.Checkbutton(top, text="Treatable (OTC)", variable=self.treat_var).grid(row=7, column=1, sticky="w", pady=6)
-        ttk.Button(top, text="Save Disease", command=self.save_disease).grid(row=7, column=2, sticky="e", padx=4)
+        ttk.Checkbutton(top, text="Treatable (OTC)", variable=self.treat_var).grid(row=8, column=1, sticky="w", pady=6)
+        ttk.Button(top, text="Save Disease", command=self.save_disease).grid(row=8, column=2, sticky="e", padx=4)
     def search_disease(self):
-        name = self.d_name.get().strip().lower()
-        if not name:
+        query = self.d_name.get().strip().lower()
+        if not query:
             messagebox.showwarning("Input", "Enter disease name")
             return
-        with get_conn() as con:
-            cur = con.cursor()
-            cur.execute("SELECT details, symptoms, treatable, medicines, hospitals, notes FROM diseases WHERE lower(name)=?", (name,))
-            r = cur.fetchone()
-        if not r:
+        def load():
+            # No exact name: falls back to ranked full-text / typo-tolerant search.
+            found = self.service.disease_info(query)
+            if found is None or found[0]["treatable"]:
+                return found, []
+            return found, self.hospital_directory.lookup(disease=found[0]["name"], limit=6)
+        self.tasks.submit(load, on_done=lambda result: self.show_disease_info(query, *result), key="disease_info")
+    def show_disease_info(self, query, found, linked):
+        if found is None:
             messagebox.showinfo("Not Found", "Disease not found in DB")
             return
-        details, symptoms, treatable, medicines, hospitals, notes = r
-        text = f"{name.title()}\n\nDetails: {details}\nSymptoms: {symptoms}\n"
+        info, searched, corrected = found
+        header = ""
+        if searched:
+            header = f"Best match for '{query}'" + (f" (did you mean '{corrected}'?)" if corrected else "") + "\n\n"
+        name, details, symptoms, treatable = info["name"], info["details"], info["symptoms"], info["treatable"]
+        medicines, hospitals, notes = info["medicines"], info["hospitals"], info["notes"]
+        text = header + f"{name.title()}\n\nDetails: {details}\nSymptoms: {symptoms}\n"
         if treatable:
             text += f"Treatable: Yes\nMedicines: {medicines or '-'}\n"
         else:
             text += "Treatable: No (doctor required)\n"
+            # Linked directory entries when the names matched any, else the text as entered.
+            if linked:
+                hospitals = ", ".join(f"{h[1]} ({h[2]})" if h[2] else h[1] for h in linked[:5])
+                hospitals += ", ..." if len(linked) > 5 else ""
             text += f"Hospitals: {hospitals or '-'}\n"
         if notes:
             text += f"Notes: {notes}\n"
         messagebox.showinfo("Disease Info", text)
+    def on_disease_typing(self, event=None):
+        if self._typeahead_after is not None:
+            self.after_cancel(self._typeahead_after)
+        self._typeahead_after = self.after(TYPEAHEAD_DELAY_MS, self.run_disease_typeahead)
+    def run_disease_typeahead(self):
+        self._typeahead_after = None
+        text = self.d_name.get().strip()
+        if not text:
+            self.show_disease_suggestions(([], None))
+            return
+        self.tasks.submit(self.disease_search.search, text,
+                          on_done=self.show_disease_suggestions, key="disease_typeahead")
+    def show_disease_suggestions(self, result):
+        rows, corrected = result
+        self._suggest_names = [name for name, details in rows]
+        self.d_suggest.delete(0, "end")
+        for name, details in rows:
+            self.d_suggest.insert("end", f"{name.title()} - {details}")
+    def on_disease_suggestion(self, event=None):
+        sel = self.d_suggest.curselection()
+        if not sel:
+            return
+        self.d_name.delete(0, "end")
+        self.d_name.insert(0, self._suggest_names[sel[0]])
+        self.search_disease()
     def save_disease(self):
         name = self.d_add_name.get().strip().lower()
-        if not name:
-            messagebox.showerror("Error", "Name required")
-            return
-        details = self.d_add_details.get().strip()
-        symptoms = self.d_add_symp.get().strip()
-        meds = self.d_add_med.get().strip()
-        hosp = self.d_add_hosp.get().strip()
-        treat = 1 if self.treat_var.get() else 0
-        with get_conn() as con:
-            cur = con.cursor()
-            cur.execute("SELECT id FROM diseases WHERE lower(name)=?", (name,))
-            if cur.fetchone():
-                cur.execute("UPDATE diseases SET details=?, symptoms=?, treatable=?, medicines=?, hospitals=? WHERE lower(name)=?",
-                            (details, symptoms, treat, meds, hosp, name))
-            else:
-                cur.execute("INSERT INTO diseases(name, details, symptoms, treatable, medicines, hospitals, notes) VALUES(?,?,?,?,?,?,?)",
-                            (name, details, symptoms, treat, meds, hosp, ""))
-            con.commit()
-        messagebox.showinfo("Saved", f"Disease '{name}' saved/updated")
+        self.write(self.service.save_disease, name, self.d_add_details.get().strip(), self.d_add_symp.get().strip(),
+                   self.treat_var.get(), self.d_add_med.get().strip(), self.d_add_hosp.get().strip(),
+                   on_done=lambda created: messagebox.showinfo("Saved", f"Disease '{name}' saved/updated"))
 
     # --- Tools tab & Symptom Checker ---
     def build_tools_tab(self):
@@ -583,7 +723,10 @@ class HealthcareApp(tk.Tk):
         self.remind_medicine.pack()
         self.remind_time = ttk.Entry(tab_remind, width=30)
         self.remind_time.pack()
-        ttk.Label(tab_remind, text="Remind At (YYYY-MM-DD HH:MM)").pack()
+        ttk.Label(tab_remind, text="Remind At (YYYY-MM-DD HH:MM, or HH:MM for the next one)").pack()
+        self.remind_repeat = ttk.Combobox(tab_remind, values=("once",) + REPEATS, state="readonly", width=12)
+        self.remind_repeat.set("once")
+        self.remind_repeat.pack(pady=3)
         ttk.Button(tab_remind, text="Add Reminder", command=self.add_reminder).pack(pady=3)
         ttk.Button(tab_remind, text="Show My Reminders", command=self.show_reminders).pack(pady=3)
         # Emergency
@@ -591,14 +734,38 @@ class HealthcareApp(tk.Tk):
         notebook.add(tab_sos, text=LANG_MAP["sos"][self.lang])
         ttk.Label(tab_sos, text="Emergency Numbers:").pack(pady=2)
         ttk.Label(tab_sos, text="Police: 100\nAmbulance: 102\nFire: 101").pack(pady=2)
-        ttk.Button(tab_sos, text="Show Nearby Hospitals", command=self.show_hospitals).pack(pady=3)
+        city_row = ttk.Frame(tab_sos)
+        city_row.pack(pady=3)
+        ttk.Label(city_row, text="Your city:").pack(side="left")
+        self.sos_city = ttk.Combobox(city_row, width=24)
+        self.sos_city.pack(side="left", padx=4)
+        self.sos_city.bind("<<ComboboxSelected>>", lambda e: self.prepare_nearby())
+        self.sos_city.bind("<FocusOut>", lambda e: self.prepare_nearby())
+        ttk.Button(tab_sos, text="Show Nearby Hospitals", command=self.show_nearby_hospitals).pack(pady=3)
+        self.sos_view = VirtualTable(tab_sos, HOSPITAL_FIELDS, height=6, width=110, count_text="{:,} hospitals nearby",
+                                     runner=self.tasks)
+        self.sos_view.pack(fill="both", expand=True, padx=6, pady=3)
         # Hospitals
         tab_hosp = ttk.Frame(notebook)
         notebook.add(tab_hosp, text="Hospitals")
-        ttk.Label(tab_hosp, text="List of Hospitals:").pack(pady=3)
-        self.hospitals_text = tk.Text(tab_hosp, height=10, width=52)
-        self.hospitals_text.pack()
-        ttk.Button(tab_hosp, text="Refresh Hospital List", command=self.show_hospitals).pack(pady=3)
+        filters = ttk.Frame(tab_hosp)
+        filters.pack(fill="x", padx=6, pady=3)
+        ttk.Label(filters, text="City:").pack(side="left")
+        self.hosp_city = ttk.Combobox(filters, width=18)
+        self.hosp_city.pack(side="left", padx=4)
+        self.hosp_city.bind("<<ComboboxSelected>>", lambda e: self.load_specialties())
+        ttk.Label(filters, text="Specialty:").pack(side="left")
+        self.hosp_specialty = ttk.Combobox(filters, width=16)
+        self.hosp_specialty.pack(side="left", padx=4)
+        ttk.Label(filters, text="or Disease:").pack(side="left")
+        self.hosp_disease = ttk.Entry(filters, width=16)
+        self.hosp_disease.pack(side="left", padx=4)
+        self.hosp_disease.bind("<Return>", lambda e: self.show_hospitals())
+        ttk.Button(filters, text="Show", command=self.show_hospitals).pack(side="left", padx=4)
+        self.hosp_view = VirtualTable(tab_hosp, HOSPITAL_FIELDS, height=10, width=110, count_text="{:,} hospitals",
+                                      runner=self.tasks)
+        self.hosp_view.pack(fill="both", expand=True, padx=6, pady=3)
+        self.tasks.submit(self.hospital_directory.cities, on_done=self.set_hospital_cities, key="hospital_cities")
         # Symptom Checker
         tab_symp = ttk.Frame(notebook)
         notebook.add(tab_symp, text=LANG_MAP["symptom_checker"][self.lang])
@@ -607,39 +774,97 @@ class HealthcareApp(tk.Tk):
         self.symptom_entry.pack(pady=3)
         ttk.Button(tab_symp, text="Check Possible Diseases", command=self.symptom_checker).pack(pady=3)
     def add_reminder(self):
-        med = self.remind_medicine.get().strip()
-        remind_at = self.remind_time.get().strip()
-        if not med or not remind_at:
-            messagebox.showerror("Error", "Medicine name and time required.")
-            return
-        with get_conn() as con:
-            pid = None
-            uid = 1
-            con.execute("INSERT INTO reminders(user_id, patient_id, medicine, remind_at, created_at) VALUES (?,?,?,?,?)",
-                        (uid, pid, med, remind_at, now_str()))
-            con.commit()
-        messagebox.showinfo("Reminder", "Medicine reminder saved.")
+        repeat = self.remind_repeat.get()
+        def saved(rid):
+            self.arm_reminders()
+            messagebox.showinfo("Reminder", "Medicine reminder saved.")
+        self.write(self.service.add_reminder, 1, self.remind_medicine.get(), self.remind_time.get(),
+                   None if repeat == "once" else repeat, on_done=saved)
     def show_reminders(self):
-        with get_conn() as con:
-            cur = con.cursor()
-            uid = 1
-            cur.execute("SELECT medicine, remind_at, done FROM reminders WHERE user_id=? ORDER BY remind_at ASC", (uid,))
-            rows = cur.fetchall()
+        self.tasks.submit(self.service.reminders_for, 1, on_done=self.show_reminder_list, key="reminders_for")
+    def show_reminder_list(self, rows):
         if not rows:
             messagebox.showinfo("Reminders", "No reminders.")
             return
         msg = ""
         for r in rows:
-            msg += f"{r[0]} at {r[1]} - {'Done' if r[2] else 'Pending'}\n"
+            repeat = f" ({r[3]})" if r[3] else ""
+            msg += f"{r[0]} at {r[1]}{repeat} - {'Done' if r[2] else 'Pending'}\n"
         messagebox.showinfo("Reminders", msg)
+    def wake_reminders(self):
+        self.reminder_after = None
+        self.tasks.submit(self.reminders.fire_due, on_done=self.show_due_reminders, on_error=self.reminders_failed)
+    def reminders_failed(self, exc):
+        self.set_status(f"Reminders: {exc}")
+        self.arm_reminders()
+    def arm_reminders(self):
+        # One after() for the next due reminder; no polling in between. The
+        # scheduler's lock can be held by a write, so it is asked on a worker.
+        if self.reminder_after is not None:
+            self.after_cancel(self.reminder_after)
+            self.reminder_after = None
+        def arm(delay):
+            if self.reminder_after is not None:
+                self.after_cancel(self.reminder_after)
+            self.reminder_after = self.after(int(delay * 1000), self.wake_reminders)
+        self.tasks.submit(self.reminders.next_delay, on_done=arm, on_error=self.reminders_failed,
+                          key="arm_reminders")
+    def show_due_reminders(self, fired):
+        self.arm_reminders()
+        if not fired:
+            return
+        self.bell()
+        win = tk.Toplevel(self)
+        win.title("Medicine Reminder")
+        win.attributes("-topmost", True)
+        for rid, user_id, patient_id, medicine, remind_at, repeat in fired[:20]:
+            ttk.Label(win, text=f"Take {medicine} (due {remind_at})").pack(anchor="w", padx=12, pady=2)
+        if len(fired) > 20:
+            ttk.Label(win, text=f"... and {len(fired) - 20} more").pack(anchor="w", padx=12, pady=2)
+        ttk.Button(win, text="OK", command=win.destroy).pack(pady=8)
+    def set_hospital_cities(self, cities):
+        self.sos_city.config(values=cities)
+        self.hosp_city.config(values=cities)
+    def load_specialties(self):
+        self.hosp_specialty.set("")
+        self.tasks.submit(self.hospital_directory.specialties, self.hosp_city.get(),
+                          on_done=lambda values: self.hosp_specialty.config(values=[""] + values),
+                          key="hospital_specialties")
     def show_hospitals(self):
-        with get_conn() as con:
-            cur = con.cursor()
-            cur.execute("SELECT name, city, contact FROM hospitals")
-            rows = cur.fetchall()
-        self.hospitals_text.delete('1.0', tk.END)
-        for r in rows:
-            self.hospitals_text.insert(tk.END, f"{r[0]} - {r[1]} - {r[2]}\n")
+        try:
+            pager = self.hospital_directory.pager(self.hosp_city.get(), self.hosp_specialty.get(),
+                                                  self.hosp_disease.get())
+        except ValueError as exc:
+            messagebox.showwarning("Hospitals", str(exc))
+            return
+        self.hosp_view.set_source(pager)   # pages are read as the table scrolls
+    def prepare_nearby(self, show=False):
+        # The city's first page is loaded as soon as it is chosen, so the
+        # SOS button itself reads nothing.
+        city = self.sos_city.get().strip().lower()
+        if not city:
+            return
+        if self.nearby and self.nearby[0] == city:
+            if show:
+                pager = self.nearby[1]
+                self.sos_view.set_source(pager)
+                # A directory change since it was prepared shows up right after.
+                self.tasks.submit(pager.changes, on_done=self.sos_view.apply_changes, key="nearby")
+            return
+        pager = self.hospital_directory.pager(city)
+        def load():
+            pager.rows(0, self.sos_view.visible)
+            return pager
+        def done(pg):
+            self.nearby = (city, pg)
+            if show:
+                self.sos_view.set_source(pg)
+        self.tasks.submit(load, on_done=done, key="nearby")
+    def show_nearby_hospitals(self):
+        if not self.sos_city.get().strip():
+            messagebox.showwarning("Nearby Hospitals", "Choose your city first.")
+            return
+        self.prepare_nearby(show=True)
     def symptom_checker(self):
         user_input = self.symptom_entry.get().strip().lower()
         if not user_input:
@@ -649,27 +874,75 @@ class HealthcareApp(tk.Tk):
         if not symptoms_provided:
             messagebox.showwarning("No input", "Please enter valid symptoms.")
             return
-        results = []
-        with get_conn() as con:
-            cur = con.cursor()
-            cur.execute("SELECT name, details, symptoms FROM diseases")
-            for name, details, db_symptoms in cur.fetchall():
-                if not db_symptoms:
-                    continue
-                db_symptom_set = set([s.strip().lower() for s in db_symptoms.split(",")])
-                matched = symptoms_provided & db_symptom_set
-                if matched:
-                    results.append( (name, details, len(matched), matched, db_symptom_set) )
+        self.tasks.submit(self.service.check_symptoms, symptoms_provided,
+                          on_done=self.show_symptom_results, key="symptom_checker")
+    def show_symptom_results(self, results):
         if not results:
             messagebox.showinfo("Result", "No matching diseases found in database.")
             return
-        results.sort(key=lambda x: (-x[2], x[0]))  # most matches first
         msg = ""
         for name, details, cnt, matched, db_symptoms in results:
             msg += f"{name.title()}: {details}\n"
             msg += f"  Matched: {', '.join(matched)} / All: {', '.join(db_symptoms)}\n"
         messagebox.showinfo("Likely Diseases", msg)
 
+    # --- Diagnostics tab ---
+    def build_diagnostics_tab(self):
+        frm = self.tab_diag
+        top = ttk.Frame(frm)
+        top.pack(fill="x", padx=8, pady=6)
+        ttk.Button(top, text="Refresh", command=self.refresh_diagnostics).pack(side="left")
+        ttk.Button(top, text="Reset", command=self.reset_diagnostics).pack(side="left", padx=6)
+        ttk.Button(top, text="Back Up Now", command=self.backup_now).pack(side="left", padx=6)
+        self.diag_slow_only = tk.BooleanVar(value=True)
+        ttk.Checkbutton(top, text="Slow statements only", variable=self.diag_slow_only,
+                        command=self.refresh_diagnostics).pack(side="left", padx=6)
+        self.diag_label = ttk.Label(top, text="")
+        self.diag_label.pack(side="right")
+        cols = ("handler", "count", "total_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms")
+        self.diag_handlers = ttk.Treeview(frm, columns=cols, show="headings", height=9)
+        for c in cols:
+            self.diag_handlers.heading(c, text=c.upper())
+            self.diag_handlers.column(c, width=300 if c == "handler" else 80, anchor="w" if c == "handler" else "e")
+        self.diag_handlers.pack(fill="both", expand=True, padx=8, pady=4)
+        cols = ("time", "handler", "ms", "rows", "sql", "plan")
+        self.diag_events = ttk.Treeview(frm, columns=cols, show="headings", height=9)
+        widths = {"time": 70, "handler": 200, "ms": 70, "rows": 60, "sql": 330, "plan": 220}
+        for c in cols:
+            self.diag_events.heading(c, text=c.upper())
+            self.diag_events.column(c, width=widths[c], anchor="e" if c in ("ms", "rows") else "w")
+        self.diag_events.pack(fill="both", expand=True, padx=8, pady=4)
+        self.refresh_diagnostics()
+    def refresh_diagnostics(self):
+        tracer = self.db.tracer
+        self.diag_handlers.delete(*self.diag_handlers.get_children())
+        for name, n, total, p50, p90, p99, worst in tracer.handler_stats():
+            self.diag_handlers.insert("", "end", values=(name, n, f"{total * 1000:.1f}", f"{p50 * 1000:.2f}",
+                                                         f"{p90 * 1000:.2f}", f"{p99 * 1000:.2f}", f"{worst * 1000:.2f}"))
+        self.diag_events.delete(*self.diag_events.get_children())
+        events = tracer.recent(self.diag_slow_only.get(), DIAG_EVENT_LIMIT)
+        for at, handler, elapsed, rows, sql, plan, slow in events:
+            self.diag_events.insert("", "end", values=(time.strftime("%H:%M:%S", time.localtime(at)), handler,
+                                                       f"{elapsed * 1000:.2f}", "" if rows is None else rows,
+                                                       " ".join(sql.split()), plan or ""))
+        def show(snapshots):
+            last = f"last backup {snapshots[0][1]:%Y-%m-%d %H:%M}" if snapshots else "no backups yet"
+            self.diag_label.config(text=f"{last}; {self.service.history.summary()}; {self.service.anomaly.summary()}; "
+                                        f"{self.hospital_directory.summary()}; "
+                                        f"slow = over {tracer.slow_ms:g} ms, logged to {SLOW_LOG_FILE}")
+        self.tasks.submit(list_snapshots, BACKUP_DIR, on_done=show, key="list_snapshots")
+    def backup_now(self):
+        self.set_status("Backing up...")
+        def done(result):
+            messagebox.showinfo("Backup", result.summary())
+            self.refresh_diagnostics()
+        self.tasks.submit(snapshot, self.db, key="backup", on_done=done,
+                          on_error=lambda e: messagebox.showerror("Backup", f"Backup failed: {e}"))
+    def reset_diagnostics(self):
+        self.db.tracer.reset()
+        self.db.stats.reset()
+        self.refresh_diagnostics()
+
     # --- General UI helpers ---
     def toggle_language(self):
         self.lang = LANG_HI if self.lang == LANG_EN else LANG_EN
@@ -700,13 +973,62 @@ class HealthcareApp(tk.Tk):
         messagebox.showinfo("Info", "Implement Login dialog here (optional).")
     def logout(self):
         messagebox.showinfo("Info", "Implement Logout logic here (optional).")
+    def show_query_stats(self):
+        messagebox.showinfo("Query Latency", self.db.stats.report())
+    def set_status(self, text):
+        self.status_label.config(text=text)
+    def set_busy(self, busy):
+        if busy:
+            self.busy_bar.start(15)
+            self.cancel_btn.config(state="normal")
+        else:
+            self.busy_bar.stop()
+            self.cancel_btn.config(state="disabled")
+            self.set_status("")
+    def cold_move_done(self, result):
+        if isinstance(result, Exception):
+            self.set_status(f"Moving old reports failed: {result}")
+        elif result.moved:
+            self.set_status(result.summary().splitlines()[0])
+            self.refresh_reports_table()
     def on_close(self):
+        if self.reminder_after is not None:
+            self.after_cancel(self.reminder_after)
+        if self.alert_after is not None:
+            self.after_cancel(self.alert_after)
+        self.writes.close()   # commits anything still queued
+        self.backups.stop()   # an unfinished snapshot is discarded
+        self.backups.join()
+        self.cold_moves.stop()   # a move in progress stops between chunks
+        self.cold_moves.join()
+        self.tasks.shutdown()
         self.destroy()
+        close_db()
 
 def main():
-    init_db()
-    app = HealthcareApp()
+    PROFILE.mark("imports")
+    db = get_db()
+    PROFILE.mark("open database")
+    bootstrapped = init_db(db)
+    PROFILE.mark("schema bootstrap (migrate + seed)" if bootstrapped else "schema check")
+    app = HealthcareApp(db)
+    PROFILE.mark("build window")
+    if PROFILE.enabled:
+        # Time to the first painted window, then exit.
+        app.update()
+        PROFILE.mark("first paint")
+        PROFILE.report()
+        app.on_close()
+        return
     app.mainloop()
 
+def serve(argv):
+    # Headless HTTP/JSON mode for clinics with several terminals.
+    from healthcare.server import main as server_main
+    server_main(argv)
+
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == ["--serve"]:
+        serve(sys.argv[2:])
+    else:
+        main()
@@ -0,0 +1,211 @@
+import bisect
+import importlib.util
+import json
+
+# numpy is imported by the functions that use it, so importing this module
+# (the GUI does at startup) stays cheap.
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+
+from healthcare.db import QUERIES
+
+# Band definitions (inclusive ranges) used by compare_reports and triage.
+LABELS = ["Low", "Good", "Borderline", "High", "Extreme"]
+BANDS = {
+    "bp_systolic": [(-1000, 89), (90, 120), (121, 139), (140, 180), (181, 1000)],
+    "bp_diastolic": [(-1000, 59), (60, 80), (81, 90), (91, 120), (121, 1000)],
+    "sugar": [(-1000, 69), (70, 100), (101, 125), (126, 200), (201, 10000)],
+    "uric_acid": [(-1000, 2), (3, 7), (8, 8), (9, 12), (13, 1000)],
+}
+METRICS = [
+    ("bp_systolic", "BP Systolic"),
+    ("bp_diastolic", "BP Diastolic"),
+    ("sugar", "Sugar"),
+    ("uric_acid", "Uric Acid"),
+]
+VERDICTS = ["No Change", "Improved", "Degraded", "N/A"]
+NO_CHANGE, IMPROVED, DEGRADED, NA = range(4)
+
+
+def get_band_simple(val, bands, labels):
+    if val is None:
+        return "N/A"
+    for idx, (low, high) in enumerate(bands):
+        if low <= val <= high:
+            return labels[idx]
+    return labels[-1]
+
+
+def verdict(prev_band, latest_band, labels=LABELS):
+    if prev_band == "N/A" or latest_band == "N/A":
+        return "N/A"
+    elif latest_band == prev_band:
+        return "No Change"
+    elif latest_band == "Good":
+        return "Improved"
+    elif prev_band == "Good" and latest_band != "Good":
+        return "Degraded"
+    elif labels.index(latest_band) > labels.index(prev_band):
+        return "Degraded"
+    elif labels.index(latest_band) < labels.index(prev_band):
+        return "Improved"
+    return "No Change"
+
+
+# verdict() for every (previous band, latest band) pair; index -1 is N/A.
+VERDICT_TABLE = [[VERDICTS.index(verdict(p, l)) for l in LABELS] + [NA] for p in LABELS] + [[NA] * (len(LABELS) + 1)]
+
+_LOWS = {m: [lo for lo, hi in bands] for m, bands in BANDS.items()}
+_HIGHS = {m: [hi for lo, hi in bands] for m, bands in BANDS.items()}
+
+
+def band_index(val, metric):
+    # Scalar twin of classify(): same result as get_band_simple, as an index.
+    if val is None:
+        return -1
+    i = bisect.bisect_right(_LOWS[metric], val) - 1
+    if i >= 0 and val <= _HIGHS[metric][i]:
+        return i
+    return len(LABELS) - 1
+
+
+def classify(values, metric):
+    # Vectorized band lookup over a float array (NaN = missing, gives -1).
+    import numpy as np
+    lows = np.asarray(_LOWS[metric], dtype=float)
+    highs = np.asarray(_HIGHS[metric], dtype=float)
+    i = np.searchsorted(lows, values, side="right") - 1
+    ic = np.clip(i, 0, len(lows) - 1)
+    inside = (i >= 0) & (values <= highs[ic])
+    out = np.where(inside, ic, len(lows) - 1)
+    out[np.isnan(values)] = -1
+    return out.astype(np.int8)
+
+
+# ---- Cohort triage ----
+TRIAGE_COLUMNS = (["patient_id", "name", "latest_month", "previous_month"]
+                  + [f"{m}_{part}" for m, _ in METRICS for part in ("value", "band", "verdict")]
+                  + ["degraded", "severity"])
+
+
+def load_latest_two(con, cold=None):
+    # Latest two reports per patient, one index probe per patient. With a
+    # ColdStore, a patient left with fewer than two live reports by the cold
+    # move gets their latest cold ones too, read on the same snapshot.
+    rows = con.execute(QUERIES["reports.latest_two"]).fetchall()
+    if cold is None:
+        return rows
+    live = {}
+    for r in rows:
+        live[r[1]] = live.get(r[1], 0) + 1
+    short = [pid for pid, in con.execute(QUERIES["cold.patient_ids"]) if live.get(pid, 0) < 2]
+    if short:
+        latest = {}
+        for r in cold.export_rows(con, short):   # (patient, month, id) order
+            pair = latest.setdefault(r[1], [])
+            pair.append(r)
+            del pair[:-2]
+        for pair in latest.values():
+            rows += [(r[0], r[1], int(r[2][:4]) * 100 + int(r[2][5:7])) + r[2:7] for r in pair]
+    return rows
+
+
+def _triage_numpy(rows, month=None, worse_only=True):
+    # rows: (report id, patient_id, month key, month, sys, dia, sugar, uric),
+    # any number per patient. One vectorized pass picks each patient's
+    # latest/previous report and compares their bands; Python objects are
+    # only built for the patients that survive the filters.
+    import numpy as np
+    if not rows:
+        return []
+    cols = list(zip(*rows))
+    ids = np.asarray(cols[0], dtype=np.int64)
+    pid = np.asarray(cols[1], dtype=np.int64)
+    mkey = np.asarray(cols[2], dtype=np.int64)
+    order = np.lexsort((ids, mkey, pid))
+    pid = pid[order]
+    last = np.flatnonzero(np.r_[pid[1:] != pid[:-1], True])
+    prev = last - 1
+    has_prev = prev >= 0
+    has_prev[has_prev] = pid[prev[has_prev]] == pid[last[has_prev]]
+    last, prev = last[has_prev], prev[has_prev]
+    table = np.asarray(VERDICT_TABLE, dtype=np.int8)
+    degraded = np.zeros(len(last), dtype=np.int8)
+    severity = np.zeros(len(last), dtype=np.int8)
+    per_metric = []
+    for k, (metric, _) in enumerate(METRICS):
+        values = np.asarray(cols[4 + k], dtype=float)[order]  # None -> NaN
+        bands = classify(values, metric)
+        latest_band, prev_band = bands[last], bands[prev]
+        verdicts = table[prev_band, latest_band]
+        worse = verdicts == DEGRADED
+        degraded += worse
+        severity = np.maximum(severity, np.where(worse, latest_band, 0))
+        per_metric.append((latest_band, verdicts))
+    keep = np.ones(len(last), dtype=bool)
+    if worse_only:
+        keep &= degraded > 0
+    if month:
+        latest_month = np.asarray(cols[3], dtype=object)[order[last]]
+        keep &= latest_month == month
+    sel = np.flatnonzero(keep)
+    picked = order[last[sel]].tolist()
+    previous = order[prev[sel]].tolist()
+    band_names = LABELS + ["N/A"]  # index -1 -> N/A
+    columns = [pid[last[sel]].tolist(), [None] * len(sel),
+               [cols[3][i] for i in picked], [cols[3][i] for i in previous]]
+    for k, (latest_band, verdicts) in enumerate(per_metric):
+        raw = cols[4 + k]
+        columns.append([raw[i] for i in picked])
+        columns.append([band_names[b] for b in latest_band[sel].tolist()])
+        columns.append([VERDICTS[v] for v in verdicts[sel].tolist()])
+    columns.append(degraded[sel].tolist())
+    columns.append(severity[sel].tolist())
+    return [list(r) for r in zip(*columns)]
+
+
+def _triage_python(rows, month=None, worse_only=True):
+    latest = {}
+    for row in sorted(rows, key=lambda r: (r[1], r[2], r[0])):
+        pair = latest.get(row[1])
+        latest[row[1]] = (row, pair[0] if pair else None)
+    out = []
+    for pid, (last, prev) in latest.items():
+        if prev is None or (month and last[3] != month):
+            continue
+        out_row = [pid, None, last[3], prev[3]]
+        degraded = severity = 0
+        for k, (metric, _) in enumerate(METRICS):
+            lb, pb = band_index(last[4 + k], metric), band_index(prev[4 + k], metric)
+            v = VERDICT_TABLE[pb][lb]
+            if v == DEGRADED:
+                degraded += 1
+                severity = max(severity, lb)
+            out_row += [last[4 + k], LABELS[lb] if lb >= 0 else "N/A", VERDICTS[v]]
+        if degraded or not worse_only:
+            out.append(out_row + [degraded, severity])
+    return out
+
+
+def triage(db, month=None, worse_only=True, sort_by="severity", descending=True, cold=None):
+    # Returns TRIAGE_COLUMNS rows, one per patient with at least two reports
+    # (counting cold ones when a ColdStore is given). month limits it to
+    # patients whose latest report is from that month.
+    with db.reader() as con:
+        rows = load_latest_two(con, cold)
+    if NUMPY_AVAILABLE:
+        out = _triage_numpy(rows, month, worse_only)
+    else:
+        out = _triage_python(rows, month, worse_only)
+    if out:
+        with db.reader() as con:
+            names = dict(con.execute(QUERIES["patients.names"], (json.dumps([r[0] for r in out]),)))
+        for r in out:
+            r[1] = names.get(r[0], "")
+    return sort_rows(out, TRIAGE_COLUMNS.index(sort_by), descending)
+
+
+def sort_rows(rows, key, descending=False):
+    # Missing values always go last.
+    present = [r for r in rows if r[key] is not None]
+    present.sort(key=lambda r: r[key], reverse=descending)
+    return present + [r for r in rows if r[key] is None]
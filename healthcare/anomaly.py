@@ -0,0 +1,351 @@
+import json
+import math
+import sys
+import time
+
+from healthcare.analytics import LABELS, METRICS, band_index
+from healthcare.db import DB_FILE, QUERIES, Database, create_version_triggers, migrate, now_str
+
+# Streaming anomaly detection on the report write path. anomaly_state keeps
+# one row per patient: the last report folded in and, per metric, the number
+# of readings, an exponentially weighted mean and variance (EWMA, so a slow
+# drift becomes the patient's new normal) and the band of the last reading.
+# A report is scored against that state before it is folded in and raises
+#   - "extreme" when a reading enters the Extreme band from any other band
+#     (or is the patient's first reading of that metric), and
+#   - "jump" when, after WARMUP readings, it departs from the running mean
+#     by more than JUMP_SIGMAS spreads (the EWMA deviation, floored at
+#     MIN_SPREAD of the mean so a very steady patient is not paged for noise).
+# Writers call observe() inside their transaction with the rows they just
+# inserted: one keyed read and one write of the state rows per call, however
+# many reports it covers, plus a few float operations per reading. Reports
+# are folded in (month, id) order; one older than the patient's last folded
+# month (history entered late) leaves the state alone. Imports that update
+# existing reports in place are not re-scored. replay() rebuilds every
+# patient's state from both tiers in one pass.
+ALPHA = 0.1
+JUMP_SIGMAS = 4.0
+MIN_SPREAD = 0.05
+WARMUP = 6
+EXTREME = len(LABELS) - 1
+REPLAY_CHUNK = 5000   # patients written back per transaction
+ALERT_LIMIT = 200
+ALERT_FIELDS = ("id", "patient_id", "name", "report_id", "month", "metric", "kind", "value", "baseline",
+                "score", "band", "previous_band", "created_at")
+_NAMES = [m for m, _ in METRICS]
+_JUMP_SQ = JUMP_SIGMAS * JUMP_SIGMAS
+
+
+def state_columns():
+    cols = ["last_id", "last_month"]
+    for m in _NAMES:
+        cols += [f"{m}_n", f"{m}_mean", f"{m}_var", f"{m}_band"]
+    return cols
+
+
+def new_state():
+    # state_columns() values for a patient with nothing folded in yet.
+    return [None, None] + [0, 0.0, 0.0, -1] * len(_NAMES)
+
+
+def _alert(alerts, row, metric, kind, x, mean, var, band, b, created):
+    if mean is None:
+        score = None
+    else:
+        spread = max(math.sqrt(var), MIN_SPREAD * abs(mean))
+        score = (x - mean) / spread if spread else None
+    alerts.append((row[1], row[0], row[2], metric, kind, x, mean, score, LABELS[b],
+                   LABELS[band] if band >= 0 else None, created))
+
+
+def fold(state, row, alerts, created):
+    # Scores report row (id, patient_id, month, sys, dia, sugar, uric_acid,
+    # ...) against state, appends any alert tuples (alerts.insert order) and
+    # folds the readings in. state is changed in place. Runs for every
+    # report written, so the jump test compares squares instead of taking a
+    # square root, and scores are only worked out for alerts.
+    month = row[2]
+    if state[1] is not None and month < state[1]:
+        return
+    state[0] = row[0]
+    state[1] = month
+    k = 2
+    for metric, x in zip(_NAMES, row[3:7]):
+        if x is not None:
+            n = state[k]
+            band = state[k + 3]
+            b = band_index(x, metric)   # the band compare_reports and triage show
+            if n:
+                mean = state[k + 1]
+                var = state[k + 2]
+                if b == EXTREME and band != EXTREME:
+                    _alert(alerts, row, metric, "extreme", x, mean, var, band, b, created)
+                diff = x - mean
+                if n >= WARMUP:
+                    floor = MIN_SPREAD * mean
+                    if diff * diff > _JUMP_SQ * (var if var > floor * floor else floor * floor):
+                        _alert(alerts, row, metric, "jump", x, mean, var, band, b, created)
+                incr = ALPHA * diff
+                state[k + 1] = mean + incr
+                state[k + 2] = (1.0 - ALPHA) * (var + diff * incr)
+            else:
+                if b == EXTREME and band != EXTREME:
+                    _alert(alerts, row, metric, "extreme", x, None, None, band, b, created)
+                state[k + 1] = float(x)
+                state[k + 2] = 0.0
+            state[k] = n + 1
+            state[k + 3] = b
+        k += 4
+
+
+def _fold_rows(states, rows, alerts, created):
+    # rows of any patients, folded per patient in (month, id) order.
+    for row in sorted(rows, key=lambda r: (r[2], r[0])):
+        state = states.get(row[1])
+        if state is None:
+            state = states[row[1]] = new_state()
+        fold(state, row, alerts, created)
+
+
+def _save(con, states):
+    con.executemany(QUERIES["anomaly.save"], ([pid] + state for pid, state in states.items()))
+
+
+class AnomalyDetector:
+    # Called by the service and bulk import with the writer connection, so
+    # calls are serialized by the write lock (the counters rely on it).
+    def __init__(self, db):
+        self.db = db
+        self.observed = 0
+        self.raised = 0
+        self.seconds = 0.0
+
+    def observe(self, con, rows, created=None, states=None):
+        # rows: reports just written on con, (id, patient_id, month, sys, dia,
+        # sugar, uric_acid, ...). Runs in the caller's transaction, so a
+        # rollback drops the state change and the alerts with the reports.
+        # Returns the alert tuples raised. A bulk writer can pass states, a
+        # dict it keeps for the rest of its transaction: patients already in
+        # it are not read again, and nothing is written back until save().
+        if not rows:
+            return []
+        t0 = time.perf_counter()
+        held = states is not None
+        if not held:
+            states = {}
+        pids = {row[1] for row in rows}.difference(states)
+        if len(pids) == 1:
+            found = con.execute(QUERIES["anomaly.state"], (next(iter(pids)),))
+        else:
+            found = con.execute(QUERIES["anomaly.states"], (json.dumps(sorted(pids)),)) if pids else ()
+        states.update((row[0], list(row[1:])) for row in found)
+        alerts = []
+        _fold_rows(states, rows, alerts, created or now_str())
+        if not held:
+            _save(con, states)
+        if alerts:
+            con.executemany(QUERIES["alerts.insert"], alerts)
+        self.db.after_commit(self._count, len(rows), len(alerts))
+        self.seconds += time.perf_counter() - t0
+        return alerts
+
+    def _count(self, observed, raised):
+        self.observed += observed
+        self.raised += raised
+
+    def observe_since(self, con, after_id, states=None):
+        # For writers that insert set-based (bulk import): folds in every
+        # report with an id above after_id. Returns (highest id seen, alerts).
+        rows = con.execute(QUERIES["anomaly.since"], (after_id,)).fetchall()
+        return (rows[-1][0] if rows else after_id), self.observe(con, rows, states=states)
+
+    def save(self, con, states):
+        t0 = time.perf_counter()
+        _save(con, states)
+        self.seconds += time.perf_counter() - t0
+
+    def stats(self):
+        return {"observed": self.observed, "raised": self.raised,
+                "us_per_report": self.seconds / self.observed * 1e6 if self.observed else 0.0}
+
+    def summary(self):
+        s = self.stats()
+        return f"anomaly detector {s['observed']:,} reports, {s['us_per_report']:.0f} us each, {s['raised']:,} alerts"
+
+
+class ReplayResult:
+    def __init__(self):
+        self.reports = 0
+        self.patients = 0
+        self.caught_up = 0
+        self.alerts = 0
+        self.elapsed = 0.0
+
+    def summary(self):
+        text = (f"Replayed {self.reports:,} reports of {self.patients:,} patients in {self.elapsed:.2f}s, "
+                f"{self.caught_up:,} written meanwhile folded in afterwards")
+        if self.alerts:
+            text += f"\nRecorded {self.alerts:,} alerts"
+        return text
+
+
+def _write_chunk(db, states, snapshot_id, alerts, result):
+    # Replaces the chunk's state rows with the replayed ones, then folds in
+    # the chunk's reports written since the snapshot (their writers already
+    # scored them). Patients deleted since are skipped. alerts is None when
+    # they are not being recorded.
+    with db.writer() as con:
+        known = {pid for pid, _ in con.execute(QUERIES["patients.names"], (json.dumps(sorted(states)),))}
+        states = {pid: state for pid, state in states.items() if pid in known}
+        newer = [row for row in con.execute(QUERIES["anomaly.since"], (snapshot_id,)) if row[1] in states]
+        _fold_rows(states, newer, [], now_str())
+        _save(con, states)
+        if alerts:
+            result.alerts += con.executemany(QUERIES["alerts.insert"], [a for a in alerts if a[0] in known]).rowcount
+        result.caught_up += len(newer)
+
+
+def replay(db, cold=None, record_alerts=False, chunk=REPLAY_CHUNK, progress=None):
+    # Rebuilds every patient's state from their reports in both tiers, read
+    # in one (patient, month, id) pass over a snapshot and written back
+    # `chunk` patients per transaction. Reports inserted meanwhile were
+    # already scored by their writer; they are folded into the rebuilt state
+    # afterwards. With record_alerts the alerts the history would have raised
+    # are stored too (the unique index drops ones already there).
+    if not db.reader_count:
+        raise ValueError("replay needs a database with reader connections")
+    result = ReplayResult()
+    t0 = time.perf_counter()
+    with db.reader() as con:
+        con.execute("BEGIN")
+        try:
+            snapshot_id = con.execute(QUERIES["reports.max_id"]).fetchone()[0]
+            rows = con.execute(QUERIES["reports.export_all"], ("0000-00", "9999-99"))
+            if cold is not None:
+                rows = cold.merged_export(con, rows)
+            states, alerts, pid, state = {}, [], None, None
+            created = now_str()
+            for row in rows:
+                if row[1] != pid:
+                    if len(states) >= chunk:
+                        _write_chunk(db, states, snapshot_id, alerts if record_alerts else None, result)
+                        states, alerts = {}, []
+                        if progress:
+                            progress(result)
+                    pid = row[1]
+                    state = states[pid] = new_state()
+                    result.patients += 1
+                fold(state, row, alerts, created)
+                result.reports += 1
+            if states:
+                _write_chunk(db, states, snapshot_id, alerts if record_alerts else None, result)
+        finally:
+            con.rollback()
+    result.elapsed = time.perf_counter() - t0
+    return result
+
+
+class AlertFeed:
+    # Open alerts for a UI that polls: poll() costs one read of the alerts
+    # change counter while nothing changed, and otherwise returns the open
+    # alerts newer than any it returned before (newest first).
+    def __init__(self, db, limit=ALERT_LIMIT):
+        self.db = db
+        self.limit = limit
+        self.version = None
+        self.last_id = 0
+
+    def poll(self):
+        with self.db.reader() as con:
+            version = con.execute(QUERIES["alerts.version"]).fetchone()[0]
+            if version == self.version:
+                return []
+            self.version = version
+            rows = con.execute(QUERIES["alerts.open"], (self.last_id, self.limit)).fetchall()
+        if rows:
+            self.last_id = max(self.last_id, rows[0][0])
+        return rows
+
+
+def describe(alert):
+    # What an alerts.open row is about, in a line.
+    a = dict(zip(ALERT_FIELDS, alert))
+    what = dict(METRICS)[a["metric"]]
+    if a["kind"] == "extreme":
+        text = f"{what} {a['value']:g} is Extreme"
+        return text + (f" (was {a['previous_band']})" if a["previous_band"] else "")
+    text = f"{what} jumped to {a['value']:g} from about {a['baseline']:.0f}"
+    return text + (f" ({a['score']:+.1f} sd)" if a["score"] is not None else "")
+
+
+def create_tables(con):
+    metric_cols = "".join(f"""
+            {m}_n INTEGER NOT NULL DEFAULT 0,
+            {m}_mean REAL NOT NULL DEFAULT 0.0,
+            {m}_var REAL NOT NULL DEFAULT 0.0,
+            {m}_band INTEGER NOT NULL DEFAULT -1,""" for m in _NAMES)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS anomaly_state(
+            patient_id INTEGER PRIMARY KEY REFERENCES patients(id) ON DELETE CASCADE,
+            last_id INTEGER,
+            last_month TEXT,{metric_cols.rstrip(',')}
+        );
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS alerts(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
+            report_id INTEGER NOT NULL,
+            month TEXT,
+            metric TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            value REAL,
+            baseline REAL,
+            score REAL,
+            band TEXT,
+            previous_band TEXT,
+            created_at TEXT,
+            acknowledged INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+    # Not a foreign key to reports: alerts outlive the move to the cold tier.
+    con.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_alerts_report ON alerts(report_id, metric, kind)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_alerts_patient ON alerts(patient_id)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_alerts_open ON alerts(id) WHERE acknowledged = 0")
+    con.execute("INSERT OR IGNORE INTO table_versions(name, version) VALUES ('alerts', 0)")
+    create_version_triggers(con, "alerts")
+
+
+def main(argv=None):
+    import argparse
+    from healthcare.coldstore import ColdStore
+    parser = argparse.ArgumentParser(description="Report anomaly detector: list open alerts, replay history")
+    parser.add_argument("db", nargs="?", default=DB_FILE)
+    parser.add_argument("--replay", action="store_true", help="rebuild every patient's detector state from their reports")
+    parser.add_argument("--alerts", action="store_true", help="with --replay, also record the alerts the history raises")
+    parser.add_argument("--limit", type=int, default=20, help="open alerts to list")
+    args = parser.parse_args(argv)
+    db = Database(args.db, readers=1)
+    try:
+        migrate(db)
+        if args.replay:
+            cold = ColdStore(db)
+            try:
+                result = replay(db, cold, args.alerts,
+                                progress=lambda r: print(f"{r.patients:,} patients...", file=sys.stderr))
+            finally:
+                cold.close()
+            print(result.summary(), file=sys.stderr)
+        with db.reader() as con:
+            count = con.execute(QUERIES["alerts.open_count"]).fetchone()[0]
+            rows = con.execute(QUERIES["alerts.open"], (0, args.limit)).fetchall()
+        for row in rows:
+            a = dict(zip(ALERT_FIELDS, row))
+            print(f"{a['id']:8}  {a['month']}  {a['name']} (#{a['patient_id']}): {describe(row)}")
+        print(f"{count:,} open alerts", file=sys.stderr)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
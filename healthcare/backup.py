@@ -0,0 +1,299 @@
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from healthcare.coldstore import cold_dir, copy_segments
+from healthcare.db import DB_FILE, Database
+
+BACKUP_DIR = "backups"
+STEP_PAGES = 64              # pages copied per step while holding the write lock
+STEP_PAUSE = 0.005           # seconds between steps, for writers to get in
+BACKUP_INTERVAL = 6 * 3600
+STARTUP_DELAY = 60           # the app's first scheduled snapshot waits this long
+KEEP_LAST = 10               # newest snapshots always kept
+KEEP_DAILY = 14              # plus the newest snapshot of each of this many days
+CHUNK = 1024 * 1024
+SNAPSHOT_RE = re.compile(r"^healthcare-(\d{8}-\d{6})\.db\.gz$")
+STAMP_FORMAT = "%Y%m%d-%H%M%S"
+
+
+class BackupCancelled(Exception):
+    pass
+
+
+class BackupResult:
+    def __init__(self, path):
+        self.path = path
+        self.pages = 0
+        self.steps = 0
+        self.longest_step = 0.0
+        self.db_bytes = 0
+        self.gz_bytes = 0
+        self.copy_seconds = 0.0
+        self.compress_seconds = 0.0
+        self.pruned = []
+
+    @property
+    def elapsed(self):
+        return self.copy_seconds + self.compress_seconds
+
+    def summary(self):
+        ratio = self.db_bytes / self.gz_bytes if self.gz_bytes else 0.0
+        text = (f"Backed up {self.db_bytes / 1e6:,.1f} MB to {self.path} in {self.elapsed:.2f}s\n"
+                f"Copy {self.copy_seconds:.2f}s in {self.steps} steps (longest write-lock hold "
+                f"{self.longest_step * 1000:.1f} ms), compress {self.compress_seconds:.2f}s "
+                f"to {self.gz_bytes / 1e6:,.1f} MB ({ratio:.1f}x)")
+        if self.pruned:
+            text += f"\nRemoved {len(self.pruned)} old snapshot(s)"
+        return text
+
+
+def snapshot_time(path):
+    m = SNAPSHOT_RE.match(os.path.basename(path))
+    return datetime.strptime(m.group(1), STAMP_FORMAT) if m else None
+
+
+def list_snapshots(dest=BACKUP_DIR):
+    # [(path, taken at)], newest first.
+    if not os.path.isdir(dest):
+        return []
+    out = [(os.path.join(dest, name), snapshot_time(name)) for name in os.listdir(dest)]
+    return sorted(((p, t) for p, t in out if t is not None), key=lambda pt: pt[1], reverse=True)
+
+
+def backup(db, dest=BACKUP_DIR, step_pages=STEP_PAGES, pause=STEP_PAUSE, progress=None, cancel=None):
+    # Online snapshot of a live Database to dest/healthcare-<time>.db.gz.
+    # The pages are copied in small steps (see Database.backup), checked
+    # with quick_check, then gzipped; the snapshot only appears under its
+    # final name once complete. Cold-tier segment files, which never change,
+    # are copied to dest/cold first, so any snapshot's index finds them.
+    # cancel is an optional threading.Event.
+    os.makedirs(dest, exist_ok=True)
+    copy_segments(cold_dir(db.path), os.path.join(dest, "cold"))
+    when = datetime.now()
+    name = f"healthcare-{when.strftime(STAMP_FORMAT)}.db.gz"
+    result = BackupResult(os.path.join(dest, name))
+    raw = os.path.join(dest, f".{name}.db.tmp")
+    packed = os.path.join(dest, f".{name}.tmp")
+    def step(copied, total):
+        result.pages = total
+        if cancel is not None and cancel.is_set():
+            raise BackupCancelled()
+        if progress:
+            progress(copied, total)
+    try:
+        t0 = time.perf_counter()
+        target = sqlite3.connect(raw)
+        try:
+            result.steps, result.longest_step = db.backup(target, step_pages, pause, step)
+            check = target.execute("PRAGMA quick_check").fetchone()[0]
+        finally:
+            target.close()
+        if check != "ok":
+            raise sqlite3.DatabaseError(f"snapshot failed quick_check: {check}")
+        result.copy_seconds = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        with open(raw, "rb") as src, gzip.open(packed, "wb", compresslevel=6) as out:
+            for chunk in iter(lambda: src.read(CHUNK), b""):
+                if cancel is not None and cancel.is_set():
+                    raise BackupCancelled()
+                out.write(chunk)
+        result.db_bytes = os.path.getsize(raw)
+        result.gz_bytes = os.path.getsize(packed)
+        os.replace(packed, result.path)
+        result.compress_seconds = time.perf_counter() - t0
+    finally:
+        for path in (raw, packed):
+            if os.path.exists(path):
+                os.remove(path)
+    return result
+
+
+def snapshot(db, dest=BACKUP_DIR, keep_last=KEEP_LAST, keep_daily=KEEP_DAILY, **kwargs):
+    # backup() followed by prune(); the removed paths go in result.pruned.
+    result = backup(db, dest, **kwargs)
+    result.pruned = prune(dest, keep_last, keep_daily)
+    return result
+
+
+def prune(dest=BACKUP_DIR, keep_last=KEEP_LAST, keep_daily=KEEP_DAILY, now=None):
+    # Retention: the newest keep_last snapshots, plus the newest one of each
+    # of the last keep_daily days. Returns the removed paths.
+    snapshots = list_snapshots(dest)
+    keep = {path for path, _ in snapshots[:keep_last]}
+    cutoff = (now or datetime.now()).date() - timedelta(days=keep_daily - 1)
+    days = set()
+    for path, taken in snapshots:
+        if taken.date() >= cutoff and taken.date() not in days:
+            days.add(taken.date())
+            keep.add(path)
+    removed = [path for path, _ in snapshots if path not in keep]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def _unpack(snapshot, directory):
+    fd, path = tempfile.mkstemp(suffix=".db", prefix=".restore-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as out, gzip.open(snapshot, "rb") as src:
+            shutil.copyfileobj(src, out, CHUNK)
+    except (OSError, EOFError) as exc:
+        os.remove(path)
+        raise ValueError(f"cannot read {snapshot}: {exc}")
+    return path
+
+
+def _check(path):
+    # Full integrity check plus a look at the schema; returns (ok, message).
+    con = sqlite3.connect(path)
+    try:
+        problems = [row[0] for row in con.execute("PRAGMA integrity_check")]
+        if problems != ["ok"]:
+            return False, "integrity_check: " + "; ".join(problems[:5])
+        version = con.execute("PRAGMA user_version").fetchone()[0]
+        patients = con.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+        reports = con.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+    except sqlite3.DatabaseError as exc:
+        return False, str(exc)
+    finally:
+        con.close()
+    return True, f"ok: schema {version}, {patients:,} patients, {reports:,} reports"
+
+
+def verify(snapshot):
+    # (ok, message) for a .db.gz snapshot; nothing is changed.
+    try:
+        path = _unpack(snapshot, os.path.dirname(os.path.abspath(snapshot)))
+    except ValueError as exc:
+        return False, str(exc)
+    try:
+        return _check(path)
+    finally:
+        os.remove(path)
+
+
+def restore(snapshot, target=DB_FILE):
+    # Replaces target with the snapshot after it passes integrity_check. The
+    # app must not have target open. The old database (and its -wal/-shm)
+    # is kept beside it as <target>.before-restore-<time>; the snapshot
+    # directory's cold segments are copied back beside the new one. Returns
+    # the check message; raises ValueError if the snapshot is damaged.
+    directory = os.path.dirname(os.path.abspath(target))
+    path = _unpack(snapshot, directory)
+    try:
+        ok, message = _check(path)
+        if not ok:
+            raise ValueError(f"{snapshot} failed verification, nothing restored: {message}")
+        if os.path.exists(target):
+            aside = f"{target}.before-restore-{datetime.now().strftime(STAMP_FORMAT)}"
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(target + suffix):
+                    os.replace(target + suffix, aside + suffix)
+        os.replace(path, target)
+        copy_segments(os.path.join(os.path.dirname(os.path.abspath(snapshot)), "cold"), cold_dir(target))
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return message
+
+
+class BackupThread(threading.Thread):
+    # Takes a snapshot every `interval` seconds (the first one as soon as
+    # the newest existing snapshot is that old, but not before `delay`) and
+    # applies retention. on_done(result or exception) is called from this
+    # thread.
+    def __init__(self, db, dest=BACKUP_DIR, interval=BACKUP_INTERVAL, on_done=None, delay=0.0):
+        super().__init__(name="healthcare-backup", daemon=True)
+        self.db = db
+        self.dest = dest
+        self.interval = interval
+        self.on_done = on_done
+        self.delay = delay
+        self.last = None
+        self._stopping = threading.Event()
+
+    def next_delay(self):
+        snapshots = list_snapshots(self.dest)
+        if not snapshots:
+            return 0.0
+        age = (datetime.now() - snapshots[0][1]).total_seconds()
+        return max(0.0, self.interval - age)
+
+    def stop(self):
+        # Aborts a snapshot in progress; its partial files are removed.
+        self._stopping.set()
+
+    def run(self):
+        if self._stopping.wait(self.delay):
+            return
+        while not self._stopping.wait(self.next_delay()):
+            try:
+                result = snapshot(self.db, self.dest, cancel=self._stopping)
+            except BackupCancelled:
+                return
+            except Exception as exc:
+                result = exc
+            self.last = result
+            if self.on_done:
+                self.on_done(result)
+            if isinstance(result, Exception):
+                self._stopping.wait(min(self.interval, 300))
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Back up, verify and restore the healthcare database")
+    parser.add_argument("db", nargs="?", default=DB_FILE)
+    parser.add_argument("--dest", default=BACKUP_DIR, help="snapshot directory")
+    parser.add_argument("--list", action="store_true", help="list snapshots")
+    parser.add_argument("--verify", metavar="SNAPSHOT", help="integrity-check a snapshot")
+    parser.add_argument("--restore", metavar="SNAPSHOT", help="replace DB with a verified snapshot")
+    parser.add_argument("--every", type=float, metavar="HOURS", help="keep running, one snapshot per interval")
+    parser.add_argument("--keep-last", type=int, default=KEEP_LAST)
+    parser.add_argument("--keep-daily", type=int, default=KEEP_DAILY)
+    parser.add_argument("--step-pages", type=int, default=STEP_PAGES)
+    args = parser.parse_args(argv)
+    if args.list:
+        for path, taken in list_snapshots(args.dest):
+            print(f"{taken:%Y-%m-%d %H:%M:%S}  {os.path.getsize(path) / 1e6:9.1f} MB  {path}")
+        return
+    if args.verify:
+        ok, message = verify(args.verify)
+        print(message)
+        sys.exit(0 if ok else 1)
+    if args.restore:
+        try:
+            print(restore(args.restore, args.db))
+        except ValueError as exc:
+            print(exc, file=sys.stderr)
+            sys.exit(1)
+        print(f"restored {args.db} from {args.restore}")
+        return
+    db = Database(args.db, readers=0)
+    try:
+        if args.every:
+            thread = BackupThread(db, args.dest, args.every * 3600,
+                                  on_done=lambda r: print(r if isinstance(r, Exception) else r.summary(), flush=True))
+            thread.start()
+            try:
+                while thread.is_alive():
+                    thread.join(1.0)
+            except KeyboardInterrupt:
+                thread.stop()
+                thread.join()
+            return
+        print(snapshot(db, args.dest, args.keep_last, args.keep_daily, step_pages=args.step_pages).summary())
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import csv
+import itertools
+import sys
+import time
+
+from healthcare.db import DB_FILE, QUERIES, Database, now_str
+from healthcare.summary import deferred
+
+BATCH_ROWS = 20000
+COMMIT_ROWS = 200000
+MODES = ("append", "skip", "upsert")
+
+# Plausible ranges; anything outside is rejected as a probable typo.
+LIMITS = {
+    "bp_systolic": (40, 300),
+    "bp_diastolic": (20, 200),
+    "sugar": (10.0, 1000.0),
+    "uric_acid": (0.0, 30.0),
+}
+
+
+class ImportResult:
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.alerts = 0
+        self.reasons = {}
+        self.elapsed = 0.0
+
+    def reject(self, reason):
+        self.rejected += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+    @property
+    def rows_per_sec(self):
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        text = (f"Read {self.read:,} rows in {self.elapsed:.2f}s ({self.rows_per_sec:,.0f} rows/s)\n"
+                f"Inserted {self.inserted:,}, updated {self.updated:,}, skipped {self.skipped:,}, "
+                f"rejected {self.rejected:,}")
+        if self.alerts:
+            text += f"\nRaised {self.alerts:,} anomaly alerts"
+        for reason, n in sorted(self.reasons.items(), key=lambda kv: -kv[1]):
+            text += f"\n  {n:,} x {reason}"
+        return text
+
+
+def _column(header, *names):
+    for name in names:
+        if name in header:
+            return header.index(name)
+    return None
+
+
+def _valid_month(m):
+    return len(m) == 7 and m[4] == "-" and m[:4].isdigit() and m[5:].isdigit() and "01" <= m[5:] <= "12"
+
+
+def parse_rows(reader, header, patient_ids, result, rejects=None, created=None, first_line=2):
+    # Yields validated report tuples
+    # (patient_id, month, sys, dia, sugar, uric, created_at).
+    # Columns: patient_id, month, and either bp ("120/80") or
+    # bp_systolic/bp_diastolic, plus optional sugar and uric_acid.
+    header = [h.strip().lower() for h in header]
+    i_pid = _column(header, "patient_id")
+    i_month = _column(header, "month")
+    i_bp = _column(header, "bp")
+    i_sys = _column(header, "bp_systolic")
+    i_dia = _column(header, "bp_diastolic")
+    i_sugar = _column(header, "sugar")
+    i_uric = _column(header, "uric_acid")
+    if i_pid is None or i_month is None or (i_bp is None and i_sys is None):
+        raise ValueError("CSV needs patient_id, month and bp (or bp_systolic) columns")
+    s_lo, s_hi = LIMITS["bp_systolic"]
+    d_lo, d_hi = LIMITS["bp_diastolic"]
+    g_lo, g_hi = LIMITS["sugar"]
+    u_lo, u_hi = LIMITS["uric_acid"]
+    width = max(i for i in (i_pid, i_month, i_bp, i_sys, i_dia, i_sugar, i_uric) if i is not None) + 1
+    line = first_line - 1
+    for row in reader:
+        line += 1
+        result.read += 1
+        reason = None
+        try:
+            if len(row) < width:
+                reason = "missing columns"
+                raise ValueError
+            reason = "bad patient_id"
+            pid = int(row[i_pid])
+            if pid not in patient_ids:
+                reason = "unknown patient"
+                raise ValueError
+            month = row[i_month].strip()
+            if not _valid_month(month):
+                reason = "bad month"
+                raise ValueError
+            reason = "bad bp"
+            if i_bp is not None:
+                bp = row[i_bp]
+                if "/" in bp:
+                    a, b = bp.split("/", 1)
+                    bp_sys, bp_dia = int(a), int(b)
+                else:
+                    bp_sys, bp_dia = int(bp), None
+            else:
+                bp_sys = int(row[i_sys])
+                dia = row[i_dia] if i_dia is not None else ""
+                bp_dia = int(dia) if dia.strip() else None
+            if not s_lo <= bp_sys <= s_hi or (bp_dia is not None and not d_lo <= bp_dia <= d_hi):
+                reason = "bp out of range"
+                raise ValueError
+            reason = "bad sugar"
+            sugar = row[i_sugar] if i_sugar is not None else ""
+            sugar = float(sugar) if sugar.strip() else None
+            if sugar is not None and not g_lo <= sugar <= g_hi:
+                reason = "sugar out of range"
+                raise ValueError
+            reason = "bad uric_acid"
+            uric = row[i_uric] if i_uric is not None else ""
+            uric = float(uric) if uric.strip() else None
+            if uric is not None and not u_lo <= uric <= u_hi:
+                reason = "uric_acid out of range"
+                raise ValueError
+        except ValueError:
+            result.reject(reason)
+            if rejects is not None:
+                rejects.writerow([line, reason] + row)
+            continue
+        yield pid, month, bp_sys, bp_dia, sugar, uric, created
+
+
+class _Rejects:
+    # csv.writer for rejected rows that creates its file on the first one,
+    # so an import without rejects never touches the path.
+    def __init__(self, path):
+        self.path = path
+        self.header = None
+        self._file = None
+        self._writer = None
+
+    def writerow(self, row):
+        if self._writer is None:
+            self._file = open(self.path, "w", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.header)
+        self._writer.writerow(row)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def _take(rows, n):
+    return list(itertools.islice(rows, n))
+
+
+def _write_batch(con, batch, mode, result):
+    if mode == "append":
+        con.executemany(QUERIES["reports.insert"], batch)
+        result.inserted += len(batch)
+        return
+    # skip/upsert: stage the batch (the last row wins for a repeated
+    # patient+month) and apply it with set-based statements that probe the
+    # (patient_id, month) index.
+    con.execute(QUERIES["import.clear_stage"])
+    con.executemany(QUERIES["import.stage"], batch)
+    staged = con.execute(QUERIES["import.count_stage"]).fetchone()[0]
+    if mode == "upsert":
+        con.execute(QUERIES["import.update_existing"])
+    inserted = con.execute(QUERIES["import.insert_new"]).rowcount
+    result.inserted += inserted
+    if mode == "upsert":
+        result.updated += staged - inserted
+        result.skipped += len(batch) - staged
+    else:
+        result.skipped += len(batch) - inserted
+
+
+def import_reports(db, source, mode="append", rejects_path=None, batch_size=BATCH_ROWS,
+                   commit_rows=COMMIT_ROWS, progress=None, cancel=None, detector=None):
+    # Bulk-loads reports from a CSV path or file object. Rows are validated in
+    # a streaming pass (rejected ones go to rejects_path, created only if
+    # there are any) and written with executemany() in large transactions;
+    # patient_summary is refreshed once per transaction, not per row. With a
+    # detector (healthcare.anomaly) each batch's new reports are scored, and
+    # the patients' detector state is written once per transaction.
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+    result = ImportResult()
+    t0 = time.perf_counter()
+    f = open(source, newline="") if isinstance(source, str) else source
+    rejects = _Rejects(rejects_path) if rejects_path else None
+    try:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return result
+        if rejects is not None:
+            rejects.header = ["line", "reason"] + header
+        with db.reader() as con:
+            patient_ids = {pid for (pid,) in con.execute(QUERIES["patients.ids"])}
+        rows = parse_rows(reader, header, patient_ids, result, rejects, now_str())
+        batch = _take(rows, batch_size)
+        while batch:
+            # A short first batch means a small import, whose transaction
+            # can pause the rollup triggers rather than drop them.
+            expected = commit_rows if len(batch) >= batch_size else len(batch)
+            with db.writer() as con, deferred(con, expected) as changed:
+                if mode != "append":
+                    con.execute(QUERIES["import.create_stage"])
+                seen = con.execute(QUERIES["reports.max_id"]).fetchone()[0]
+                states = {}
+                written = 0
+                while batch and written < commit_rows:
+                    if cancel is not None and cancel.is_set():
+                        batch = []
+                        break
+                    _write_batch(con, batch, mode, result)
+                    if detector is not None:
+                        seen, alerts = detector.observe_since(con, seen, states)
+                        result.alerts += len(alerts)
+                    if mode == "upsert":
+                        changed.update(r[0] for r in batch)
+                    written += len(batch)
+                    if progress:
+                        progress(result)
+                    batch = _take(rows, batch_size)
+                if detector is not None:
+                    detector.save(con, states)
+    finally:
+        if f is not source:
+            f.close()
+        if rejects is not None:
+            rejects.close()
+        result.elapsed = time.perf_counter() - t0
+    return result
+
+
+def main(argv=None):
+    import argparse
+    from healthcare.anomaly import AnomalyDetector
+    parser = argparse.ArgumentParser(description="Bulk import reports from CSV")
+    parser.add_argument("csv")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--mode", choices=MODES, default="append",
+                        help="append: insert every row; skip: ignore rows whose patient+month exists; "
+                             "upsert: update them instead")
+    parser.add_argument("--rejects", help="write rejected rows with reasons to this CSV")
+    args = parser.parse_args(argv)
+    db = Database(args.db, readers=1)
+    try:
+        result = import_reports(db, args.csv, args.mode, args.rejects, detector=AnomalyDetector(db))
+    finally:
+        db.close()
+    print(result.summary(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import bisect
+import importlib.util
+
+# matplotlib (and numpy, which it depends on) take most of a second to
+# import, so they are only loaded when the first chart is built.
+MATPLOTLIB_AVAILABLE = importlib.util.find_spec("matplotlib") is not None
+
+from healthcare.analytics import BANDS, LABELS
+
+MAX_POINTS = 400
+LTTB_MAX_POINTS = 20000
+BAND_COLORS = {"Low": "#bbdefb", "Good": "#c8e6c9", "Borderline": "#fff9c4", "High": "#ffe0b2", "Extreme": "#ffcdd2"}
+# (metric, legend label, panel); every panel is shaded with the bands of its first metric.
+SERIES = [
+    ("bp_systolic", "Systolic", 0),
+    ("bp_diastolic", "Diastolic", 0),
+    ("sugar", "Sugar", 1),
+    ("uric_acid", "Uric Acid", 2),
+]
+PANELS = ["BP", "Sugar", "Uric acid"]
+
+
+def month_index(month):
+    # "YYYY-MM" -> months since year 0, so the x axis is real time; None for
+    # a month that does not parse (such reports are left off the chart).
+    try:
+        return int(month[:4]) * 12 + int(month[5:7]) - 1
+    except (TypeError, ValueError):
+        return None
+
+
+def month_label(x, pos=None):
+    x = int(round(x))
+    return f"{x // 12}-{x % 12 + 1:02d}"
+
+
+def lttb(xs, ys, threshold):
+    # Largest-Triangle-Three-Buckets: keeps the first and last point and, from
+    # each bucket in between, the point forming the largest triangle with the
+    # previously kept point and the next bucket's average. Preserves the
+    # visual shape (peaks included) with `threshold` points.
+    import numpy as np
+    x = np.asarray(xs, dtype=float)
+    y = np.asarray(ys, dtype=float)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+    edges = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    # Next-bucket averages from prefix sums; the last bucket looks at the last point.
+    cx = np.concatenate(([0.0], np.cumsum(x)))
+    cy = np.concatenate(([0.0], np.cumsum(y)))
+    lo, hi = edges[1:-1], edges[2:]
+    span = hi - lo
+    avg_x = np.append((cx[hi] - cx[lo]) / span, x[-1])
+    avg_y = np.append((cy[hi] - cy[lo]) / span, y[-1])
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        s, e = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - avg_x[i]) * (y[s:e] - ay) - (ax - x[s:e]) * (avg_y[i] - ay))
+        a = s + int(area.argmax())
+        keep[i + 1] = a
+    return x[keep], y[keep]
+
+
+def minmax(xs, ys, threshold):
+    # Cheaper alternative to lttb(), fully vectorized: the minimum and maximum
+    # of each of threshold/2 equal-sized buckets, in x order.
+    import numpy as np
+    x = np.asarray(xs, dtype=float)
+    y = np.asarray(ys, dtype=float)
+    n = len(x)
+    buckets = threshold // 2
+    if buckets < 1 or n <= threshold:
+        return x, y
+    size = -(-n // buckets)
+    buckets = -(-n // size)  # no bucket is pure padding
+    grid = np.full(buckets * size, np.nan)
+    grid[:n] = y
+    grid = grid.reshape(buckets, size)
+    rows = np.arange(buckets) * size
+    keep = np.unique(np.concatenate((rows + np.nanargmin(grid, axis=1), rows + np.nanargmax(grid, axis=1))))
+    return x[keep], y[keep]
+
+
+def auto(xs, ys, threshold):
+    # LTTB for the shape, min/max once a series is large enough that the
+    # per-bucket loop would dominate a redraw.
+    if len(xs) > LTTB_MAX_POINTS:
+        return minmax(xs, ys, threshold)
+    return lttb(xs, ys, threshold)
+
+
+DOWNSAMPLERS = {"lttb": lttb, "minmax": minmax, "auto": auto}
+
+
+class Series:
+    # One metric's points sorted by (month, report id), kept in parallel
+    # lists so adding or removing a report is a bisect plus a list insert.
+    def __init__(self):
+        self.keys = []
+        self.xs = []
+        self.ys = []
+
+    def insert(self, key, y):
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            self.ys[i] = y
+            return
+        self.keys.insert(i, key)
+        self.xs.insert(i, key[0])
+        self.ys.insert(i, y)
+
+    def remove(self, key):
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i], self.xs[i], self.ys[i]
+
+
+class ReportChart:
+    # Embedded BP / sugar / uric acid trend for one patient. The figure and
+    # its line artists are created once; loading a patient or adding and
+    # deleting a report only replaces the (downsampled) line data and asks
+    # Tk for an idle redraw.
+    def __init__(self, master, max_points=MAX_POINTS, method="auto"):
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+        self.max_points = max_points
+        self.downsample = DOWNSAMPLERS[method]
+        self.patient_id = None
+        self.series = {metric: Series() for metric, _, _ in SERIES}
+        self._keys = {}
+        self.figure = Figure(figsize=(8, 4.2), dpi=100)
+        self._build_figure()
+        self.canvas = FigureCanvasTkAgg(self.figure, master=master)
+        self.widget = self.canvas.get_tk_widget()
+
+    def _build_figure(self):
+        from matplotlib.ticker import FuncFormatter, MaxNLocator
+        self.axes = self.figure.subplots(len(PANELS), 1, sharex=True,
+                                         gridspec_kw={"height_ratios": [2, 1, 1]})
+        self.lines = {}
+        for panel, ax in enumerate(self.axes):
+            ax.set_ylabel(PANELS[panel], fontsize=8)
+            ax.tick_params(labelsize=7)
+            metric = next(m for m, _, p in SERIES if p == panel)
+            self._shade_bands(ax, metric)
+        for metric, label, panel in SERIES:
+            self.lines[metric], = self.axes[panel].plot([], [], lw=1.2, marker=".", ms=3, label=label)
+        self.axes[0].legend(loc="upper left", fontsize=7)
+        self.axes[-1].xaxis.set_major_locator(MaxNLocator(nbins=8, integer=True))
+        self.axes[-1].xaxis.set_major_formatter(FuncFormatter(month_label))
+        self.figure.subplots_adjust(left=0.08, right=0.98, top=0.97, bottom=0.08, hspace=0.12)
+
+    def _shade_bands(self, ax, metric):
+        bands = BANDS[metric]
+        for i, label in enumerate(LABELS):
+            low = bands[i][0]
+            high = bands[i + 1][0] if i + 1 < len(bands) else bands[i][1]
+            ax.axhspan(low, high, color=BAND_COLORS[label], lw=0, zorder=0)
+
+    def set_rows(self, patient_id, rows):
+        # rows: (id, month, bp_systolic, bp_diastolic, sugar, uric_acid).
+        self.patient_id = patient_id
+        self.series = {metric: Series() for metric, _, _ in SERIES}
+        self._keys = {}
+        for row in rows:
+            x = month_index(row[1])
+            if x is not None:
+                self._keys[row[0]] = (x, row[0])
+        ordered = sorted((r for r in rows if r[0] in self._keys), key=lambda r: self._keys[r[0]])
+        for k, (metric, _, _) in enumerate(SERIES, start=2):
+            s = self.series[metric]
+            s.keys = [self._keys[r[0]] for r in ordered if r[k] is not None]
+            s.xs = [key[0] for key in s.keys]
+            s.ys = [r[k] for r in ordered if r[k] is not None]
+        self.redraw()
+
+    def _insert(self, row):
+        rid, x = row[0], month_index(row[1])
+        if x is None:
+            return
+        key = (x, rid)
+        self._keys[rid] = key
+        for (metric, _, _), y in zip(SERIES, row[2:]):
+            if y is not None:
+                self.series[metric].insert(key, y)
+
+    def add_report(self, row):
+        self.remove_report(row[0], redraw=False)
+        self._insert(row)
+        self.redraw()
+
+    def remove_report(self, report_id, redraw=True):
+        key = self._keys.pop(report_id, None)
+        if key is None:
+            return
+        for series in self.series.values():
+            series.remove(key)
+        if redraw:
+            self.redraw()
+
+    def clear(self):
+        self.set_rows(None, [])
+
+    def redraw(self):
+        for panel, ax in enumerate(self.axes):
+            lo = hi = None
+            for metric, _, p in SERIES:
+                if p != panel:
+                    continue
+                s = self.series[metric]
+                xs, ys = self.downsample(s.xs, s.ys, self.max_points)
+                self.lines[metric].set_data(xs, ys)
+                if len(ys):
+                    lo = ys.min() if lo is None else min(lo, ys.min())
+                    hi = ys.max() if hi is None else max(hi, ys.max())
+            # Limits come from the data, not the band patches (which span
+            # far beyond any plausible reading).
+            if lo is not None:
+                pad = max((hi - lo) * 0.1, 1.0)
+                ax.set_ylim(lo - pad, hi + pad)
+        xs = [x for s in self.series.values() for x in s.xs[:1] + s.xs[-1:]]
+        if xs:
+            self.axes[-1].set_xlim(min(xs) - 0.5, max(xs) + 0.5)
+        self.canvas.draw_idle()
@@ -0,0 +1,589 @@
+import calendar
+import heapq
+import json
+import math
+import mmap
+import os
+import shutil
+import struct
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime
+
+from healthcare.db import DB_FILE, QUERIES, Database, migrate, month_str, now_str
+from healthcare.summary import create_stats_table, deferred, merge_stats
+
+# Reports older than a horizon move out of the reports table into immutable
+# segment files next to the database (<db>.cold/). A segment holds one
+# fixed-width column per field, rows sorted by (patient, month, id), and is
+# read through mmap: a patient's history is a slice of each column, with
+# no copy until it is decoded. Which slices belong to whom lives in SQLite
+# (cold_patients, with per-patient statistics in cold_summary), so a move
+# or a patient delete changes the tier in the same transaction as the
+# reports table; bytes of deleted patients stay in the file, unreachable.
+COLD_AFTER_MONTHS = 24
+MOVE_CHUNK = 1000              # reports in the first write transaction while moving
+MAX_MOVE_CHUNK = 20000
+EXPORT_BATCH = 50000           # cold reports decoded at a time while exporting
+MOVE_INTERVAL = 24 * 3600
+COLD_SUFFIX = ".cold"
+COLD_SUMMARY = "cold_summary"
+MAGIC = b"HCCOLD01"
+NULL_INT16 = -32768
+NULL_TIME = 0xFFFFFFFF
+EMPTY_TIME = 0xFFFFFFFE        # created_at '' (bulk-loaded rows)
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+_MISSING = object()
+# (field, array typecode): int64 ids, int16 months (months since year 0,
+# as on the chart's x axis) and BP, float32 lab values (NaN for NULL) and
+# uint32 creation times (seconds since 1970 of the stored local time).
+COLUMNS = (
+    ("id", "q"), ("patient_id", "q"), ("month", "h"),
+    ("bp_systolic", "h"), ("bp_diastolic", "h"),
+    ("sugar", "f"), ("uric_acid", "f"),
+    ("created_at", "I"),
+)
+
+
+def cold_dir(db_path):
+    return db_path + COLD_SUFFIX
+
+
+def horizon(months=COLD_AFTER_MONTHS):
+    # The first month that stays live: reports before it are moved.
+    year, month = (int(x) for x in month_str().split("-"))
+    return month_text(year * 12 + month - 1 - months)
+
+
+def month_code(text):
+    try:
+        year, month = int(text[:4]), int(text[5:7])
+    except (TypeError, ValueError):
+        return None
+    if text != f"{year:04d}-{month:02d}" or not 1 <= month <= 12 or year * 12 + month > 32767:
+        return None
+    return year * 12 + month - 1
+
+
+def month_text(code):
+    return f"{code // 12:04d}-{code % 12 + 1:02d}"
+
+
+def int16_code(value):
+    if value is None:
+        return NULL_INT16
+    if type(value) is not int or not -32767 <= value <= 32767:
+        return None
+    return value
+
+
+def _float32(value):
+    # The float32 that reads back as exactly `value`, or None if there is none.
+    if value is None:
+        return math.nan
+    if type(value) not in (int, float):
+        return None
+    try:
+        packed = struct.unpack("f", struct.pack("f", value))[0]
+    except (OverflowError, struct.error):
+        return None
+    return packed if _read_float(packed) == value else None
+
+
+def _read_float(x):
+    # float32s carry about 7 significant digits.
+    return None if math.isnan(x) else float(f"{x:.7g}")
+
+
+def time_code(text):
+    if text is None:
+        return NULL_TIME
+    if text == "":
+        return EMPTY_TIME
+    try:
+        seconds = calendar.timegm(time.strptime(text, TIME_FORMAT))
+    except (TypeError, ValueError):
+        return None
+    if not 0 <= seconds < EMPTY_TIME or time.strftime(TIME_FORMAT, time.gmtime(seconds)) != text:
+        return None
+    return seconds
+
+
+def time_text(code):
+    if code == NULL_TIME:
+        return None
+    return "" if code == EMPTY_TIME else time.strftime(TIME_FORMAT, time.gmtime(code))
+
+
+def encode(row):
+    # (id, patient_id, month, sys, dia, sugar, uric_acid, created_at) -> the
+    # column values, or None if the row does not fit the format exactly
+    # (such reports simply stay live).
+    rid, pid, month, bp_sys, bp_dia, sugar, uric, created = row
+    values = (rid, pid, month_code(month), int16_code(bp_sys), int16_code(bp_dia),
+              _float32(sugar), _float32(uric), time_code(created))
+    return None if None in values else values
+
+
+class Segment:
+    # One read-only, memory-mapped segment file.
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        head = self._map[:12]
+        if head[:8] != MAGIC:
+            raise ValueError(f"{path} is not a report segment")
+        size = struct.unpack("<I", head[8:12])[0]
+        self.meta = json.loads(self._map[12:12 + size])
+        if self.meta["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was written on a {self.meta['byteorder']}-endian machine")
+        self.rows = self.meta["rows"]
+        view = memoryview(self._map)
+        self.columns = {}
+        for name, code in COLUMNS:
+            start = self.meta["offsets"][name]
+            width = array(code).itemsize
+            self.columns[name] = view[start:start + self.rows * width].cast(code)
+
+    def slice(self, first, count):
+        # {field: memoryview} over the mapped file; nothing is copied.
+        return {name: col[first:first + count] for name, col in self.columns.items()}
+
+    def decode(self, first, count):
+        # Report tuples in export column order, months and times as text.
+        cols = {name: view.tolist() for name, view in self.slice(first, count).items()}
+        # Months, lab values and creation times repeat a lot; each distinct
+        # one is converted once per call.
+        months, floats, times = {}, {}, {}
+        out = []
+        for rid, pid, month, bp_sys, bp_dia, sugar, uric, created in zip(*(cols[name] for name, _ in COLUMNS)):
+            text = months.get(month)
+            if text is None:
+                text = months[month] = month_text(month)
+            values = []
+            for x in (sugar, uric):
+                v = floats.get(x)
+                if v is None:
+                    v = _read_float(x)
+                    if v is not None:
+                        floats[x] = v
+                values.append(v)
+            when = times.get(created, _MISSING)
+            if when is _MISSING:
+                when = times[created] = time_text(created)
+            out.append((rid, pid, text,
+                        None if bp_sys == NULL_INT16 else bp_sys, None if bp_dia == NULL_INT16 else bp_dia,
+                        values[0], values[1], when))
+        return out
+
+    def close(self):
+        for view in self.columns.values():
+            view.release()
+        self.columns = {}
+        try:
+            self._map.close()
+        except BufferError:
+            pass   # a caller still holds a slice; the mapping goes with it
+
+
+def write_segment(path, columns):
+    # columns: {field: array}. Written under a temporary name, fsynced and
+    # renamed, so a segment file is either complete or absent.
+    rows = len(columns["id"])
+    offsets, pos = {}, 0
+    for name, code in COLUMNS:
+        offsets[name] = pos
+        pos += -(-rows * array(code).itemsize // 8) * 8
+    # The columns start after the header, whose length depends on the
+    # offsets written into it; grow the gap until it fits.
+    base = 0
+    while True:
+        meta = {"rows": rows, "byteorder": sys.byteorder,
+                "offsets": {name: base + off for name, off in offsets.items()}}
+        head = json.dumps(meta).encode()
+        need = -(-(12 + len(head)) // 8) * 8
+        if need <= base:
+            break
+        base = need
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(head)) + head)
+        f.write(b"\0" * (base - f.tell()))
+        for name, _ in COLUMNS:
+            data = columns[name].tobytes()
+            f.write(data + b"\0" * (-len(data) % 8))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class ColdStore:
+    # Read side of the tier, shared by the service's threads. Segments are
+    # opened on first use and stay mapped.
+    def __init__(self, db, directory=None):
+        self.db = db
+        self.directory = directory or cold_dir(db.path)
+        self._segments = {}
+        self._lock = threading.Lock()
+
+    def segment(self, segment_id, file):
+        seg = self._segments.get(segment_id)
+        if seg is None:
+            with self._lock:
+                seg = self._segments.get(segment_id)
+                if seg is None:
+                    seg = self._segments[segment_id] = Segment(os.path.join(self.directory, file))
+        return seg
+
+    def rows(self, patient_id, con=None):
+        # The patient's cold reports in export column order, oldest first.
+        if con is None:
+            with self.db.reader() as con:
+                return self.rows(patient_id, con)
+        out = []
+        for segment_id, file, first, count in con.execute(QUERIES["cold.slices"], (patient_id,)):
+            out += self.segment(segment_id, file).decode(first, count)
+        out.sort(key=lambda r: (r[2], r[0]))
+        return out
+
+    def summary(self, patient_id, con=None):
+        # {stats column: value} over the patient's cold reports, or None.
+        if con is None:
+            with self.db.reader() as con:
+                return self.summary(patient_id, con)
+        cur = con.execute(QUERIES["cold.summary"], (patient_id,))
+        row = cur.fetchone()
+        return dict(zip([d[0] for d in cur.description], row)) if row else None
+
+    def export_rows(self, con, patient_ids=None, month_from="0000-00", month_to="9999-99"):
+        # Cold reports ordered by (patient, month, id), read on `con` so they
+        # share its snapshot with the live rows they are merged with.
+        if patient_ids is None:
+            slices = con.execute(QUERIES["cold.slices_all"]).fetchall()
+        else:
+            slices = con.execute(QUERIES["cold.slices_patients"], (json.dumps(sorted(set(patient_ids))),)).fetchall()
+        start = 0
+        while start < len(slices):
+            # A batch of whole patients; adjacent slices of one segment are
+            # decoded as a single run.
+            stop, rows = start, 0
+            while stop < len(slices) and (rows < EXPORT_BATCH or slices[stop][0] == slices[stop - 1][0]):
+                rows += slices[stop][4]
+                stop += 1
+            runs = {}
+            for pid, segment_id, file, first, count in slices[start:stop]:
+                spans = runs.setdefault((segment_id, file), [])
+                if spans and spans[-1][0] + spans[-1][1] == first:
+                    spans[-1][1] += count
+                else:
+                    spans.append([first, count])
+            by_patient = {}
+            for (segment_id, file), spans in runs.items():
+                seg = self.segment(segment_id, file)
+                for first, count in spans:
+                    for r in seg.decode(first, count):
+                        by_patient.setdefault(r[1], []).append(r)
+            for pid in dict.fromkeys(s[0] for s in slices[start:stop]):
+                rows = by_patient.get(pid, [])
+                if len(runs) > 1:
+                    rows.sort(key=lambda r: (r[2], r[0]))
+                yield from (r for r in rows if month_from <= r[2] <= month_to)
+            start = stop
+
+    def merged_export(self, con, live, patient_ids=None, month_from="0000-00", month_to="9999-99"):
+        # live: reports.export_* cursor rows; both streams are in
+        # (patient, month, id) order, so a merge keeps the export's order.
+        cold = self.export_rows(con, patient_ids, month_from, month_to)
+        return heapq.merge(live, cold, key=lambda r: (r[1], r[2], r[0]))
+
+    def close(self):
+        with self._lock:
+            for seg in self._segments.values():
+                seg.close()
+            self._segments = {}
+
+
+def create_tables(con):
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS cold_segments(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file TEXT NOT NULL UNIQUE,
+            rows INTEGER NOT NULL,
+            before_month TEXT,
+            created_at TEXT
+        );
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS cold_patients(
+            patient_id INTEGER NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
+            segment_id INTEGER NOT NULL,
+            first INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            last_month TEXT,
+            PRIMARY KEY(patient_id, segment_id)
+        ) WITHOUT ROWID;
+    """)
+    if "last_month" not in [row[1] for row in con.execute("PRAGMA table_info(cold_patients)")]:
+        con.execute("ALTER TABLE cold_patients ADD COLUMN last_month TEXT")
+        _backfill_last_month(con)
+    create_stats_table(con, COLD_SUMMARY)
+
+
+def _backfill_last_month(con):
+    # Each existing slice's latest month (its last row) from the segment
+    # files beside the database; a slice whose file cannot be read gets its
+    # segment's horizon, the latest month it can hold.
+    path = next(row[2] for row in con.execute("PRAGMA database_list") if row[1] == "main")
+    horizons = {segment_id: before for segment_id, _, _, before, _ in con.execute(QUERIES["cold.segments"])}
+    segments, updates = {}, []
+    for pid, segment_id, file, first, count in con.execute(QUERIES["cold.slices_all"]).fetchall():
+        if segment_id not in segments:
+            try:
+                segments[segment_id] = Segment(os.path.join(cold_dir(path), file))
+            except (OSError, ValueError):
+                segments[segment_id] = None
+        seg = segments[segment_id]
+        last = month_text(seg.columns["month"][first + count - 1]) if seg is not None else horizons[segment_id]
+        updates.append((last, pid, segment_id))
+    con.executemany("UPDATE cold_patients SET last_month=? WHERE patient_id=? AND segment_id=?", updates)
+    for seg in segments.values():
+        if seg is not None:
+            seg.close()
+
+
+class MoveResult:
+    def __init__(self, before_month):
+        self.before_month = before_month
+        self.path = None
+        self.moved = 0
+        self.patients = 0
+        self.kept = 0
+        self.skipped_patients = 0
+        self.bytes = 0
+        self.chunks = 0
+        self.longest_chunk = 0.0
+        self.freed_pages = 0
+        self.elapsed = 0.0
+        self.cancelled = False
+
+    def summary(self):
+        if not self.moved:
+            return f"No reports before {self.before_month} to move"
+        text = (f"Moved {self.moved:,} reports of {self.patients:,} patients from before {self.before_month} "
+                f"to {self.path} ({self.bytes / 1e6:,.1f} MB) in {self.elapsed:.2f}s "
+                f"({self.chunks} chunks, longest write-lock hold {self.longest_chunk * 1000:.1f} ms)")
+        if self.kept:
+            text += f"\nKept {self.kept:,} reports live that the column format cannot hold exactly"
+        if self.skipped_patients:
+            text += f"\n{self.skipped_patients:,} patients changed while moving; their reports stay live"
+        if self.freed_pages:
+            text += f"\nReturned {self.freed_pages:,} free pages to the OS"
+        if self.cancelled:
+            text += "\nCancelled; the patients not yet reached stay live"
+        return text
+
+
+def move_cold(db, before_month=None, months=COLD_AFTER_MONTHS, directory=None, chunk=MOVE_CHUNK,
+              hold=None, pause=None, progress=None, cancel=None):
+    # Moves reports with month < before_month (default: `months` before
+    # this month) into a new segment. The rows are read from a snapshot and
+    # the file written and fsynced first; then, in short write transactions
+    # sized like purge_patients()'s, each patient's live rows are compared
+    # with what was written and, if unchanged, deleted and indexed in the
+    # same transaction. A patient changed meanwhile stays live until the
+    # next run. progress(done, total) counts reports; cancel is a
+    # threading.Event.
+    from healthcare.purge import CHUNK_PAUSE, LOCK_HOLD, incremental_vacuum
+    hold = LOCK_HOLD if hold is None else hold
+    pause = CHUNK_PAUSE if pause is None else pause
+    result = MoveResult(before_month or horizon(months))
+    t0 = time.perf_counter()
+    columns = {name: array(code) for name, code in COLUMNS}
+    index = []   # (patient_id, first, count)
+    with db.reader() as con:
+        cur = con.execute(QUERIES["cold.candidates"], (result.before_month,))
+        for row in cur:
+            values = encode(row)
+            if values is None:
+                result.kept += 1
+                continue
+            pid = values[1]
+            if not index or index[-1][0] != pid:
+                index.append([pid, len(columns["id"]), 0])
+            index[-1][2] += 1
+            for (name, _), value in zip(COLUMNS, values):
+                columns[name].append(value)
+    if not index:
+        result.elapsed = time.perf_counter() - t0
+        return result
+    directory = directory or cold_dir(db.path)
+    os.makedirs(directory, exist_ok=True)
+    file = f"reports-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.col"
+    result.path = os.path.join(directory, file)
+    write_segment(result.path, columns)
+    result.bytes = os.path.getsize(result.path)
+    with db.writer() as con:
+        segment_id = con.execute(QUERIES["cold.insert_segment"],
+                                 (file, len(columns["id"]), result.before_month, now_str())).lastrowid
+    segment = Segment(result.path)
+    try:
+        start, total = 0, len(columns["id"])
+        while start < len(index):
+            if cancel is not None and cancel.is_set():
+                result.cancelled = True
+                break
+            stop, rows = start, 0
+            while stop < len(index) and (rows < chunk or stop == start):
+                rows += index[stop][2]
+                stop += 1
+            held = time.perf_counter()
+            with db.writer() as con, deferred(con, rows) as changed:
+                _move_chunk(con, segment, segment_id, index[start:stop], result, changed)
+            held = time.perf_counter() - held
+            result.longest_chunk = max(result.longest_chunk, held)
+            result.chunks += 1
+            start = stop
+            if progress:
+                progress(index[start - 1][1] + index[start - 1][2], total)
+            chunk = max(1, min(MAX_MOVE_CHUNK, int(rows * hold / max(held, 1e-3))))
+            time.sleep(pause)
+    finally:
+        segment.close()
+    if not result.moved:
+        with db.writer() as con:
+            con.execute(QUERIES["cold.delete_segment"], (segment_id,))
+        os.remove(result.path)
+        result.path = None
+    else:
+        result.freed_pages = incremental_vacuum(db, cancel=cancel)
+    result.elapsed = time.perf_counter() - t0
+    return result
+
+
+def _move_chunk(con, segment, segment_id, entries, result, changed):
+    pids = json.dumps([pid for pid, _, _ in entries])
+    live = {}
+    for row in con.execute(QUERIES["cold.verify"], (pids, result.before_month)):
+        live.setdefault(row[1], []).append(row)
+    moved, ids = [], []
+    for pid, first, count in entries:
+        # Encoding round-trips exactly, so the decoded rows equal the live
+        # ones unless the patient changed or has rows that stayed live.
+        written = segment.decode(first, count)
+        rows = live.get(pid, [])
+        if rows != written and [r for r in rows if encode(r) is not None] != written:
+            result.skipped_patients += 1
+            continue
+        moved.append((pid, segment_id, first, count, written[-1][2]))
+        ids += [r[0] for r in written]
+    if not moved:
+        return
+    batch = json.dumps(ids)
+    merge_stats(con, COLD_SUMMARY, "WHERE id IN (SELECT value FROM json_each(?))", (batch,))
+    con.execute(QUERIES["cold.delete_reports"], (batch,))
+    con.executemany(QUERIES["cold.insert_patient"], moved)
+    changed.update(m[0] for m in moved)
+    result.moved += len(ids)
+    result.patients += len(moved)
+
+
+def copy_segments(src, dst):
+    # Copies segment files missing from dst (they never change once
+    # written); returns how many were copied.
+    if not os.path.isdir(src):
+        return 0
+    os.makedirs(dst, exist_ok=True)
+    copied = 0
+    for name in sorted(os.listdir(src)):
+        if name.endswith(".col") and not os.path.exists(os.path.join(dst, name)):
+            shutil.copyfile(os.path.join(src, name), os.path.join(dst, name + ".tmp"))
+            os.replace(os.path.join(dst, name + ".tmp"), os.path.join(dst, name))
+            copied += 1
+    return copied
+
+
+def check(db, directory=None):
+    # Every indexed slice must exist and hold only its patient's rows, in
+    # (month, id) order. Returns a list of problems.
+    store = ColdStore(db, directory)
+    problems = []
+    try:
+        with db.reader() as con:
+            for pid, segment_id, file, first, count in con.execute(QUERIES["cold.slices_all"]):
+                try:
+                    cols = store.segment(segment_id, file).slice(first, count)
+                except (OSError, ValueError) as exc:
+                    problems.append(f"segment {segment_id}: {exc}")
+                    continue
+                keys = list(zip(cols["month"].tolist(), cols["id"].tolist()))
+                if len(keys) != count or set(cols["patient_id"].tolist()) != {pid} or keys != sorted(keys):
+                    problems.append(f"patient {pid}: segment {segment_id} rows {first}..{first + count} do not match")
+    finally:
+        store.close()
+    return problems
+
+
+class MoveThread(threading.Thread):
+    # Runs move_cold() every `interval` seconds, the first time after
+    # `delay`. on_done(result or exception) is called from this thread.
+    def __init__(self, db, months=COLD_AFTER_MONTHS, interval=MOVE_INTERVAL, on_done=None, delay=0.0):
+        super().__init__(name="healthcare-cold-move", daemon=True)
+        self.db = db
+        self.months = months
+        self.interval = interval
+        self.on_done = on_done
+        self.delay = delay
+        self.last = None
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        wait = self.delay
+        while not self._stopping.wait(wait):
+            try:
+                result = move_cold(self.db, months=self.months, cancel=self._stopping)
+            except Exception as exc:
+                result = exc
+            self.last = result
+            if self.on_done:
+                self.on_done(result)
+            wait = self.interval
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Move old reports to columnar segment files")
+    parser.add_argument("db", nargs="?", default=DB_FILE)
+    parser.add_argument("--months", type=int, default=COLD_AFTER_MONTHS, help="keep this many months live")
+    parser.add_argument("--before", metavar="YYYY-MM", help="move reports before this month instead")
+    parser.add_argument("--list", action="store_true", help="list segments")
+    parser.add_argument("--check", action="store_true", help="check the index against the segment files")
+    args = parser.parse_args(argv)
+    db = Database(args.db, readers=1)
+    status = 0
+    try:
+        migrate(db)
+        if args.list:
+            with db.reader() as con:
+                for sid, file, rows, before, created in con.execute(QUERIES["cold.segments"]):
+                    print(f"{sid:4}  {created}  {rows:>10,} reports before {before}  {file}")
+        elif args.check:
+            problems = check(db)
+            for problem in problems:
+                print(problem)
+            print(f"{len(problems)} problems" if problems else "cold tier is consistent", file=sys.stderr)
+            status = 1 if problems else 0
+        else:
+            print(move_cold(db, args.before, args.months).summary(), file=sys.stderr)
+    finally:
+        db.close()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1179 @@
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+from healthcare.instrument import Tracer, current_handler, register_internal
+
+DB_FILE = "healthcare_full.db"
+SLOW_LOG_FILE = "healthcare_slow_sql.log"
+READER_POOL_SIZE = 3
+STATEMENT_CACHE_SIZE = 256
+
+# Applied to every connection when it is opened.
+PRAGMAS = (
+    ("auto_vacuum", "INCREMENTAL"),   # only takes effect on a new database
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -16000),       # negative = KiB, ~16 MB per connection
+    ("mmap_size", 256 * 1024 * 1024),
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", 5000),
+    ("foreign_keys", "ON"),           # reports and reminders cascade with their patient
+)
+
+# Statements are attributed to whoever called into this module.
+register_internal(__file__)
+
+
+def now_str():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def month_str():
+    return datetime.now().strftime("%Y-%m")
+
+
+def parse_bp(bp_text):
+    if not bp_text:
+        return None, None
+    try:
+        if "/" in bp_text:
+            a, b = bp_text.split("/", 1)
+            return int(a.strip()), int(b.strip())
+        else:
+            return int(bp_text.strip()), None
+    except:
+        return None, None
+
+
+# ---- Query latency ----
+class QueryStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_sql = {}
+
+    def record(self, sql, elapsed):
+        key = " ".join(sql.split())
+        with self._lock:
+            st = self._by_sql.get(key)
+            if st is None:
+                self._by_sql[key] = [1, elapsed, elapsed]
+            else:
+                st[0] += 1
+                st[1] += elapsed
+                if elapsed > st[2]:
+                    st[2] = elapsed
+
+    def snapshot(self):
+        with self._lock:
+            rows = [(sql, n, total, worst) for sql, (n, total, worst) in self._by_sql.items()]
+        rows.sort(key=lambda r: -r[2])
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._by_sql.clear()
+
+    def report(self, limit=10):
+        lines = []
+        for sql, n, total, worst in self.snapshot()[:limit]:
+            lines.append(f"{n:6} x  avg {total / n * 1000:7.3f} ms  max {worst * 1000:7.3f} ms  {sql[:70]}")
+        return "\n".join(lines) or "No queries recorded."
+
+
+class TimedCursor(sqlite3.Cursor):
+    # Times each statement from execute() through the fetch*() calls that read
+    # its rows, and reports it (with the row count and calling handler) when
+    # the cursor moves on to another statement, is closed or is freed. Rows
+    # read by iterating the cursor are not counted, only DML rowcounts and
+    # fetch*() results.
+    _trace = None
+
+    def execute(self, sql, params=()):
+        self._finish()
+        handler = current_handler()
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self._trace = [sql, params, time.perf_counter() - t0, None, handler]
+
+    def executemany(self, sql, seq_of_params):
+        self._finish()
+        handler = current_handler()
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            self._trace = [sql, None, time.perf_counter() - t0, None, handler]
+
+    def _fetched(self, t0, n):
+        if self._trace is not None:
+            self._trace[2] += time.perf_counter() - t0
+            self._trace[3] = (self._trace[3] or 0) + n
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(t0, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        t0 = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(t0, len(rows))
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(t0, len(rows))
+        return rows
+
+    def _finish(self):
+        trace, self._trace = self._trace, None
+        if trace is None:
+            return
+        sql, params, elapsed, rows, handler = trace
+        if rows is None and self.rowcount >= 0:
+            rows = self.rowcount
+        con = self.connection
+        if con.stats is not None:
+            con.stats.record(sql, elapsed)
+        if con.tracer is not None:
+            con.tracer.record(con, sql, params, elapsed, rows, handler)
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class TimedConnection(sqlite3.Connection):
+    stats = None
+    tracer = None
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+class _BackupSteps:
+    # sqlite3's Connection.backup() copies to the end in one call. This runs
+    # it on a helper thread that stops after every step, so step() copies
+    # the next pages with whatever the caller holds around it; abort()
+    # abandons the copy.
+    def __init__(self, source, target, pages):
+        self.finished = False
+        self._go = queue.Queue()
+        self._out = queue.Queue()
+        self._thread = threading.Thread(target=self._run, args=(source, target, pages),
+                                        name="healthcare-backup", daemon=True)
+        self._thread.start()
+
+    def _run(self, source, target, pages):
+        try:
+            if self._go.get():
+                source.backup(target, pages=pages, progress=self._stepped)
+        except BaseException as exc:
+            self._out.put(exc)
+        else:
+            self._out.put(None)
+
+    def _stepped(self, status, remaining, total):
+        self._out.put((total - remaining, total))
+        # After the last step backup() only finishes up; the caller's step()
+        # waits for that too.
+        if remaining and not self._go.get():
+            raise _BackupAborted()
+
+    def _result(self):
+        out = self._out.get()
+        if isinstance(out, BaseException):
+            self.finished = True
+            self._thread.join()
+            raise out
+        return out
+
+    def step(self):
+        # (pages copied, total pages) once the next step is done.
+        self._go.put(True)
+        copied, total = self._result()
+        if copied == total:
+            self._result()
+            self.finished = True
+            self._thread.join()
+        return copied, total
+
+    def abort(self):
+        self._go.put(False)
+        self._thread.join()
+        self.finished = True
+
+
+class _BackupAborted(Exception):
+    pass
+
+
+# ---- Connection pool ----
+class Database:
+    # One long-lived writer plus a small pool of readers. WAL lets the readers
+    # run while the writer holds a transaction open.
+    def __init__(self, path=DB_FILE, readers=READER_POOL_SIZE):
+        self.path = path
+        self.stats = QueryStats()
+        self.tracer = Tracer()
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._on_commit = []
+        self._writer = self._connect()
+        self._readers = queue.LifoQueue()
+        self._all = [self._writer]
+        if path == ":memory:":
+            readers = 0   # every :memory: connection is its own database
+        self.reader_count = readers
+        for _ in range(readers):
+            con = self._connect()
+            self._all.append(con)
+            self._readers.put(con)
+
+    def _connect(self):
+        con = sqlite3.connect(self.path, factory=TimedConnection, check_same_thread=False,
+                              cached_statements=STATEMENT_CACHE_SIZE)
+        con.stats = self.stats
+        con.tracer = self.tracer
+        for name, value in PRAGMAS:
+            con.execute(f"PRAGMA {name}={value}")
+        return con
+
+    @contextmanager
+    def writer(self):
+        # A writer() block opened inside another joins the outer transaction;
+        # only the outermost block commits or rolls back.
+        with self._write_lock:
+            con = self._writer
+            self._write_depth += 1
+            try:
+                if self._write_depth > 1:
+                    yield con
+                    return
+                try:
+                    yield con
+                except BaseException:
+                    del self._on_commit[:]
+                    con.rollback()
+                    raise
+                else:
+                    con.commit()
+                    hooks, self._on_commit = self._on_commit, []
+                    for fn, args in hooks:
+                        fn(*args)
+            finally:
+                self._write_depth -= 1
+
+    def after_commit(self, fn, *args):
+        # For in-memory state that must follow the database: inside a writer()
+        # block fn(*args) waits for the outermost commit and is dropped on
+        # rollback; anywhere else it runs at once. A lock held by another
+        # thread means we are not in its transaction.
+        if self._write_lock.acquire(blocking=False):
+            try:
+                if self._write_depth:
+                    self._on_commit.append((fn, args))
+                    return
+            finally:
+                self._write_lock.release()
+        fn(*args)
+
+    @contextmanager
+    def savepoint(self, name):
+        # Inside writer(): a unit that rolls back alone if the block raises,
+        # taking its after_commit() hooks with it.
+        con = self._writer
+        mark = len(self._on_commit)
+        con.execute(f"SAVEPOINT {name}")
+        try:
+            yield con
+        except BaseException:
+            con.execute(f"ROLLBACK TO {name}")
+            con.execute(f"RELEASE {name}")
+            del self._on_commit[mark:]
+            raise
+        con.execute(f"RELEASE {name}")
+
+    def backup(self, target, pages=64, pause=0.005, progress=None):
+        # Online copy into the sqlite3 connection `target`, `pages` pages per
+        # step. It runs through the writer connection so our own writes
+        # between steps are carried into the copy instead of restarting it,
+        # and the write lock is held for one step at a time. progress(copied,
+        # total) is called after each step and may raise to abort. Returns
+        # (steps, longest step in seconds).
+        steps, longest = 0, 0.0
+        copy = _BackupSteps(self._writer, target, pages)
+        try:
+            while not copy.finished:
+                self._write_lock.acquire()
+                try:
+                    started = time.perf_counter()
+                    copied, total = copy.step()
+                    longest = max(longest, time.perf_counter() - started)
+                finally:
+                    self._write_lock.release()
+                steps += 1
+                if progress:
+                    progress(copied, total)
+                if not copy.finished:
+                    time.sleep(pause)
+        finally:
+            if not copy.finished:
+                self._write_lock.acquire()
+                try:
+                    copy.abort()
+                finally:
+                    self._write_lock.release()
+        return steps, longest
+
+    @contextmanager
+    def reader(self):
+        if not self.reader_count:
+            with self._write_lock:
+                yield self._writer
+            return
+        con = self._readers.get()
+        try:
+            yield con
+        finally:
+            self._readers.put(con)
+
+    def close(self):
+        with self._write_lock:
+            try:
+                self._writer.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            for con in self._all:
+                con.close()
+            self._all = []
+        self.tracer.close()
+
+
+_db = None
+
+
+def get_db():
+    global _db
+    if _db is None:
+        _db = Database(DB_FILE)
+        _db.tracer.enable_slow_log(SLOW_LOG_FILE)
+    return _db
+
+
+def close_db():
+    global _db
+    if _db is not None:
+        _db.close()
+        _db = None
+
+
+# ---- Schema migrations ----
+# Each step is idempotent so it is safe to re-run against a database that was
+# created before schema_version existed.
+def _migration_base_tables(con):
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS users(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE,
+            password TEXT,
+            role TEXT DEFAULT 'patient'
+        );
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS patients(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            age INTEGER,
+            gender TEXT,
+            contact TEXT,
+            created_at TEXT
+        );
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS reports(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            bp_systolic INTEGER,
+            bp_diastolic INTEGER,
+            sugar REAL,
+            uric_acid REAL,
+            created_at TEXT,
+            FOREIGN KEY(patient_id) REFERENCES patients(id)
+        );
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS diseases(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE,
+            details TEXT,
+            symptoms TEXT,
+            treatable INTEGER,
+            medicines TEXT,
+            hospitals TEXT,
+            notes TEXT
+        );
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS reminders(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            patient_id INTEGER,
+            medicine TEXT,
+            remind_at TEXT,
+            done INTEGER DEFAULT 0,
+            created_at TEXT
+        );
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS hospitals(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            city TEXT,
+            contact TEXT
+        );
+    """)
+
+
+def _migration_hot_query_indexes(con):
+    # (patient_id) keeps rows in id order per patient, (patient_id, month)
+    # serves the month-ordered compare/chart/export queries.
+    con.execute("CREATE INDEX IF NOT EXISTS idx_reports_patient ON reports(patient_id)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_reports_patient_month ON reports(patient_id, month)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_diseases_lower_name ON diseases(lower(name))")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_reminders_user_time ON reminders(user_id, remind_at)")
+
+
+def _migration_table_versions(con):
+    # Change counters bumped by triggers, so in-memory caches can tell when
+    # another connection has modified a table.
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS table_versions(
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            paused INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+    con.execute("INSERT OR IGNORE INTO table_versions(name, version) VALUES ('diseases', 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        con.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_diseases_version_{event.lower()} AFTER {event} ON diseases
+            BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE name = 'diseases';
+            END;
+        """)
+
+
+def _migration_disease_fts(con):
+    # External-content FTS5 index over the diseases table, kept in sync by
+    # triggers. Name matches weigh most, then symptoms, details and notes.
+    con.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS diseases_fts USING fts5(
+            name, details, symptoms, notes,
+            content='diseases', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        );
+    """)
+    con.execute("CREATE VIRTUAL TABLE IF NOT EXISTS diseases_fts_vocab USING fts5vocab(diseases_fts, 'row')")
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_diseases_fts_insert AFTER INSERT ON diseases BEGIN
+            INSERT INTO diseases_fts(rowid, name, details, symptoms, notes)
+            VALUES (new.id, new.name, new.details, new.symptoms, new.notes);
+        END;
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_diseases_fts_delete AFTER DELETE ON diseases BEGIN
+            INSERT INTO diseases_fts(diseases_fts, rowid, name, details, symptoms, notes)
+            VALUES ('delete', old.id, old.name, old.details, old.symptoms, old.notes);
+        END;
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_diseases_fts_update AFTER UPDATE ON diseases BEGIN
+            INSERT INTO diseases_fts(diseases_fts, rowid, name, details, symptoms, notes)
+            VALUES ('delete', old.id, old.name, old.details, old.symptoms, old.notes);
+            INSERT INTO diseases_fts(rowid, name, details, symptoms, notes)
+            VALUES (new.id, new.name, new.details, new.symptoms, new.notes);
+        END;
+    """)
+    con.execute("INSERT INTO diseases_fts(diseases_fts) VALUES ('rebuild')")
+    con.execute("INSERT INTO diseases_fts(diseases_fts, rank) VALUES ('rank', 'bm25(10.0, 2.0, 4.0, 1.0)')")
+
+
+def _migration_patient_summary(con):
+    # Imported here: the rollup's band rules live with the analytics code,
+    # which itself imports this module.
+    from healthcare.summary import create_summary, rebuild_summary
+    create_summary(con)
+    rebuild_summary(con)
+
+
+def _migration_reminder_schedule(con):
+    # Adds a sortable due_at (epoch seconds) next to the free-text remind_at,
+    # normalizing what can be parsed; anything else stays unscheduled.
+    from healthcare.reminders import normalize_remind_at
+    columns = {row[1] for row in con.execute("PRAGMA table_info(reminders)")}
+    if "due_at" not in columns:
+        con.execute("ALTER TABLE reminders ADD COLUMN due_at INTEGER")
+    if "repeat" not in columns:
+        con.execute("ALTER TABLE reminders ADD COLUMN repeat TEXT")
+    for rid, text in con.execute("SELECT id, remind_at FROM reminders WHERE due_at IS NULL").fetchall():
+        try:
+            con.execute("UPDATE reminders SET remind_at=?, due_at=? WHERE id=?", normalize_remind_at(text) + (rid,))
+        except ValueError:
+            pass
+    # Only pending reminders are ever looked up by time.
+    con.execute("CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(due_at) WHERE done = 0")
+    con.execute("INSERT OR IGNORE INTO table_versions(name, version) VALUES ('reminders', 0)")
+    create_version_triggers(con, "reminders")
+
+
+def create_version_triggers(con, table):
+    # The counter is left alone while the table is paused (pause_triggers).
+    add_paused_column(con)
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        con.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()} AFTER {event} ON {table}
+            BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE name = '{table}' AND NOT paused;
+            END;
+        """)
+
+
+def add_paused_column(con):
+    # Databases from before the flag; triggers that read it need it first.
+    if "paused" not in [row[1] for row in con.execute("PRAGMA table_info(table_versions)")]:
+        con.execute("ALTER TABLE table_versions ADD COLUMN paused INTEGER NOT NULL DEFAULT 0")
+
+
+def pause_triggers(con, table, paused=True):
+    # For bulk writes inside one writer transaction: while a table is paused
+    # its per-row triggers (the change counter, and for reports the summary
+    # rollup) do nothing, and the writer maintains both itself. A row
+    # update, not DDL, so the schema and every connection's prepared
+    # statements stay valid; other connections never see the flag set, and
+    # a rollback clears it.
+    con.execute(QUERIES["versions.pause"], (1 if paused else 0, table))
+
+
+def drop_version_triggers(con, table):
+    # For bulk writes: bump the counter once afterwards with versions.bump.
+    for event in ("insert", "update", "delete"):
+        con.execute(f"DROP TRIGGER IF EXISTS trg_{table}_version_{event}")
+
+
+def _migration_pausable_triggers(con):
+    # Counter and rollup triggers that bulk writers pause with a flag
+    # instead of dropping and re-creating them.
+    from healthcare.summary import create_triggers
+    add_paused_column(con)
+    for (name,) in con.execute("SELECT name FROM table_versions").fetchall():
+        if con.execute("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name=?",
+                       (f"trg_{name}_version_insert",)).fetchone():
+            drop_version_triggers(con, name)
+            create_version_triggers(con, name)
+    create_triggers(con)
+
+
+def _migration_list_versions(con):
+    # Change counters for the patient and report lists, so an open view can
+    # tell whether it is stale without re-reading its rows.
+    for table in ("patients", "reports"):
+        con.execute("INSERT OR IGNORE INTO table_versions(name, version) VALUES (?, 0)", (table,))
+        create_version_triggers(con, table)
+
+
+def _rebuild_table(con, table, old, new):
+    # SQLite cannot change a column's foreign key in place: the table is
+    # created again from its stored definition with `old` replaced by `new`,
+    # the rows copied over and its indexes, triggers and AUTOINCREMENT
+    # counter put back.
+    sql = con.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()[0]
+    if new in sql:
+        return
+    head = f"CREATE TABLE {table}("
+    assert sql.startswith(head) and old in sql, f"unexpected schema for {table}: {sql}"
+    extras = [row[0] for row in con.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name=? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (table,))]
+    seq = con.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (table,)).fetchone()
+    con.execute(f"CREATE TABLE {table}_new(" + sql[len(head):].replace(old, new))
+    con.execute(f"INSERT INTO {table}_new SELECT * FROM {table}")
+    con.execute(f"DROP TABLE {table}")
+    con.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    for extra in extras:
+        con.execute(extra)
+    if seq:
+        con.execute("DELETE FROM sqlite_sequence WHERE name=?", (table,))
+        con.execute("INSERT INTO sqlite_sequence(name, seq) VALUES (?,?)", (table, seq[0]))
+
+
+def _migration_cascade_deletes(con):
+    # Deleting a patient now takes their reports and reminders with it
+    # (foreign_keys is on for every connection). Rows that already point at
+    # a missing patient would fail the new constraint: orphan reports move
+    # to the archive, orphan reminders are detached from the patient.
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS patients_archive(
+            id INTEGER PRIMARY KEY,
+            name TEXT, age INTEGER, gender TEXT, contact TEXT, created_at TEXT,
+            archived_at TEXT
+        );
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS reports_archive(
+            id INTEGER PRIMARY KEY,
+            patient_id INTEGER, month TEXT,
+            bp_systolic INTEGER, bp_diastolic INTEGER, sugar REAL, uric_acid REAL,
+            created_at TEXT
+        );
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_reports_archive_patient ON reports_archive(patient_id)")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS reminders_archive(
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER, patient_id INTEGER, medicine TEXT, remind_at TEXT,
+            done INTEGER, created_at TEXT, due_at INTEGER, repeat TEXT
+        );
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_reminders_archive_patient ON reminders_archive(patient_id)")
+    orphans = "patient_id NOT IN (SELECT id FROM patients)"
+    con.execute(f"INSERT OR REPLACE INTO reports_archive SELECT id, patient_id, month, bp_systolic, bp_diastolic, "
+                f"sugar, uric_acid, created_at FROM reports WHERE {orphans}")
+    con.execute(f"DELETE FROM reports WHERE {orphans}")
+    con.execute(f"UPDATE reminders SET patient_id = NULL WHERE {orphans}")
+    _rebuild_table(con, "reports", "REFERENCES patients(id)", "REFERENCES patients(id) ON DELETE CASCADE")
+    _rebuild_table(con, "reminders", "patient_id INTEGER,",
+                   "patient_id INTEGER REFERENCES patients(id) ON DELETE CASCADE,")
+    # The cascade looks children up by patient; reports already has an index.
+    con.execute("CREATE INDEX IF NOT EXISTS idx_reminders_patient ON reminders(patient_id)")
+
+
+def _migration_cold_tier(con):
+    # Imported here like the summary: the tier's code imports this module.
+    from healthcare.coldstore import create_tables
+    create_tables(con)
+
+
+def _migration_anomaly_alerts(con):
+    # Per-patient detector state and the alerts it raises; the state starts
+    # empty, `python -m healthcare.anomaly --replay` backfills it.
+    from healthcare.anomaly import create_tables
+    create_tables(con)
+
+
+def _migration_patient_search(con):
+    # External-content FTS5 trigram index over patient name and contact for
+    # the patient search box: any substring of three or more characters,
+    # case-insensitive, is answered from the index.
+    con.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(
+            name, contact,
+            content='patients', content_rowid='id',
+            tokenize='trigram'
+        );
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_patients_fts_insert AFTER INSERT ON patients BEGIN
+            INSERT INTO patients_fts(rowid, name, contact) VALUES (new.id, new.name, new.contact);
+        END;
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_patients_fts_delete AFTER DELETE ON patients BEGIN
+            INSERT INTO patients_fts(patients_fts, rowid, name, contact)
+            VALUES ('delete', old.id, old.name, old.contact);
+        END;
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_patients_fts_update AFTER UPDATE OF name, contact ON patients BEGIN
+            INSERT INTO patients_fts(patients_fts, rowid, name, contact)
+            VALUES ('delete', old.id, old.name, old.contact);
+            INSERT INTO patients_fts(rowid, name, contact) VALUES (new.id, new.name, new.contact);
+        END;
+    """)
+    con.execute("INSERT INTO patients_fts(patients_fts) VALUES ('rebuild')")
+
+
+def _migration_hospital_directory(con):
+    # Specialty, city/specialty indexes and disease_hospitals, linked from
+    # the diseases' free-text hospital lists.
+    from healthcare.hospitals import create_tables
+    create_tables(con)
+
+
+def _migration_cold_last_month(con):
+    # cold_patients.last_month, so inactivity checks see moved reports;
+    # existing slices are read back from their segments.
+    from healthcare.coldstore import create_tables
+    create_tables(con)
+
+
+MIGRATIONS = [
+    (1, "base tables", _migration_base_tables),
+    (2, "indexes for hot queries", _migration_hot_query_indexes),
+    (3, "table change counters", _migration_table_versions),
+    (4, "full-text disease search", _migration_disease_fts),
+    (5, "per-patient summary rollup", _migration_patient_summary),
+    (6, "reminder due times", _migration_reminder_schedule),
+    (7, "patient and report change counters", _migration_list_versions),
+    (8, "cascading patient deletes and archive tables", _migration_cascade_deletes),
+    (9, "columnar history segments", _migration_cold_tier),
+    (10, "report anomaly state and alerts", _migration_anomaly_alerts),
+    (11, "patient trigram search", _migration_patient_search),
+    (12, "hospital directory and disease links", _migration_hospital_directory),
+    (13, "latest month of each cold slice", _migration_cold_last_month),
+    (14, "pausable counter and rollup triggers", _migration_pausable_triggers),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(con):
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version(
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT
+        );
+    """)
+    row = con.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(db):
+    applied = []
+    for version, description, step in MIGRATIONS:
+        with db.writer() as con:
+            con.execute("BEGIN IMMEDIATE")
+            # Re-read under the write lock: another process may have upgraded.
+            if schema_version(con) >= version:
+                continue
+            step(con)
+            con.execute("INSERT INTO schema_version(version, description, applied_at) VALUES (?,?,?)",
+                        (version, description, now_str()))
+            applied.append(version)
+    return applied
+
+
+def init_db(db):
+    # App launch path. PRAGMA user_version records the schema version the
+    # app last bootstrapped (migrated and seeded), so a current database costs
+    # one read and no write transaction. Returns True if it had to bootstrap.
+    with db.reader() as con:
+        if con.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return False
+    migrate(db)
+    seed_initial_data(db)
+    with db.writer() as con:
+        con.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+    return True
+
+
+# ---- Keyset pagination ----
+MAX_ID = 2 ** 63 - 1
+# Patient search counts matches only this far: enough to size the scrollbar,
+# cheap however common the searched text is.
+SEARCH_COUNT_CAP = 500
+
+
+class KeysetPager:
+    # Pages rows newest-first by id without OFFSET scans over row data.
+    # boundaries[p] is the smallest id on page p, so page p+1 is simply
+    # "id < boundaries[p]". A jump to an unseen page walks the id index from
+    # the nearest known boundary. Only a few pages are kept in memory.
+    #
+    # With a version_query (a table_versions counter) and a since_query (rows
+    # with id > ?), changes() tells whether the cache is stale and, when the
+    # only changes are new rows, returns just those; apply_changes() shifts
+    # them in. Ids only grow, so new rows always sort first.
+    def __init__(self, db, count_query, page_query, seek_query, params=(), page_size=100, max_pages=8,
+                 version_query=None, since_query=None):
+        self.db = db
+        self.count_sql = QUERIES[count_query]
+        self.page_sql = QUERIES[page_query]
+        self.seek_sql = QUERIES[seek_query]
+        self.version_sql = QUERIES[version_query] if version_query else None
+        self.since_sql = QUERIES[since_query] if since_query else None
+        self.params = tuple(params)
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.invalidate()
+
+    def invalidate(self):
+        self._count = None
+        self._boundaries = {}
+        self._pages = OrderedDict()
+        self.version = None   # counter value the cached rows are at least as new as
+        self.top_id = None    # newest id seen (page 0's first row)
+
+    def _stamp(self, con):
+        # Read before any rows, so a write racing with the load shows up as
+        # a change at the next changes() rather than being missed.
+        if self.version_sql and self.version is None:
+            self.version = con.execute(self.version_sql).fetchone()[0]
+
+    def count(self):
+        if self._count is None:
+            with self.db.reader() as con:
+                self._stamp(con)
+                self._count = con.execute(self.count_sql, self.params).fetchone()[0]
+        return self._count
+
+    def _boundary_before(self, con, p):
+        # Upper id bound (exclusive) for page p.
+        if p == 0:
+            return MAX_ID
+        if p - 1 in self._boundaries:
+            return self._boundaries[p - 1]
+        known = [k for k in self._boundaries if k < p - 1]
+        start = max(known) if known else -1
+        bound = self._boundaries[start] if start >= 0 else MAX_ID
+        skip = (p - 1 - start) * self.page_size - 1
+        row = con.execute(self.seek_sql, self.params + (bound, skip)).fetchone()
+        if row is None:
+            return None
+        self._boundaries[p - 1] = row[0]
+        return row[0]
+
+    def page(self, p):
+        rows = self._pages.get(p)
+        if rows is not None:
+            self._pages.move_to_end(p)
+            return rows
+        with self.db.reader() as con:
+            self._stamp(con)
+            bound = self._boundary_before(con, p)
+            if bound is None:
+                return []
+            rows = con.execute(self.page_sql, self.params + (bound, self.page_size)).fetchall()
+        if rows:
+            self._boundaries[p] = rows[-1][0]
+        if p == 0:
+            self.top_id = rows[0][0] if rows else 0
+        self._pages[p] = rows
+        while len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+        return rows
+
+    def rows(self, offset, limit, prefetch=1):
+        first = offset // self.page_size
+        last = (offset + limit - 1) // self.page_size
+        out = []
+        for p in range(first, last + 1):
+            out.extend(self.page(p))
+        for p in range(last + 1, last + 1 + prefetch):
+            if p * self.page_size < self.count():
+                self.page(p)
+        start = offset - first * self.page_size
+        return out[start:start + limit]
+
+    def changes(self):
+        # Reads only; safe on a worker thread. None if the counter has not
+        # moved, else (version, new rows newest first) when every counted
+        # change is a new row, or (version, None) when the cache must go.
+        if self.version_sql is None or self.version is None:
+            return (None, None)
+        with self.db.reader() as con:
+            con.execute("BEGIN")   # one snapshot for the counter and the rows
+            try:
+                version = con.execute(self.version_sql).fetchone()[0]
+                delta = version - self.version
+                if delta == 0:
+                    return None
+                if self.since_sql is None or self.top_id is None or not 0 < delta <= self.page_size:
+                    return (version, None)
+                rows = con.execute(self.since_sql, self.params + (self.top_id,)).fetchall()
+            finally:
+                con.rollback()
+        return (version, rows if len(rows) == delta else None)
+
+    def apply_changes(self, changes):
+        version, rows = changes
+        if rows is None:
+            self.invalidate()
+            return
+        for row in reversed(rows):
+            self.insert(row)
+        self.version = version
+
+    def insert(self, row):
+        # A new row goes on top of page 0; cached pages that follow on from
+        # page 0 shift down by one, the rest are dropped.
+        if self._count is not None:
+            self._count += 1
+        if self.top_id is not None:
+            self.top_id = max(self.top_id, row[0])
+        carry, p = [row], 0
+        while carry and p in self._pages:
+            rows = carry + self._pages[p]
+            self._pages[p], carry = rows[:self.page_size], rows[self.page_size:]
+            self._boundaries[p] = self._pages[p][-1][0]
+            p += 1
+        self._drop_from(p)
+
+    def delete(self, row_id):
+        # A row this connection deleted: pages wholly above it stay, the one
+        # holding it and everything after are re-read on demand.
+        if self._count is not None:
+            self._count = max(0, self._count - 1)
+        if self.version is not None:
+            self.version += 1   # our own change; changes() should not count it
+        keep = [p for p, bound in self._boundaries.items() if bound > row_id]
+        self._drop_from(max(keep) + 1 if keep else 0)
+
+    def _drop_from(self, p):
+        for q in [q for q in self._boundaries if q >= p]:
+            del self._boundaries[q]
+        for q in [q for q in self._pages if q >= p]:
+            del self._pages[q]
+
+
+# ---- Shipped queries ----
+# Handlers look their SQL up here so check_query_plans() covers exactly what
+# the app runs.
+QUERIES = {
+    "patients.insert": "INSERT INTO patients(name, age, gender, contact, created_at) VALUES (?,?,?,?,?)",
+    "patients.count": "SELECT COUNT(*) FROM patients",
+    "patients.ids": "SELECT id FROM patients",
+    "patients.names": "SELECT id, name FROM patients WHERE id IN (SELECT value FROM json_each(?))",
+    "patients.get": "SELECT id,name,age,gender,contact,created_at FROM patients WHERE id=?",
+    "patients.page": "SELECT id,name,age,gender,contact FROM patients WHERE id < ? ORDER BY id DESC LIMIT ?",
+    "patients.seek": "SELECT id FROM patients WHERE id < ? ORDER BY id DESC LIMIT 1 OFFSET ?",
+    "patients.delete": "DELETE FROM patients WHERE id=?",
+    "patients.version": "SELECT version FROM table_versions WHERE name='patients'",
+    "patients.since": "SELECT id,name,age,gender,contact FROM patients WHERE id > ? ORDER BY id DESC",
+    "patients.search": "SELECT p.id,p.name,p.age,p.gender,p.contact FROM patients_fts f JOIN patients p ON p.id = f.rowid WHERE patients_fts MATCH ? AND f.rowid < ? ORDER BY f.rowid DESC LIMIT ?",
+    "patients.search_count": f"SELECT COUNT(*) FROM (SELECT 1 FROM patients_fts WHERE patients_fts MATCH ? LIMIT {SEARCH_COUNT_CAP})",
+    "patients.search_seek": "SELECT rowid FROM patients_fts WHERE patients_fts MATCH ? AND rowid < ? ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+    "patients.search_since": "SELECT p.id,p.name,p.age,p.gender,p.contact FROM patients_fts f JOIN patients p ON p.id = f.rowid WHERE patients_fts MATCH ? AND f.rowid > ? ORDER BY f.rowid DESC",
+    "patients.inactive": "SELECT p.id FROM patients p LEFT JOIN patient_summary s ON s.patient_id = p.id WHERE coalesce(s.latest_month, '') < ? AND coalesce(p.created_at, '') < ? AND coalesce((SELECT MAX(last_month) FROM cold_patients c WHERE c.patient_id = p.id), '') < ? ORDER BY p.id",
+    "reports.insert": "INSERT INTO reports(patient_id, month, bp_systolic, bp_diastolic, sugar, uric_acid, created_at) VALUES (?,?,?,?,?,?,?)",
+    "reports.count": "SELECT COUNT(*) FROM reports WHERE patient_id=?",
+    "reports.page": "SELECT id, month, bp_systolic, bp_diastolic, sugar, uric_acid, created_at FROM reports WHERE patient_id=? AND id < ? ORDER BY id DESC LIMIT ?",
+    "reports.export_all": "SELECT id, patient_id, month, bp_systolic, bp_diastolic, sugar, uric_acid, created_at FROM reports WHERE month BETWEEN ? AND ? ORDER BY patient_id, month",
+    "reports.export_patients": "SELECT id, patient_id, month, bp_systolic, bp_diastolic, sugar, uric_acid, created_at FROM reports WHERE patient_id IN (SELECT value FROM json_each(?)) AND month BETWEEN ? AND ? ORDER BY patient_id, month",
+    "reports.latest_two": "SELECT r.id, r.patient_id, CAST(substr(r.month, 1, 4) AS INTEGER) * 100 + CAST(substr(r.month, 6, 2) AS INTEGER), r.month, r.bp_systolic, r.bp_diastolic, r.sugar, r.uric_acid FROM patients p JOIN reports r ON r.id IN (SELECT id FROM reports WHERE patient_id = p.id ORDER BY month DESC, id DESC LIMIT 2)",
+    "reports.max_id": "SELECT coalesce(MAX(id), 0) FROM reports",
+    "reports.delete": "DELETE FROM reports WHERE id=?",
+    "reports.patient": "SELECT patient_id FROM reports WHERE id=?",
+    "reports.version": "SELECT version FROM table_versions WHERE name='reports'",
+    "diseases.by_name": "SELECT details, symptoms, treatable, medicines, hospitals, notes FROM diseases WHERE lower(name)=?",
+    "diseases.id_by_name": "SELECT id FROM diseases WHERE lower(name)=?",
+    "diseases.update": "UPDATE diseases SET details=?, symptoms=?, treatable=?, medicines=?, hospitals=? WHERE lower(name)=?",
+    "diseases.insert": "INSERT INTO diseases(name, details, symptoms, treatable, medicines, hospitals, notes) VALUES(?,?,?,?,?,?,?)",
+    "diseases.symptoms": "SELECT id, name, details, symptoms FROM diseases",
+    "diseases.symptoms_by_name": "SELECT id, name, details, symptoms FROM diseases WHERE lower(name)=?",
+    "diseases.version": "SELECT version FROM table_versions WHERE name='diseases'",
+    "diseases.fts": "SELECT d.name, d.details FROM diseases_fts JOIN diseases d ON d.id = diseases_fts.rowid WHERE diseases_fts MATCH ? ORDER BY rank LIMIT ?",
+    "diseases.fts_vocab": "SELECT term FROM diseases_fts_vocab",
+    "versions.bump": "UPDATE table_versions SET version = version + ? WHERE name = ?",
+    "versions.pause": "UPDATE table_versions SET paused = ? WHERE name = ?",
+    "summary.by_patient": "SELECT * FROM patient_summary WHERE patient_id=?",
+    "reminders.insert": "INSERT INTO reminders(user_id, patient_id, medicine, remind_at, due_at, repeat, created_at) VALUES (?,?,?,?,?,?,?)",
+    "reminders.by_user": "SELECT medicine, remind_at, done, repeat FROM reminders WHERE user_id=? ORDER BY remind_at ASC",
+    "reminders.version": "SELECT version FROM table_versions WHERE name='reminders'",
+    "reminders.window": "SELECT id, due_at FROM reminders WHERE done = 0 AND due_at > ? AND due_at <= ? ORDER BY due_at",
+    "reminders.next_after": "SELECT MIN(due_at) FROM reminders WHERE done = 0 AND due_at > ?",
+    "reminders.due_rows": "SELECT id, user_id, patient_id, medicine, remind_at, due_at, repeat FROM reminders WHERE id IN (SELECT value FROM json_each(?)) AND done = 0",
+    "reminders.reschedule": "UPDATE reminders SET remind_at=?, due_at=? WHERE id=?",
+    "reminders.mark_done": "UPDATE reminders SET done=1 WHERE id=?",
+    # Hospital directory (healthcare.hospitals). Lookups are keyset pages
+    # newest first: all hospitals, a city, a city and specialty, a disease.
+    "hospitals.version": "SELECT SUM(version) FROM table_versions WHERE name IN ('hospitals', 'disease_hospitals', 'diseases')",
+    "hospitals.count": "SELECT COUNT(*) FROM hospitals",
+    "hospitals.page": "SELECT id,name,city,specialty,contact FROM hospitals WHERE id < ? ORDER BY id DESC LIMIT ?",
+    "hospitals.seek": "SELECT id FROM hospitals WHERE id < ? ORDER BY id DESC LIMIT 1 OFFSET ?",
+    "hospitals.city_count": "SELECT COUNT(*) FROM hospitals WHERE city = ? COLLATE NOCASE",
+    "hospitals.city_page": "SELECT id,name,city,specialty,contact FROM hospitals WHERE city = ? COLLATE NOCASE AND id < ? ORDER BY id DESC LIMIT ?",
+    "hospitals.city_seek": "SELECT id FROM hospitals WHERE city = ? COLLATE NOCASE AND id < ? ORDER BY id DESC LIMIT 1 OFFSET ?",
+    "hospitals.specialty_count": "SELECT COUNT(*) FROM hospitals WHERE city = ? COLLATE NOCASE AND specialty = ? COLLATE NOCASE",
+    "hospitals.specialty_page": "SELECT id,name,city,specialty,contact FROM hospitals WHERE city = ? COLLATE NOCASE AND specialty = ? COLLATE NOCASE AND id < ? ORDER BY id DESC LIMIT ?",
+    "hospitals.specialty_seek": "SELECT id FROM hospitals WHERE city = ? COLLATE NOCASE AND specialty = ? COLLATE NOCASE AND id < ? ORDER BY id DESC LIMIT 1 OFFSET ?",
+    "hospitals.disease_count": "SELECT COUNT(*) FROM disease_hospitals WHERE disease_id = (SELECT id FROM diseases WHERE lower(name) = ?)",
+    "hospitals.disease_page": "SELECT h.id,h.name,h.city,h.specialty,h.contact FROM disease_hospitals dh JOIN hospitals h ON h.id = dh.hospital_id WHERE dh.disease_id = (SELECT id FROM diseases WHERE lower(name) = ?) AND dh.hospital_id < ? ORDER BY dh.hospital_id DESC LIMIT ?",
+    "hospitals.disease_seek": "SELECT hospital_id FROM disease_hospitals WHERE disease_id = (SELECT id FROM diseases WHERE lower(name) = ?) AND hospital_id < ? ORDER BY hospital_id DESC LIMIT 1 OFFSET ?",
+    "hospitals.cities": "SELECT city FROM hospitals WHERE city IS NOT NULL GROUP BY city COLLATE NOCASE ORDER BY city COLLATE NOCASE",
+    "hospitals.specialties": "SELECT specialty FROM hospitals WHERE city = ? COLLATE NOCASE AND specialty IS NOT NULL GROUP BY specialty COLLATE NOCASE ORDER BY specialty COLLATE NOCASE",
+    "hospitals.by_name": "SELECT id FROM hospitals WHERE name = ? COLLATE NOCASE",
+    "hospitals.names_by_prefix": "SELECT DISTINCT name COLLATE NOCASE FROM hospitals WHERE name >= ? COLLATE NOCASE AND name < ? COLLATE NOCASE LIMIT 2",
+    "hospitals.exists": "SELECT 1 FROM hospitals WHERE name = ? COLLATE NOCASE AND coalesce(city, '') = ? COLLATE NOCASE",
+    "hospitals.insert": "INSERT INTO hospitals(name, city, specialty, contact) VALUES (?,?,?,?)",
+    "hospitals.clear": "DELETE FROM hospitals",
+    "diseases.hospital_text": "SELECT id, hospitals FROM diseases WHERE coalesce(hospitals, '') <> ''",
+    "disease_hospitals.clear": "DELETE FROM disease_hospitals WHERE disease_id = ?",
+    "disease_hospitals.insert": "INSERT OR IGNORE INTO disease_hospitals(disease_id, hospital_id) VALUES (?, ?)",
+    "purge.count_reports": "SELECT COUNT(*) FROM reports WHERE patient_id IN (SELECT value FROM json_each(?))",
+    "purge.count_reminders": "SELECT COUNT(*) FROM reminders WHERE patient_id IN (SELECT value FROM json_each(?))",
+    "purge.archive_patients": "INSERT OR REPLACE INTO patients_archive(id, name, age, gender, contact, created_at, archived_at) SELECT id, name, age, gender, contact, created_at, ? FROM patients WHERE id IN (SELECT value FROM json_each(?))",
+    "purge.archive_reports": "INSERT OR REPLACE INTO reports_archive(id, patient_id, month, bp_systolic, bp_diastolic, sugar, uric_acid, created_at) SELECT id, patient_id, month, bp_systolic, bp_diastolic, sugar, uric_acid, created_at FROM reports WHERE patient_id IN (SELECT value FROM json_each(?))",
+    "purge.archive_reminders": "INSERT OR REPLACE INTO reminders_archive(id, user_id, patient_id, medicine, remind_at, done, created_at, due_at, repeat) SELECT id, user_id, patient_id, medicine, remind_at, done, created_at, due_at, repeat FROM reminders WHERE patient_id IN (SELECT value FROM json_each(?))",
+    "purge.drop_summaries": "DELETE FROM patient_summary WHERE patient_id IN (SELECT value FROM json_each(?))",
+    "purge.count_cold": "SELECT coalesce(SUM(count), 0) FROM cold_patients WHERE patient_id IN (SELECT value FROM json_each(?))",
+    "purge.archive_cold": "INSERT OR REPLACE INTO reports_archive(id, patient_id, month, bp_systolic, bp_diastolic, sugar, uric_acid, created_at) VALUES (?,?,?,?,?,?,?,?)",
+    # ON DELETE CASCADE removes the patients' reports and reminders.
+    "purge.delete_patients": "DELETE FROM patients WHERE id IN (SELECT value FROM json_each(?))",
+    "cold.candidates": "SELECT id, patient_id, month, bp_systolic, bp_diastolic, sugar, uric_acid, created_at FROM reports WHERE month < ? ORDER BY patient_id, month, id",
+    "cold.verify": "SELECT id, patient_id, month, bp_systolic, bp_diastolic, sugar, uric_acid, created_at FROM reports WHERE patient_id IN (SELECT value FROM json_each(?)) AND month < ? ORDER BY patient_id, month, id",
+    "cold.delete_reports": "DELETE FROM reports WHERE id IN (SELECT value FROM json_each(?))",
+    "cold.insert_segment": "INSERT INTO cold_segments(file, rows, before_month, created_at) VALUES (?,?,?,?)",
+    "cold.delete_segment": "DELETE FROM cold_segments WHERE id=?",
+    "cold.segments": "SELECT id, file, rows, before_month, created_at FROM cold_segments ORDER BY id",
+    "cold.insert_patient": "INSERT INTO cold_patients(patient_id, segment_id, first, count, last_month) VALUES (?,?,?,?,?)",
+    "cold.slices": "SELECT c.segment_id, s.file, c.first, c.count FROM cold_patients c JOIN cold_segments s ON s.id = c.segment_id WHERE c.patient_id=? ORDER BY c.segment_id",
+    "cold.slices_patients": "SELECT c.patient_id, c.segment_id, s.file, c.first, c.count FROM cold_patients c JOIN cold_segments s ON s.id = c.segment_id WHERE c.patient_id IN (SELECT value FROM json_each(?)) ORDER BY c.patient_id, c.segment_id",
+    "cold.slices_all": "SELECT c.patient_id, c.segment_id, s.file, c.first, c.count FROM cold_patients c JOIN cold_segments s ON s.id = c.segment_id ORDER BY c.patient_id, c.segment_id",
+    "cold.summary": "SELECT * FROM cold_summary WHERE patient_id=?",
+    "cold.patient_ids": "SELECT DISTINCT patient_id FROM cold_patients",
+    "history.rows": "SELECT id, month, bp_systolic, bp_diastolic, sugar, uric_acid, created_at FROM reports WHERE patient_id=? ORDER BY month, id",
+    # Changes with any insert or delete of the patient's reports (ids are
+    # never reused), a move to the cold tier, or an in-place value update.
+    "history.stamp": "SELECT COUNT(*), coalesce(MAX(id), 0), coalesce(SUM(id), 0), (SELECT coalesce(SUM(count), 0) FROM cold_patients WHERE patient_id=?), (SELECT bp_systolic_sum + bp_diastolic_sum + sugar_sum + uric_acid_sum FROM patient_summary WHERE patient_id=?) FROM reports WHERE patient_id=?",
+    "anomaly.state": "SELECT * FROM anomaly_state WHERE patient_id=?",
+    "anomaly.states": "SELECT * FROM anomaly_state WHERE patient_id IN (SELECT value FROM json_each(?))",
+    # An upsert updates the row in place (REPLACE would delete and reinsert it).
+    "anomaly.save": "INSERT INTO anomaly_state(patient_id, last_id, last_month, bp_systolic_n, bp_systolic_mean, bp_systolic_var, bp_systolic_band, bp_diastolic_n, bp_diastolic_mean, bp_diastolic_var, bp_diastolic_band, sugar_n, sugar_mean, sugar_var, sugar_band, uric_acid_n, uric_acid_mean, uric_acid_var, uric_acid_band) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?) ON CONFLICT(patient_id) DO UPDATE SET last_id=excluded.last_id, last_month=excluded.last_month, bp_systolic_n=excluded.bp_systolic_n, bp_systolic_mean=excluded.bp_systolic_mean, bp_systolic_var=excluded.bp_systolic_var, bp_systolic_band=excluded.bp_systolic_band, bp_diastolic_n=excluded.bp_diastolic_n, bp_diastolic_mean=excluded.bp_diastolic_mean, bp_diastolic_var=excluded.bp_diastolic_var, bp_diastolic_band=excluded.bp_diastolic_band, sugar_n=excluded.sugar_n, sugar_mean=excluded.sugar_mean, sugar_var=excluded.sugar_var, sugar_band=excluded.sugar_band, uric_acid_n=excluded.uric_acid_n, uric_acid_mean=excluded.uric_acid_mean, uric_acid_var=excluded.uric_acid_var, uric_acid_band=excluded.uric_acid_band",
+    "anomaly.since": "SELECT id, patient_id, month, bp_systolic, bp_diastolic, sugar, uric_acid FROM reports WHERE id > ? ORDER BY id",
+    "alerts.insert": "INSERT OR IGNORE INTO alerts(patient_id, report_id, month, metric, kind, value, baseline, score, band, previous_band, created_at) VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+    "alerts.version": "SELECT version FROM table_versions WHERE name='alerts'",
+    "alerts.open": "SELECT a.id, a.patient_id, p.name, a.report_id, a.month, a.metric, a.kind, a.value, a.baseline, a.score, a.band, a.previous_band, a.created_at FROM alerts a JOIN patients p ON p.id = a.patient_id WHERE a.acknowledged = 0 AND a.id > ? ORDER BY a.id DESC LIMIT ?",
+    "alerts.open_count": "SELECT COUNT(*) FROM alerts WHERE acknowledged = 0",
+    "alerts.by_patient": "SELECT a.id, a.patient_id, p.name, a.report_id, a.month, a.metric, a.kind, a.value, a.baseline, a.score, a.band, a.previous_band, a.created_at FROM alerts a JOIN patients p ON p.id = a.patient_id WHERE a.patient_id = ? ORDER BY a.id DESC LIMIT ?",
+    "alerts.acknowledge": "UPDATE alerts SET acknowledged = 1 WHERE id IN (SELECT value FROM json_each(?)) AND acknowledged = 0",
+    "import.create_stage": "CREATE TEMP TABLE IF NOT EXISTS import_stage(patient_id INTEGER, month TEXT, bp_systolic INTEGER, bp_diastolic INTEGER, sugar REAL, uric_acid REAL, created_at TEXT, PRIMARY KEY(patient_id, month)) WITHOUT ROWID",
+    "import.clear_stage": "DELETE FROM temp.import_stage",
+    "import.count_stage": "SELECT COUNT(*) FROM temp.import_stage",
+    "import.stage": "INSERT OR REPLACE INTO temp.import_stage(patient_id, month, bp_systolic, bp_diastolic, sugar, uric_acid, created_at) VALUES (?,?,?,?,?,?,?)",
+    # CROSS JOIN keeps the small stage table as the outer loop.
+    "import.update_existing": "UPDATE reports SET (bp_systolic, bp_diastolic, sugar, uric_acid, created_at) = (SELECT s.bp_systolic, s.bp_diastolic, s.sugar, s.uric_acid, s.created_at FROM temp.import_stage s WHERE s.patient_id=reports.patient_id AND s.month=reports.month) WHERE id IN (SELECT r.id FROM temp.import_stage s CROSS JOIN reports r ON r.patient_id=s.patient_id AND r.month=s.month)",
+    "import.insert_new": "INSERT INTO reports(patient_id, month, bp_systolic, bp_diastolic, sugar, uric_acid, created_at) SELECT patient_id, month, bp_systolic, bp_diastolic, sugar, uric_acid, created_at FROM temp.import_stage s WHERE NOT EXISTS (SELECT 1 FROM reports r WHERE r.patient_id=s.patient_id AND r.month=s.month)",
+}
+
+# Queries that read a whole table on purpose, and the table they may scan.
+FULL_SCAN_OK = {
+    "patients.count": "patients",
+    "patients.ids": "patients",
+    "patients.inactive": "p",
+    # Counts the capped list of index matches, not the table.
+    "patients.search_count": "(subquery-1)",
+    "reports.latest_two": "p",
+    "diseases.symptoms": "diseases",
+    "hospitals.count": "hospitals",
+    "hospitals.clear": "hospitals",
+    "diseases.hospital_text": "diseases",
+    "cold.candidates": "reports",
+    "cold.segments": "cold_segments",
+    "cold.slices_all": "c",
+    "cold.patient_ids": "cold_patients",
+    "import.clear_stage": "import_stage",
+    "import.count_stage": "import_stage",
+    "import.update_existing": "s",
+    "import.insert_new": "s",
+}
+# Statements run before checking so the queries that use them can be planned.
+PLAN_SETUP = ("import.create_stage",)
+
+
+def query_plan(con, sql):
+    params = (None,) * sql.count("?")
+    return [row[3] for row in con.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def check_query_plans(con, queries=None):
+    # Returns (name, plan detail) for every shipped query that falls back to
+    # a full table scan.
+    problems = []
+    # Load the current schema first: after another connection migrates,
+    # EXPLAIN of a statement that fires triggers can fail with "no such
+    # table" while this connection's stale schema is being reloaded.
+    con.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+    for name in PLAN_SETUP:
+        con.execute(QUERIES[name])
+    for name, sql in (queries or QUERIES).items():
+        if name in PLAN_SETUP:
+            continue
+        for detail in query_plan(con, sql):
+            # Virtual tables (FTS5) answer MATCH from their own index.
+            if not detail.startswith("SCAN ") or " USING " in detail or " VIRTUAL TABLE " in detail:
+                continue
+            if detail.split()[1] != FULL_SCAN_OK.get(name):
+                problems.append((name, detail))
+    return problems
+
+
+def assert_query_plans(db):
+    with db.reader() as con:
+        problems = check_query_plans(con)
+    assert not problems, "full table scans: " + ", ".join(f"{n} ({d})" for n, d in problems)
+
+
+def seed_initial_data(db):
+    with db.writer() as con:
+        cur = con.cursor()
+        cur.execute("SELECT id FROM users WHERE username = 'admin'")
+        if not cur.fetchone():
+            cur.execute("INSERT INTO users(username, password, role) VALUES (?,?,?)", ("admin", "admin123", "admin"))
+        cur.execute("SELECT COUNT(*) FROM hospitals")
+        if cur.fetchone()[0] == 0:
+            hospitals = [
+                ("AIIMS Delhi", "Delhi", "General", "011-2658xxxx"),
+                ("Apollo Hospitals", "Chennai", "General", "044-2829xxxx"),
+                ("Fortis", "New Delhi", "General", "011-4706xxxx"),
+                ("Max Healthcare", "New Delhi", "General", "011-4150xxxx"),
+            ]
+            cur.executemany(QUERIES["hospitals.insert"], hospitals)
+        cur.execute("SELECT COUNT(*) FROM diseases")
+        if cur.fetchone()[0] == 0:
+            defaults = [
+                ("fever", "Temporary rise in body temperature", "fever,chills,headache", 1, "Paracetamol, Ibuprofen", "", "Consult if >3 days"),
+                ("diabetes", "Chronic high blood sugar", "thirst,urination,fatigue", 0, "", "AIIMS Delhi, Apollo", "Long-term care"),
+                ("hypertension", "High blood pressure", "headache,breathlessness", 0, "", "Cardiology Centers", "Monitor regularly"),
+                ("common cold", "Viral URTI", "sneezing,cough,sore throat", 1, "Antihistamines, Decongestants", "", "Usually self-limited"),
+                ("malaria", "Mosquito-borne parasitic infection", "fever,chills", 1, "ACT, Chloroquine", "Infectious Disease Hospitals", "Diagnose with test"),
+                ("asthma", "Chronic airway inflammation", "wheezing,shortness of breath", 0, "Inhalers (Salbutamol)", "Pulmonology Centers", "Doctor plan needed"),
+                ("covid-19", "Viral infection SARS-CoV-2", "fever,cough,loss of smell", 0, "Supportive care", "COVID Hospitals", "Test and isolate"),
+                ("dengue", "Mosquito-borne viral infection", "fever,joint pain,rash", 0, "Supportive care (hydration)", "Dengue care units", "Avoid NSAIDs"),
+                ("tuberculosis", "Bacterial lung infection", "cough,weight loss,fever", 0, "DOTS therapy", "TB Centers", "Long supervised treatment"),
+                ("migraine", "Neurological headaches", "throbbing headache,nausea", 1, "Pain relievers, Triptans", "", "Avoid triggers"),
+            ]
+            cur.executemany(
+                "INSERT INTO diseases(name, details, symptoms, treatable, medicines, hospitals, notes) VALUES(?,?,?,?,?,?,?)",
+                defaults
+            )
+            # Imported here: the directory code imports this module.
+            from healthcare.hospitals import relink_diseases
+            relink_diseases(con)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Healthcare database maintenance")
+    parser.add_argument("db", nargs="?", default=DB_FILE)
+    parser.add_argument("--check-plans", action="store_true", help="fail if a shipped query does a full scan")
+    args = parser.parse_args()
+    database = Database(args.db)
+    applied = migrate(database)
+    print(f"schema version {SCHEMA_VERSION}, applied {applied or 'nothing'}")
+    if args.check_plans:
+        assert_query_plans(database)
+        print(f"{len(QUERIES)} shipped queries checked, no full scans")
+    database.close()
@@ -0,0 +1,102 @@
+import csv
+import gzip
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from healthcare.coldstore import ColdStore
+from healthcare.db import DB_FILE, QUERIES, Database
+
+EXPORT_COLUMNS = ("id", "patient_id", "month", "bp_systolic", "bp_diastolic", "sugar", "uric_acid", "created_at")
+CHUNK_ROWS = 5000
+WRITE_BUFFER = 1 << 20
+FIRST_MONTH = "0000-00"
+LAST_MONTH = "9999-99"
+
+
+def open_output(path, compress=None):
+    if compress is None:
+        compress = path.endswith(".gz")
+    if compress:
+        return gzip.open(path, "wt", newline="", compresslevel=5)
+    return open(path, "w", newline="", buffering=WRITE_BUFFER)
+
+
+def export_reports(db, path, patient_ids=None, month_from=None, month_to=None, compress=None,
+                   chunk_size=CHUNK_ROWS, progress=None, cancel=None, cold=None):
+    # Streams reports ordered by (patient, month) straight from the cursor in
+    # chunks, so memory stays flat whatever the export size; with a
+    # ColdStore, the moved history is merged in. The file is written under
+    # a .part name and only renamed once complete. Returns the row count,
+    # or None if cancelled.
+    month_from = month_from or FIRST_MONTH
+    month_to = month_to or LAST_MONTH
+    if compress is None:
+        compress = path.endswith(".gz")
+    if patient_ids is None:
+        sql, params = QUERIES["reports.export_all"], (month_from, month_to)
+    else:
+        sql, params = QUERIES["reports.export_patients"], (json.dumps(sorted(set(patient_ids))), month_from, month_to)
+    partial = path + ".part"
+    count = 0
+    cancelled = False
+    try:
+        with db.reader() as con, open_output(partial, compress) as f:
+            writer = csv.writer(f)
+            writer.writerow(EXPORT_COLUMNS)
+            cur = con.execute(sql, params)
+            source = cur if cold is None else cold.merged_export(con, cur, patient_ids, month_from, month_to)
+            while True:
+                if cancel is not None and cancel.is_set():
+                    cancelled = True
+                    break
+                rows = list(islice(source, chunk_size))
+                if not rows:
+                    break
+                writer.writerows(rows)
+                count += len(rows)
+                if progress:
+                    progress(count)
+            cur.close()
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    if cancelled:
+        os.remove(partial)
+        return None
+    os.replace(partial, path)
+    return count
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Export patient reports to CSV")
+    parser.add_argument("output", help="output file; a .gz suffix enables gzip")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--patients", help="comma separated patient ids (default: all)")
+    parser.add_argument("--from", dest="month_from", help="first month, YYYY-MM")
+    parser.add_argument("--to", dest="month_to", help="last month, YYYY-MM")
+    parser.add_argument("--gzip", action="store_true", default=None)
+    parser.add_argument("--chunk", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+    patient_ids = [int(p) for p in args.patients.split(",") if p.strip()] if args.patients else None
+    db = Database(args.db, readers=1)
+    cold = ColdStore(db)
+    t0 = time.perf_counter()
+    def report(n):
+        print(f"\r{n:,} rows", end="", file=sys.stderr, flush=True)
+    try:
+        count = export_reports(db, args.output, patient_ids, args.month_from, args.month_to,
+                               compress=args.gzip, chunk_size=args.chunk, progress=report, cold=cold)
+    finally:
+        cold.close()
+        db.close()
+    elapsed = time.perf_counter() - t0
+    print(f"\rExported {count:,} reports to {args.output} in {elapsed:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
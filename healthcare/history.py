@@ -0,0 +1,265 @@
+import math
+import threading
+from array import array
+from collections import OrderedDict
+
+from healthcare.coldstore import NULL_INT16, int16_code, month_code, month_text, time_code, time_text
+from healthcare.db import QUERIES
+from healthcare.summary import combine_stats, summary_columns
+
+# Patient histories for the reports tab, the comparison and the chart, kept
+# in memory between views. An entry holds one patient's reports from both
+# tiers as parallel typed arrays (about 35 bytes a report, against several
+# hundred as tuples of Python objects) and is rebuilt into rows only for
+# what a view shows. Entries are checked against the reports change counter
+# and, when that has moved, a per-patient stamp read from indexes, so a hit
+# reads no report rows; the service also drops entries it knows it changed.
+HISTORY_BUDGET = 16 * 1024 * 1024   # bytes of cached arrays
+ENTRY_OVERHEAD = 512
+# (field, array typecode); months as months since year 0, lab values as
+# doubles (NaN for NULL), creation times as in the cold tier.
+FIELDS = (
+    ("id", "q"), ("month", "h"), ("bp_systolic", "h"), ("bp_diastolic", "h"),
+    ("sugar", "d"), ("uric_acid", "d"), ("created_at", "I"),
+)
+
+
+def _real(value):
+    if value is None:
+        return math.nan
+    return value if type(value) is float and not math.isnan(value) else None
+
+
+def _encode(row):
+    rid, month, bp_sys, bp_dia, sugar, uric, created = row
+    values = (rid, month_code(month), int16_code(bp_sys), int16_code(bp_dia),
+              _real(sugar), _real(uric), time_code(created))
+    return None if None in values else values
+
+
+class History:
+    # One patient's reports in (month, id) order, with the live ones also
+    # indexed newest id first for the reports table. stats holds the
+    # summary columns over both tiers (None without reports). A history
+    # with values the arrays cannot hold exactly keeps plain tuples instead
+    # and is not cached.
+    def __init__(self, patient_id, rows, live_ids, stats, stamp=None, version=None):
+        self.patient_id = patient_id
+        self.stats = stats
+        self.stamp = stamp
+        self.version = version
+        encoded = [_encode(row) for row in rows]
+        if None in encoded:
+            self._rows = list(rows)
+            self.columns = None
+            ids = [row[0] for row in rows]
+        else:
+            self._rows = None
+            cols = list(zip(*encoded)) or [()] * len(FIELDS)
+            self.columns = {name: array(code, col) for (name, code), col in zip(FIELDS, cols)}
+            ids = self.columns["id"]
+        order = sorted((i for i, rid in enumerate(ids) if rid in live_ids), key=lambda i: ids[i], reverse=True)
+        self.table = array("l", order)
+
+    @property
+    def cacheable(self):
+        return self._rows is None
+
+    @property
+    def nbytes(self):
+        arrays = list(self.columns.values()) if self.columns else []
+        return ENTRY_OVERHEAD + sum(len(a) * a.itemsize for a in arrays + [self.table])
+
+    def __len__(self):
+        return len(self._rows) if self._rows is not None else len(self.columns["id"])
+
+    def rows(self, indices=None):
+        # (id, month, sys, dia, sugar, uric_acid, created_at) for the given
+        # positions in (month, id) order; all of them by default.
+        if self._rows is not None:
+            return list(self._rows) if indices is None else [self._rows[i] for i in indices]
+        if indices is None:
+            cols = [self.columns[name].tolist() for name, _ in FIELDS]
+        else:
+            cols = [[self.columns[name][i] for i in indices] for name, _ in FIELDS]
+        months, times = {}, {}
+        out = []
+        for rid, month, bp_sys, bp_dia, sugar, uric, created in zip(*cols):
+            text = months.get(month)
+            if text is None:
+                text = months[month] = month_text(month)
+            when = times.get(created)
+            if when is None and created not in times:
+                when = times[created] = time_text(created)
+            out.append((rid, text, None if bp_sys == NULL_INT16 else bp_sys,
+                        None if bp_dia == NULL_INT16 else bp_dia,
+                        None if math.isnan(sugar) else sugar, None if math.isnan(uric) else uric, when))
+        return out
+
+    def chart_rows(self):
+        # (id, month, sys, dia, sugar, uric_acid), as the chart takes them.
+        return [row[:6] for row in self.rows()]
+
+    def last(self, n):
+        # The newest n reports by (month, id), newest first.
+        return self.rows(range(len(self) - 1, max(-1, len(self) - 1 - n), -1))
+
+    def table_count(self):
+        return len(self.table)
+
+    def table_rows(self, offset, limit):
+        # Live reports newest id first, as reports.page returns them.
+        return self.rows(self.table[offset:offset + limit])
+
+    def without(self, row_id):
+        # A copy less one report, for a view that has just deleted it; the
+        # cached entry is left alone and the copy's stats are dropped.
+        ids = self.columns["id"] if self.columns is not None else [row[0] for row in self._rows]
+        try:
+            pos = list(ids).index(row_id)
+        except ValueError:
+            return self
+        copy = History.__new__(History)
+        copy.patient_id, copy.stats, copy.stamp, copy.version = self.patient_id, None, None, None
+        if self.columns is not None:
+            copy._rows = None
+            copy.columns = {name: col[:pos] + col[pos + 1:] for name, col in self.columns.items()}
+        else:
+            copy._rows = self._rows[:pos] + self._rows[pos + 1:]
+            copy.columns = None
+        copy.table = array("l", (i - (i > pos) for i in self.table if i != pos))
+        return copy
+
+
+class HistoryCache:
+    # Bounded LRU of History entries by their array bytes; used from worker
+    # threads and the UI thread alike.
+    def __init__(self, db, cold, budget=HISTORY_BUDGET):
+        self.db = db
+        self.cold = cold
+        self.budget = budget
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, patient_id):
+        # A hit costs one read of the change counter. It is read before the
+        # snapshot the stamp and rows come from, so an entry is never
+        # labelled newer than its rows.
+        with self.db.reader() as con:
+            version = con.execute(QUERIES["reports.version"]).fetchone()[0]
+            with self._lock:
+                entry = self._entries.get(patient_id)
+            if entry is None or entry.version != version:
+                con.execute("BEGIN")
+                try:
+                    if entry is not None and self._stamp(con, patient_id) == entry.stamp:
+                        entry.version = version
+                    else:
+                        self.invalidate(patient_id)
+                        entry = None
+                        history = self._load(con, patient_id, version)
+                finally:
+                    con.rollback()
+            if entry is not None:
+                with self._lock:
+                    if patient_id in self._entries:
+                        self._entries.move_to_end(patient_id)
+                    self.hits += 1
+                return entry
+        with self._lock:
+            self.misses += 1
+            self._store(history)
+        return history
+
+    def _stamp(self, con, patient_id):
+        return tuple(con.execute(QUERIES["history.stamp"], (patient_id,) * 3).fetchone())
+
+    def _load(self, con, patient_id, version):
+        stamp = self._stamp(con, patient_id)
+        live = con.execute(QUERIES["history.rows"], (patient_id,)).fetchall()
+        cold = [(r[0],) + r[2:] for r in self.cold.rows(patient_id, con)] if stamp[3] else []
+        rows = sorted(cold + live, key=lambda r: (r[1], r[0])) if cold else live
+        summary = con.execute(QUERIES["summary.by_patient"], (patient_id,)).fetchone()
+        summary = dict(zip(["patient_id"] + summary_columns(), summary)) if summary else None
+        stats = combine_stats(summary, self.cold.summary(patient_id, con) if cold else None)
+        return History(patient_id, rows, {r[0] for r in live}, stats, stamp, version)
+
+    def _store(self, history):
+        old = self._entries.pop(history.patient_id, None)
+        if old is not None:
+            self.bytes -= old.nbytes
+        if not history.cacheable or history.nbytes > self.budget:
+            return
+        self._entries[history.patient_id] = history
+        self.bytes += history.nbytes
+        while self.bytes > self.budget:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def invalidate(self, patient_id):
+        with self._lock:
+            entry = self._entries.pop(patient_id, None)
+            if entry is not None:
+                self.bytes -= entry.nbytes
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "bytes": self.bytes, "budget": self.budget,
+                    "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "evictions": self.evictions, "invalidations": self.invalidations}
+
+    def summary(self):
+        s = self.stats()
+        return (f"history cache {s['hits']:,} hits / {s['misses']:,} misses, {s['entries']:,} patients, "
+                f"{s['bytes'] / 1e6:.1f} of {s['budget'] / 1e6:.1f} MB")
+
+
+class HistoryPager:
+    # VirtualTable source over a cached History: the patient's live reports
+    # newest first, rows built only for the visible window. The history is
+    # held until changes() brings a newer one; a delete takes the row out of
+    # the held copy without reading.
+    def __init__(self, cache, patient_id):
+        self.cache = cache
+        self.params = (patient_id,)
+        self.history = None
+
+    def _history(self):
+        if self.history is None:
+            self.history = self.cache.get(self.params[0])
+        return self.history
+
+    def invalidate(self):
+        self.history = None
+
+    def count(self):
+        return self._history().table_count()
+
+    def rows(self, offset, limit):
+        return self._history().table_rows(offset, limit)
+
+    def changes(self):
+        # Safe on a worker thread: None while the cached history still holds.
+        history = self.cache.get(self.params[0])
+        return None if history is self.history else history
+
+    def apply_changes(self, history):
+        self.history = history
+
+    def delete(self, row_id):
+        if self.history is not None:
+            self.history = self.history.without(row_id)
@@ -0,0 +1,280 @@
+import csv
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from healthcare.db import (DB_FILE, MAX_ID, QUERIES, Database, KeysetPager, create_version_triggers,
+                          drop_version_triggers, migrate)
+
+# Hospital directory. hospitals carries a city and a specialty, indexed
+# together (case-insensitively) so a city, or a city and specialty, is an
+# index range however large the national directory gets. disease_hospitals
+# links each disease to the hospitals its free-text `hospitals` column names
+# ("AIIMS Delhi, Apollo"); the text stays as written and is re-linked
+# whenever the disease is saved or the directory is reloaded.
+HOSPITAL_FIELDS = ("id", "name", "city", "specialty", "contact")
+HOSPITAL_PAGE = 50
+CACHE_ENTRIES = 256   # cached lookup pages
+_TOP = "\U0010ffff"   # sorts after any name continuation
+_SPLIT_RE = re.compile(r"[,;\n]")
+
+
+def split_names(text):
+    # "AIIMS Delhi, Apollo" -> ["AIIMS Delhi", "Apollo"], repeats dropped.
+    seen, out = set(), []
+    for part in _SPLIT_RE.split(text or ""):
+        name = " ".join(part.split())
+        if name and name.lower() not in seen:
+            seen.add(name.lower())
+            out.append(name)
+    return out
+
+
+def match_hospitals(con, name):
+    # Ids of the hospitals a free-text name refers to: every hospital with
+    # exactly that name (a chain has one per city), else every hospital of
+    # the one name that starts with it as whole words ("Apollo" -> "Apollo
+    # Hospitals"). A prefix of several different names links nothing.
+    ids = [hid for hid, in con.execute(QUERIES["hospitals.by_name"], (name,))]
+    if not ids:
+        names = con.execute(QUERIES["hospitals.names_by_prefix"], (name + " ", name + " " + _TOP)).fetchall()
+        if len(names) == 1:
+            ids = [hid for hid, in con.execute(QUERIES["hospitals.by_name"], names[0])]
+    return ids
+
+
+def link_disease(con, disease_id, text):
+    # Replaces the disease's links with the hospitals its free-text list
+    # names; returns the names that matched none.
+    con.execute(QUERIES["disease_hospitals.clear"], (disease_id,))
+    unmatched = []
+    for name in split_names(text):
+        ids = match_hospitals(con, name)
+        if not ids:
+            unmatched.append(name)
+            continue
+        con.executemany(QUERIES["disease_hospitals.insert"], ((disease_id, hid) for hid in ids))
+    return unmatched
+
+
+def relink_diseases(con):
+    # Links every disease from its free-text hospitals, inside the caller's
+    # write transaction. A chain named by many diseases makes many links,
+    # so the per-row counter triggers are dropped and the counter bumped
+    # once. Returns (diseases with a hospital list, {unmatched name:
+    # diseases naming it}).
+    rows = con.execute(QUERIES["diseases.hospital_text"]).fetchall()
+    unmatched = {}
+    drop_version_triggers(con, "disease_hospitals")
+    before = con.total_changes
+    for disease_id, text in rows:
+        for name in link_disease(con, disease_id, text):
+            unmatched[name] = unmatched.get(name, 0) + 1
+    con.execute(QUERIES["versions.bump"], (con.total_changes - before, "disease_hospitals"))
+    create_version_triggers(con, "disease_hospitals")
+    return len(rows), unmatched
+
+
+def _source(city=None, specialty=None, disease=None):
+    # (query name infix, params) for a lookup; see the hospitals.* queries.
+    city, specialty, disease = ((v or "").strip() for v in (city, specialty, disease))
+    if disease:
+        return "disease_", (disease.lower(),)
+    if specialty:
+        if not city:
+            raise ValueError("Choose a city to filter by specialty")
+        return "specialty_", (city, specialty)
+    if city:
+        return "city_", (city,)
+    return "", ()
+
+
+class HospitalDirectory:
+    # Lookups by city (optionally narrowed to a specialty) or by disease,
+    # newest first and keyset-paged. Pages are kept in a small LRU that is
+    # checked against the hospital, link and disease change counters with
+    # one read, so a repeated lookup (the SOS tab's nearby list, a popular
+    # city on the server) reads no hospital rows.
+    def __init__(self, db, entries=CACHE_ENTRIES):
+        self.db = db
+        self.entries = entries
+        self.hits = 0
+        self.misses = 0
+        self._pages = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _cached(self, key, query, params):
+        # The counter is read before the rows, so a page is never labelled
+        # newer than its rows.
+        with self.db.reader() as con:
+            version = con.execute(QUERIES["hospitals.version"]).fetchone()[0]
+            with self._lock:
+                if version != self._version:
+                    self._pages.clear()
+                    self._version = version
+                rows = self._pages.get(key)
+                if rows is not None:
+                    self._pages.move_to_end(key)
+                    self.hits += 1
+                    return rows
+            rows = con.execute(QUERIES[query], params).fetchall()
+        with self._lock:
+            self.misses += 1
+            if version == self._version:
+                self._pages[key] = rows
+                while len(self._pages) > self.entries:
+                    self._pages.popitem(last=False)
+        return rows
+
+    def lookup(self, city=None, specialty=None, disease=None, before_id=None, limit=HOSPITAL_PAGE):
+        # (id, name, city, specialty, contact) newest first; pass the last id
+        # of a page to get the next. A disease wins over city and specialty.
+        kind, params = _source(city, specialty, disease)
+        params += (before_id or MAX_ID, limit)
+        return self._cached((kind,) + params, f"hospitals.{kind}page", params)
+
+    def cities(self):
+        return [city for city, in self._cached(("cities",), "hospitals.cities", ())]
+
+    def specialties(self, city):
+        city = (city or "").strip()
+        return [s for s, in self._cached(("specialties", city), "hospitals.specialties", (city,))]
+
+    def pager(self, city=None, specialty=None, disease=None, page_size=HOSPITAL_PAGE):
+        # KeysetPager over a lookup for a paged table view.
+        kind, params = _source(city, specialty, disease)
+        return KeysetPager(self.db, f"hospitals.{kind}count", f"hospitals.{kind}page", f"hospitals.{kind}seek",
+                           params=params, page_size=page_size, version_query="hospitals.version")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._pages), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def summary(self):
+        s = self.stats()
+        return f"hospital lookups {s['hits']:,} hits / {s['misses']:,} misses, {s['entries']:,} pages cached"
+
+
+class LoadResult:
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.removed = 0
+        self.diseases = 0
+        self.unmatched = {}
+        self.elapsed = 0.0
+
+    def summary(self):
+        text = (f"Read {self.read:,} hospitals in {self.elapsed:.2f}s: inserted {self.inserted:,}, "
+                f"skipped {self.skipped:,} already listed, rejected {self.rejected:,} without a name")
+        if self.removed:
+            text += f"\nRemoved {self.removed:,} previous hospitals"
+        text += f"\nRe-linked {self.diseases:,} diseases"
+        if self.unmatched:
+            names = sorted(self.unmatched, key=lambda n: -self.unmatched[n])
+            text += f"; {len(names):,} hospital names matched nothing: " + ", ".join(names[:10])
+            if len(names) > 10:
+                text += ", ..."
+        return text
+
+
+def load_directory(db, source, replace=False):
+    # Loads hospitals from a CSV path or file object with a header naming
+    # name, city, specialty and contact columns (any order, any case), in
+    # one transaction. A hospital already listed under the same name and
+    # city is skipped; with replace the old directory goes first (and its
+    # disease links with it). Diseases are re-linked against the result.
+    result = LoadResult()
+    start = time.perf_counter()
+    f = open(source, newline="", encoding="utf-8-sig") if isinstance(source, str) else source
+    try:
+        reader = csv.reader(f)
+        header = [h.strip().lower() for h in next(reader, [])]
+        if "name" not in header:
+            raise ValueError("directory CSV needs a header with a 'name' column")
+        cols = [header.index(c) if c in header else None for c in ("name", "city", "specialty", "contact")]
+        with db.writer() as con:
+            if replace:
+                result.removed = con.execute(QUERIES["hospitals.clear"]).rowcount
+            for row in reader:
+                result.read += 1
+                name, city, specialty, contact = (
+                    " ".join(row[i].split()) if i is not None and i < len(row) else "" for i in cols)
+                if not name:
+                    result.rejected += 1
+                    continue
+                if con.execute(QUERIES["hospitals.exists"], (name, city)).fetchone():
+                    result.skipped += 1
+                    continue
+                con.execute(QUERIES["hospitals.insert"], (name, city or None, specialty or None, contact))
+                result.inserted += 1
+            result.diseases, result.unmatched = relink_diseases(con)
+    finally:
+        if f is not source:
+            f.close()
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def create_tables(con):
+    if "specialty" not in [row[1] for row in con.execute("PRAGMA table_info(hospitals)")]:
+        con.execute("ALTER TABLE hospitals ADD COLUMN specialty TEXT")
+    # city alone keeps a city's hospitals in id order for the keyset pages.
+    con.execute("CREATE INDEX IF NOT EXISTS idx_hospitals_city ON hospitals(city COLLATE NOCASE)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_hospitals_city_specialty "
+                "ON hospitals(city COLLATE NOCASE, specialty COLLATE NOCASE)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_hospitals_name ON hospitals(name COLLATE NOCASE)")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS disease_hospitals(
+            disease_id INTEGER NOT NULL REFERENCES diseases(id) ON DELETE CASCADE,
+            hospital_id INTEGER NOT NULL REFERENCES hospitals(id) ON DELETE CASCADE,
+            PRIMARY KEY(disease_id, hospital_id)
+        ) WITHOUT ROWID;
+    """)
+    # The cascade from hospitals looks links up by hospital.
+    con.execute("CREATE INDEX IF NOT EXISTS idx_disease_hospitals_hospital ON disease_hospitals(hospital_id)")
+    for table in ("hospitals", "disease_hospitals"):
+        con.execute("INSERT OR IGNORE INTO table_versions(name, version) VALUES (?, 0)", (table,))
+        create_version_triggers(con, table)
+    relink_diseases(con)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Hospital directory: load a CSV, re-link diseases, look up")
+    parser.add_argument("csv", nargs="?", help="directory CSV (name, city, specialty, contact)")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--replace", action="store_true", help="drop the current directory first")
+    parser.add_argument("--relink", action="store_true", help="re-link diseases to hospitals by name")
+    parser.add_argument("--city")
+    parser.add_argument("--specialty")
+    parser.add_argument("--disease")
+    parser.add_argument("--limit", type=int, default=HOSPITAL_PAGE)
+    args = parser.parse_args(argv)
+    db = Database(args.db, readers=1)
+    try:
+        migrate(db)
+        if args.csv:
+            print(load_directory(db, args.csv, args.replace).summary(), file=sys.stderr)
+        elif args.relink:
+            with db.writer() as con:
+                diseases, unmatched = relink_diseases(con)
+            print(f"Re-linked {diseases:,} diseases; unmatched names: {', '.join(sorted(unmatched)) or 'none'}",
+                  file=sys.stderr)
+        if args.city or args.disease:
+            rows = HospitalDirectory(db).lookup(args.city, args.specialty, args.disease, limit=args.limit)
+            for hid, name, city, specialty, contact in rows:
+                print(f"{hid:8}  {name} - {city or '-'} - {specialty or '-'} - {contact or '-'}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import contextvars
+import logging
+import logging.handlers
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+RING_SIZE = 2000
+SAMPLE_RATE = 0.1        # share of ordinary statements kept in the ring; slow ones always are
+SLOW_QUERY_MS = 50.0
+LATENCY_WINDOW = 512     # most recent timings per handler used for percentiles
+SLOW_LOG_BYTES = 1024 * 1024
+SLOW_LOG_BACKUPS = 3
+PERCENTILES = (0.5, 0.9, 0.99)
+PLAN_VERBS = {"SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH"}
+
+_handler = contextvars.ContextVar("healthcare_handler", default=None)
+_internal_files = {__file__}
+
+
+def register_internal(filename):
+    # Frames from these files are never reported as the calling handler.
+    _internal_files.add(filename)
+
+
+def caller_name():
+    # Qualified name of the nearest function outside the data layer, with
+    # closures folded into their enclosing method
+    # ("HealthcareApp.refresh_patients.<locals>.load" -> "HealthcareApp.refresh_patients").
+    f = sys._getframe(1)
+    while f is not None and f.f_code.co_filename in _internal_files:
+        f = f.f_back
+    if f is None:
+        return "?"
+    code = f.f_code
+    return getattr(code, "co_qualname", code.co_name).split(".<locals>", 1)[0]
+
+
+def current_handler():
+    return _handler.get() or caller_name()
+
+
+def bind_handler(fn, name):
+    # Wraps fn so the statements it runs, on whatever thread, are attributed
+    # to `name` (TaskRunner uses this to credit work to the UI handler that
+    # submitted it).
+    def run(*args, **kwargs):
+        token = _handler.set(name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _handler.reset(token)
+    return run
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class Tracer:
+    # Per-statement instrumentation fed by TimedCursor. Every statement updates
+    # its handler's count/total and a bounded window of recent timings (for
+    # percentiles). A sample of statements, plus every slow one, goes into a
+    # fixed-size ring of (unix time, handler, seconds, rows, sql, plan, slow).
+    # Slow statements get an EXPLAIN QUERY PLAN (once per distinct SQL) and,
+    # when enabled, a line in a rotating log file.
+    def __init__(self, slow_ms=SLOW_QUERY_MS, sample_rate=SAMPLE_RATE, ring_size=RING_SIZE, explain=True):
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.explain = explain
+        self.ring = deque(maxlen=ring_size)
+        self.slow_log = None
+        self._lock = threading.Lock()
+        self._handlers = {}
+        self._plans = {}
+        self._random = random.Random()
+
+    def enable_slow_log(self, path, max_bytes=SLOW_LOG_BYTES, backups=SLOW_LOG_BACKUPS):
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                       encoding="utf-8", delay=True)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        # A private logger: the slow log never depends on global logging config.
+        logger = logging.Logger("healthcare.slow_sql")
+        logger.addHandler(handler)
+        self.close()
+        self.slow_log = logger
+
+    def close(self):
+        if self.slow_log is not None:
+            for handler in self.slow_log.handlers:
+                handler.close()
+            self.slow_log = None
+
+    def _plan(self, con, sql, params):
+        key = " ".join(sql.split())
+        if key in self._plans:
+            return self._plans[key]
+        plan = None
+        if params is not None and key.split(" ", 1)[0].upper() in PLAN_VERBS:
+            try:
+                # A plain cursor, so capturing the plan is not itself traced.
+                rows = sqlite3.Cursor(con).execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+                plan = "; ".join(r[-1] for r in rows)
+            except sqlite3.Error:
+                pass
+        self._plans[key] = plan
+        return plan
+
+    def record(self, con, sql, params, elapsed, rows, handler):
+        slow = elapsed * 1000 >= self.slow_ms
+        plan = self._plan(con, sql, params) if slow and self.explain else None
+        with self._lock:
+            st = self._handlers.get(handler)
+            if st is None:
+                st = self._handlers[handler] = [0, 0.0, deque(maxlen=LATENCY_WINDOW)]
+            st[0] += 1
+            st[1] += elapsed
+            st[2].append(elapsed)
+            if slow or self._random.random() < self.sample_rate:
+                self.ring.append((time.time(), handler, elapsed, rows, sql, plan, slow))
+        if slow and self.slow_log is not None:
+            self.slow_log.warning("%.1fms rows=%s handler=%s sql=%s plan=%s", elapsed * 1000,
+                                  "?" if rows is None else rows, handler, " ".join(sql.split()), plan or "-")
+
+    def handler_stats(self):
+        # (handler, statements, total seconds, p50, p90, p99, max), busiest first.
+        with self._lock:
+            items = [(name, n, total, sorted(times)) for name, (n, total, times) in self._handlers.items()]
+        out = [(name, n, total) + tuple(percentile(times, q) for q in PERCENTILES) + (times[-1],)
+               for name, n, total, times in items]
+        out.sort(key=lambda r: -r[2])
+        return out
+
+    def recent(self, slow_only=False, limit=200):
+        # Newest first.
+        with self._lock:
+            events = list(self.ring)
+        if slow_only:
+            events = [e for e in events if e[6]]
+        return events[::-1][:limit]
+
+    def reset(self):
+        with self._lock:
+            self._handlers.clear()
+            self.ring.clear()
@@ -0,0 +1,164 @@
+import json
+import sys
+import time
+
+from healthcare.db import DB_FILE, QUERIES, Database, migrate, now_str
+
+PURGE_CHUNK = 100            # patients in the first write transaction
+MAX_CHUNK = 5000
+LOCK_HOLD = 0.04             # later chunks are sized to hold the write lock about this long
+CHUNK_PAUSE = 0.005          # seconds between chunks, for other writers to get in
+VACUUM_STEP_PAGES = 1000     # free pages returned to the OS per transaction
+
+
+class PurgeResult:
+    def __init__(self, archive):
+        self.archive = archive
+        self.requested = 0
+        self.patients = 0
+        self.reports = 0
+        self.reminders = 0
+        self.chunks = 0
+        self.longest_chunk = 0.0
+        self.freed_pages = 0
+        self.purge_seconds = 0.0
+        self.vacuum_seconds = 0.0
+        self.cancelled = False
+
+    def summary(self):
+        verb = "Archived" if self.archive else "Deleted"
+        text = (f"{verb} {self.patients:,} of {self.requested:,} patients with {self.reports:,} reports "
+                f"and {self.reminders:,} reminders in {self.purge_seconds:.2f}s "
+                f"({self.chunks} chunks, longest write-lock hold {self.longest_chunk * 1000:.1f} ms)")
+        if self.freed_pages:
+            text += f"\nReturned {self.freed_pages:,} free pages to the OS in {self.vacuum_seconds:.2f}s"
+        if self.cancelled:
+            text += "\nCancelled; the patients not yet reached were kept"
+        return text
+
+
+def purge_patients(db, patient_ids, archive=False, chunk=PURGE_CHUNK, hold=LOCK_HOLD, pause=CHUNK_PAUSE,
+                   progress=None, cancel=None):
+    # Deletes patients together with their reports and reminders (ON DELETE
+    # CASCADE) in short write transactions: the cost is in the cascaded
+    # rows, so after the first `chunk` patients each chunk is sized from the
+    # last one to hold the write lock for about `hold` seconds. With
+    # archive=True the rows are first copied to the *_archive tables. The
+    # patients' summary rows go first, which leaves the per-report summary
+    # trigger nothing to update. Reports moved to the cold tier are counted
+    # (and archived) too; their index rows cascade like the rest. Space is
+    # then handed back with incremental_vacuum(). progress(done, total) is
+    # called after each chunk; cancel is an optional threading.Event.
+    from healthcare.coldstore import ColdStore
+    cold = ColdStore(db) if archive else None
+    ids = sorted({int(pid) for pid in patient_ids})
+    result = PurgeResult(archive)
+    result.requested = len(ids)
+    t0 = time.perf_counter()
+    done = 0
+    while done < len(ids):
+        if cancel is not None and cancel.is_set():
+            result.cancelled = True
+            break
+        part = ids[done:done + chunk]
+        batch = json.dumps(part)
+        held = time.perf_counter()
+        with db.writer() as con:
+            result.reports += con.execute(QUERIES["purge.count_reports"], (batch,)).fetchone()[0]
+            result.reports += con.execute(QUERIES["purge.count_cold"], (batch,)).fetchone()[0]
+            result.reminders += con.execute(QUERIES["purge.count_reminders"], (batch,)).fetchone()[0]
+            if archive:
+                con.execute(QUERIES["purge.archive_patients"], (now_str(), batch))
+                con.execute(QUERIES["purge.archive_reports"], (batch,))
+                con.executemany(QUERIES["purge.archive_cold"], cold.export_rows(con, part))
+                con.execute(QUERIES["purge.archive_reminders"], (batch,))
+            con.execute(QUERIES["purge.drop_summaries"], (batch,))
+            result.patients += con.execute(QUERIES["purge.delete_patients"], (batch,)).rowcount
+        held = time.perf_counter() - held
+        result.longest_chunk = max(result.longest_chunk, held)
+        result.chunks += 1
+        done += len(part)
+        if progress:
+            progress(done, len(ids))
+        chunk = max(1, min(MAX_CHUNK, int(len(part) * hold / max(held, 1e-3))))
+        time.sleep(pause)
+    if cold is not None:
+        cold.close()
+    result.purge_seconds = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    result.freed_pages = incremental_vacuum(db, cancel=cancel)
+    result.vacuum_seconds = time.perf_counter() - t0
+    return result
+
+
+def incremental_vacuum(db, step_pages=VACUUM_STEP_PAGES, pause=CHUNK_PAUSE, cancel=None):
+    # Truncates the file by up to step_pages free pages per transaction.
+    # Only databases created with auto_vacuum=INCREMENTAL (every new one; see
+    # enable_incremental_vacuum() for older files) can do this; otherwise
+    # freed pages stay in the file for reuse and 0 is returned.
+    with db.reader() as con:
+        if con.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return 0
+    freed = 0
+    while cancel is None or not cancel.is_set():
+        with db.writer() as con:
+            before = con.execute("PRAGMA freelist_count").fetchone()[0]
+            if not before:
+                break
+            # execute() would step the pragma once, freeing a single page;
+            # executescript() runs it to the end in its own transaction.
+            con.executescript(f"PRAGMA incremental_vacuum({step_pages})")
+            freed += before - con.execute("PRAGMA freelist_count").fetchone()[0]
+        time.sleep(pause)
+    return freed
+
+
+def enable_incremental_vacuum(db):
+    # One-off for a database created before auto_vacuum was set: VACUUM
+    # rewrites the whole file (blocking writers meanwhile) and records the
+    # mode, after which purges can shrink the file in small steps.
+    with db.writer() as con:
+        con.commit()
+        con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        con.execute("VACUUM")
+
+
+def inactive_patients(db, before_month):
+    # Ids of patients whose latest report, live or cold, is older than
+    # before_month ("YYYY-MM"), including those with no reports who were
+    # added before it.
+    with db.reader() as con:
+        return [pid for (pid,) in con.execute(QUERIES["patients.inactive"], (before_month,) * 3)]
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Delete or archive patients with their reports and reminders")
+    parser.add_argument("db", nargs="?", default=DB_FILE)
+    parser.add_argument("--ids", help="comma-separated patient ids")
+    parser.add_argument("--inactive-since", metavar="YYYY-MM", help="every patient with no report since this month")
+    parser.add_argument("--archive", action="store_true", help="copy the rows to the *_archive tables first")
+    parser.add_argument("--hold-ms", type=float, default=LOCK_HOLD * 1000,
+                        help="target write-lock hold per transaction")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="convert an older database so purges can shrink the file (runs VACUUM)")
+    args = parser.parse_args(argv)
+    db = Database(args.db, readers=1)
+    try:
+        migrate(db)
+        if args.enable_incremental_vacuum:
+            enable_incremental_vacuum(db)
+            print("auto_vacuum set to INCREMENTAL", file=sys.stderr)
+        ids = [int(x) for x in args.ids.split(",") if x.strip()] if args.ids else []
+        if args.inactive_since:
+            ids += inactive_patients(db, args.inactive_since)
+        if ids:
+            print(purge_patients(db, ids, args.archive, hold=args.hold_ms / 1000).summary(), file=sys.stderr)
+        elif not args.enable_incremental_vacuum:
+            parser.error("nothing to purge: give --ids or --inactive-since")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import calendar
+import heapq
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+from healthcare.db import DB_FILE, QUERIES, Database, migrate, now_str
+
+WINDOW_SECS = 6 * 3600
+MAX_SLEEP_SECS = 3600
+DISPLAY_FORMAT = "%Y-%m-%d %H:%M"
+# Accepted spellings of remind_at, tried in order. Formats without a date
+# mean the next occurrence of that time of day.
+DATE_FORMATS = (
+    "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S",
+    "%Y/%m/%d %H:%M", "%d-%m-%Y %H:%M", "%d/%m/%Y %H:%M",
+    "%Y-%m-%d %I:%M %p", "%d-%m-%Y %I:%M %p", "%d/%m/%Y %I:%M %p",
+)
+TIME_FORMATS = ("%H:%M", "%I:%M %p", "%I %p")
+DATE_ONLY_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y")
+DEFAULT_HOUR = 9
+REPEATS = ("daily", "weekly", "monthly")
+
+
+def parse_remind_at(text, now=None):
+    # Returns a datetime (minute precision) or raises ValueError.
+    text = " ".join((text or "").split())
+    now = now or datetime.now()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).replace(second=0)
+        except ValueError:
+            pass
+    for fmt in DATE_ONLY_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).replace(hour=DEFAULT_HOUR)
+        except ValueError:
+            pass
+    for fmt in TIME_FORMATS:
+        try:
+            t = datetime.strptime(text.upper(), fmt)
+        except ValueError:
+            continue
+        when = now.replace(hour=t.hour, minute=t.minute, second=0, microsecond=0)
+        return when if when > now else when + timedelta(days=1)
+    raise ValueError(f"unrecognised time {text!r}; use YYYY-MM-DD HH:MM")
+
+
+def normalize_remind_at(text, now=None):
+    # (display string, epoch seconds) for storage.
+    when = parse_remind_at(text, now)
+    return when.strftime(DISPLAY_FORMAT), int(when.timestamp())
+
+
+def _add_months(when, months):
+    month = when.month - 1 + months
+    year = when.year + month // 12
+    month = month % 12 + 1
+    day = min(when.day, calendar.monthrange(year, month)[1])
+    return when.replace(year=year, month=month, day=day)
+
+
+def next_occurrence(due_at, repeat, now):
+    # First occurrence strictly after `now`. Missed occurrences are skipped,
+    # so a reminder that was overdue while the app was closed fires once.
+    # Steps are calendar days/months, so the time of day survives DST.
+    when = datetime.fromtimestamp(due_at)
+    if repeat in ("daily", "weekly"):
+        days = 1 if repeat == "daily" else 7
+        behind = int((now - due_at) // (days * 86400))
+        when += timedelta(days=days * max(1, behind))
+        while when.timestamp() <= now:
+            when += timedelta(days=days)
+        return when
+    if repeat == "monthly":
+        n = 1
+        while _add_months(when, n).timestamp() <= now:
+            n += 1
+        return _add_months(when, n)
+    raise ValueError(f"repeat must be one of {REPEATS}")
+
+
+class ReminderScheduler:
+    # Pending reminders live in the database behind a partial index on
+    # due_at; only those due before `horizon` (now + WINDOW_SECS) are held in
+    # a min-heap of (due_at, id). One indexed probe remembers the earliest
+    # reminder beyond the window, so the owner sleeps until exactly the next
+    # event (a heap top, or the window having to move) instead of polling.
+    # table_versions (bumped by triggers on reminders) tells us when another
+    # connection changed the table, and the window is then reloaded.
+    def __init__(self, db, window=WINDOW_SECS, clock=time.time):
+        self.db = db
+        self.window = window
+        self.clock = clock
+        self.version = None
+        self._heap = []
+        self._horizon = None
+        self._beyond = None
+        self._lock = threading.Lock()
+
+    def _read_version(self, con):
+        row = con.execute(QUERIES["reminders.version"]).fetchone()
+        return row[0] if row else 0
+
+    def _load(self, con, now):
+        # Pulls everything due up to the new horizon into the heap; the first
+        # load also picks up reminders that went overdue while we were away.
+        start = -1 if self._horizon is None else self._horizon
+        horizon = max(now + self.window, start)
+        for rid, due in con.execute(QUERIES["reminders.window"], (start, horizon)):
+            heapq.heappush(self._heap, (due, rid))
+        self._horizon = horizon
+        self._beyond = con.execute(QUERIES["reminders.next_after"], (horizon,)).fetchone()[0]
+
+    def _track(self, due, rid):
+        if due <= self._horizon:
+            heapq.heappush(self._heap, (due, rid))
+        elif self._beyond is None or due < self._beyond:
+            self._beyond = due
+
+    def add(self, user_id, medicine, remind_at, patient_id=None, repeat=None):
+        # Normalizes and stores a reminder; returns its id. Raises ValueError
+        # for an unparseable time or unknown repeat.
+        if repeat and repeat not in REPEATS:
+            raise ValueError(f"repeat must be one of {REPEATS}")
+        text, due = normalize_remind_at(remind_at)
+        with self.db.writer() as con:
+            if not con.in_transaction:
+                con.execute("BEGIN IMMEDIATE")
+            before = self._read_version(con)
+            rid = con.execute(QUERIES["reminders.insert"],
+                              (user_id, patient_id, medicine, text, due, repeat or None, now_str())).lastrowid
+            self.db.after_commit(self._added, before, self._read_version(con), due, rid)
+        return rid
+
+    def _added(self, before, after, due, rid):
+        # Once add() has committed: if ours was the only change since the
+        # last load, patch the heap instead of reloading.
+        with self._lock:
+            if self._horizon is not None and before == self.version:
+                self.version = after
+                self._track(due, rid)
+            else:
+                self._horizon = None
+
+    def fire_due(self):
+        # Marks every reminder due by now as done (or moves a recurring one to
+        # its next occurrence) and returns the fired rows as
+        # (id, user_id, patient_id, medicine, remind_at, repeat).
+        now = self.clock()
+        fired = []
+        with self.db.writer() as con, self._lock:
+            if not con.in_transaction:
+                con.execute("BEGIN IMMEDIATE")
+            if self._read_version(con) != self.version:
+                self._heap = []
+                self._horizon = None
+            if self._horizon is None or (self._beyond is not None and self._beyond <= now + self.window):
+                self._load(con, now)
+            popped = {}
+            while self._heap and self._heap[0][0] <= now:
+                due, rid = heapq.heappop(self._heap)
+                popped[rid] = due
+            if popped:
+                rows = con.execute(QUERIES["reminders.due_rows"], (json.dumps(list(popped)),)).fetchall()
+                for rid, user_id, patient_id, medicine, remind_at, due, repeat in sorted(rows, key=lambda r: r[5]):
+                    if due != popped[rid]:
+                        continue  # stale heap entry
+                    fired.append((rid, user_id, patient_id, medicine, remind_at, repeat))
+                    if repeat in REPEATS:
+                        when = next_occurrence(due, repeat, now)
+                        next_due = int(when.timestamp())
+                        con.execute(QUERIES["reminders.reschedule"], (when.strftime(DISPLAY_FORMAT), next_due, rid))
+                        self._track(next_due, rid)
+                    else:
+                        con.execute(QUERIES["reminders.mark_done"], (rid,))
+            self.version = self._read_version(con)
+        return fired
+
+    def next_delay(self):
+        # Seconds until fire_due() has work, capped so clock jumps, long
+        # suspends and reminders added by other processes are noticed.
+        with self._lock:
+            if self._horizon is None:
+                return 0.0
+            events = [self._heap[0][0]] if self._heap else []
+            if self._beyond is not None:
+                events.append(self._beyond - self.window)
+            if not events:
+                return float(MAX_SLEEP_SECS)
+            return min(max(0.0, min(events) - self.clock()), MAX_SLEEP_SECS)
+
+    def pending_in_memory(self):
+        return len(self._heap)
+
+
+class ReminderThread(threading.Thread):
+    # Headless driver: sleeps until the scheduler's next event, calls
+    # on_due(fired) from this thread. Call nudge() after add() so an earlier
+    # reminder shortens the current sleep.
+    def __init__(self, scheduler, on_due):
+        super().__init__(name="healthcare-reminders", daemon=True)
+        self.scheduler = scheduler
+        self.on_due = on_due
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def nudge(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def run(self):
+        while not self._stopping.is_set():
+            fired = self.scheduler.fire_due()
+            if fired:
+                self.on_due(fired)
+            self._wake.wait(self.scheduler.next_delay())
+            self._wake.clear()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the reminder scheduler without the GUI")
+    parser.add_argument("db", nargs="?", default=DB_FILE)
+    args = parser.parse_args(argv)
+    db = Database(args.db, readers=1)
+    migrate(db)
+    def report(fired):
+        for rid, user_id, patient_id, medicine, remind_at, repeat in fired:
+            print(f"{remind_at}  user {user_id}: take {medicine}" + (f" ({repeat})" if repeat else ""), flush=True)
+    thread = ReminderThread(ReminderScheduler(db), report)
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(1.0)
+    except KeyboardInterrupt:
+        thread.stop()
+        thread.join()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import difflib
+import re
+import threading
+
+from healthcare.db import MAX_ID, QUERIES, KeysetPager
+
+RESULT_LIMIT = 10
+PATIENT_PAGE = 50
+TRIGRAM = 3
+TYPO_CUTOFF = 0.75
+TYPO_CANDIDATES = 64
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def bigrams(word):
+    padded = f"^{word}$"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+def prefix_query(tokens):
+    # Every token must match as a word prefix ("throb head" finds "throbbing headache").
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def trigram_query(text):
+    # Every term must occur somewhere in the name or contact, in any order
+    # ("kumar 9812" finds "Ram Kumar", 98120...). Terms shorter than a
+    # trigram cannot use the index and are left out; None if none is left.
+    terms = [t for t in (text or "").split() if len(t) >= TRIGRAM]
+    return " ".join('"' + t.replace('"', '""') + '"' for t in terms) or None
+
+
+class DiseaseSearch:
+    # Ranked full-text search over diseases_fts. When a query matches nothing
+    # each token is corrected against the index vocabulary: a bigram index
+    # narrows the vocabulary to a few dozen candidates before difflib scores them.
+    def __init__(self, db):
+        self.db = db
+        self._vocab = None
+        self._vocab_version = None
+        self._lock = threading.Lock()
+
+    def _vocabulary(self, con):
+        version = con.execute(QUERIES["diseases.version"]).fetchone()[0]
+        with self._lock:
+            if self._vocab is None or version != self._vocab_version:
+                terms = [term for (term,) in con.execute(QUERIES["diseases.fts_vocab"])]
+                grams = {}
+                for i, term in enumerate(terms):
+                    for g in bigrams(term):
+                        grams.setdefault(g, []).append(i)
+                self._vocab = (terms, grams)
+                self._vocab_version = version
+            return self._vocab
+
+    def _corrections(self, vocab, token):
+        terms, grams = vocab
+        wanted = bigrams(token)
+        shared = {}
+        for g in wanted:
+            for i in grams.get(g, ()):
+                shared[i] = shared.get(i, 0) + 1
+        floor = len(wanted) // 2
+        best = sorted((i for i, n in shared.items() if n >= floor), key=lambda i: -shared[i])
+        candidates = [terms[i] for i in best[:TYPO_CANDIDATES]]
+        return difflib.get_close_matches(token, candidates, n=3, cutoff=TYPO_CUTOFF)
+
+    def search(self, text, limit=RESULT_LIMIT):
+        # Returns ([(name, details)], corrected_query or None).
+        tokens = tokenize(text)
+        if not tokens:
+            return [], None
+        with self.db.reader() as con:
+            rows = con.execute(QUERIES["diseases.fts"], (prefix_query(tokens), limit)).fetchall()
+            if rows:
+                return rows, None
+            vocab = self._vocabulary(con)
+            groups = []
+            for token in tokens:
+                fixed = self._corrections(vocab, token)
+                if not fixed:
+                    return [], None
+                groups.append(fixed)
+            query = " ".join("(" + " OR ".join(f'"{t}"' for t in group) + ")" for group in groups)
+            rows = con.execute(QUERIES["diseases.fts"], (query, limit)).fetchall()
+        return rows, " ".join(group[0] for group in groups)
+
+
+class PatientSearch:
+    # Substring search over patient name and contact through the trigram
+    # index patients_fts. Matches come newest first like the patient list,
+    # so a page is a keyset range of the index and costs about the same
+    # however many patients match; ranking them by bm25 would score every
+    # match first (tens of ms for a common trigram at 500k patients).
+    def __init__(self, db):
+        self.db = db
+
+    def pager(self, text, page_size=PATIENT_PAGE):
+        # KeysetPager over the matches for the Patients tab; None if the
+        # text has no searchable term.
+        query = trigram_query(text)
+        if query is None:
+            return None
+        return KeysetPager(self.db, "patients.search_count", "patients.search", "patients.search_seek",
+                           params=(query,), page_size=page_size,
+                           version_query="patients.version", since_query="patients.search_since")
+
+    def search(self, text, before_id=None, limit=PATIENT_PAGE):
+        # (id, name, age, gender, contact) newest first; pass the last id of
+        # a page to get the next.
+        query = trigram_query(text)
+        if query is None:
+            return []
+        with self.db.reader() as con:
+            return con.execute(QUERIES["patients.search"], (query, before_id or MAX_ID, limit)).fetchall()
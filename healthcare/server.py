@@ -0,0 +1,482 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from healthcare.anomaly import ALERT_FIELDS, ALERT_LIMIT
+from healthcare.db import DB_FILE, READER_POOL_SIZE, SLOW_LOG_FILE, Database, init_db
+from healthcare.hospitals import HOSPITAL_FIELDS, HOSPITAL_PAGE
+from healthcare.instrument import bind_handler
+from healthcare.service import PAGE_SIZE, PATIENT_FIELDS, REPORT_FIELDS, HealthcareService
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_PAGE = 1000
+MAX_BODY = 4 * 1024 * 1024
+MAX_HEADERS = 100
+BATCH_MAX_REPORTS = 500
+CACHE_ENTRIES = 512
+REASONS = {200: "OK", 201: "Created", 204: "No Content", 304: "Not Modified", 400: "Bad Request",
+           404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class WriteQueue:
+    # The one writer: every mutating request is queued here and applied in
+    # arrival order on a single thread. Report submissions that are queued
+    # back to back (whatever arrived while the previous write ran) are merged
+    # into one add_reports() call, so a burst of terminals submitting costs
+    # one transaction and one commit instead of one each.
+    def __init__(self, service, batch_max=BATCH_MAX_REPORTS):
+        self.service = service
+        self.batch_max = batch_max
+        self.batches = 0
+        self.batched_reports = 0
+        self._items = deque()
+        self._ready = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="healthcare-writer")
+
+    def _put(self, kind, payload):
+        fut = asyncio.get_running_loop().create_future()
+        self._items.append((kind, payload, fut))
+        self._ready.set()
+        return fut
+
+    def call(self, handler, fn, *args):
+        return self._put("call", (bind_handler(fn, handler), args))
+
+    def add_reports(self, items):
+        return self._put("reports", items)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._items:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            kind, payload, fut = self._items.popleft()
+            if kind == "reports":
+                batch = [(payload, fut)]
+                size = len(payload)
+                while self._items and self._items[0][0] == "reports" and size < self.batch_max:
+                    _, payload, fut = self._items.popleft()
+                    batch.append((payload, fut))
+                    size += len(payload)
+                items = [item for payload, _ in batch for item in payload]
+                fn = bind_handler(self.service.add_reports, "POST /reports")
+                try:
+                    results = await loop.run_in_executor(self._executor, fn, items)
+                except Exception as exc:
+                    for _, fut in batch:
+                        if not fut.done():
+                            fut.set_exception(exc)
+                    continue
+                self.batches += 1
+                self.batched_reports += len(items)
+                start = 0
+                for payload, fut in batch:
+                    if not fut.done():
+                        fut.set_result(results[start:start + len(payload)])
+                    start += len(payload)
+            else:
+                fn, args = payload
+                try:
+                    result = await loop.run_in_executor(self._executor, fn, *args)
+                except Exception as exc:
+                    if not fut.done():
+                        fut.set_exception(exc)
+                else:
+                    if not fut.done():
+                        fut.set_result(result)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+class ListCache:
+    # Conditional GET for list endpoints. The validator is SQLite's
+    # PRAGMA data_version on a private connection, which changes whenever any
+    # connection (this server's writer, the GUI, an import in another process)
+    # commits. Rendered bodies are kept per URL with the validator they were
+    # built under, so an unchanged database answers from memory (or with 304).
+    def __init__(self, path, entries=CACHE_ENTRIES):
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.boot = f"{os.getpid():x}.{int(time.time()):x}"
+        self.entries = entries
+        self.hits = 0
+        self.misses = 0
+        self._bodies = OrderedDict()
+
+    def etag(self):
+        return f'W/"{self.boot}.{self.con.execute("PRAGMA data_version").fetchone()[0]}"'
+
+    def get(self, key, etag):
+        hit = self._bodies.get(key)
+        if hit is None or hit[0] != etag:
+            self.misses += 1
+            return None
+        self._bodies.move_to_end(key)
+        self.hits += 1
+        return hit[1]
+
+    def put(self, key, etag, body):
+        self._bodies[key] = (etag, body)
+        self._bodies.move_to_end(key)
+        while len(self._bodies) > self.entries:
+            self._bodies.popitem(last=False)
+
+    def close(self):
+        self.con.close()
+
+
+def _int(query, name, default=None, low=None, high=None):
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        value = int(values[0])
+    except ValueError:
+        raise HttpError(400, f"{name} must be an integer")
+    if low is not None:
+        value = max(low, value)
+    if high is not None:
+        value = min(high, value)
+    return value
+
+
+def _rows(fields, rows):
+    return [dict(zip(fields, r)) for r in rows]
+
+
+def _results(rows):
+    # add_reports() output -> JSON: created rows or per-item errors.
+    out = []
+    for r in rows:
+        if isinstance(r, Exception):
+            out.append({"error": str(r)})
+        else:
+            out.append(dict(zip(REPORT_FIELDS[:6], r)))
+    return out
+
+
+class HealthcareServer:
+    # HTTP/1.1 + JSON over asyncio streams (keep-alive, Content-Length
+    # bodies). Reads run on a thread pool sized to the database's reader
+    # connections; writes go through WriteQueue.
+    def __init__(self, db, service=None):
+        self.db = db
+        self.service = service or HealthcareService(db)
+        self.writes = WriteQueue(self.service)
+        self.cache = ListCache(db.path)
+        self.requests = 0
+        self._readers = ThreadPoolExecutor(max_workers=max(1, db.reader_count),
+                                           thread_name_prefix="healthcare-reader")
+        # (method, path pattern, handler, cached list endpoint)
+        routes = [
+            ("GET", r"/health", self.health, False),
+            ("GET", r"/patients", self.list_patients, True),
+            ("POST", r"/patients", self.add_patient, False),
+            ("GET", r"/patients/(\d+)", self.get_patient, False),
+            ("DELETE", r"/patients/(\d+)", self.delete_patient, False),
+            ("GET", r"/patients/(\d+)/reports", self.list_reports, True),
+            ("GET", r"/patients/(\d+)/compare", self.compare_reports, False),
+            ("GET", r"/patients/(\d+)/alerts", self.patient_alerts, True),
+            ("POST", r"/reports", self.add_reports, False),
+            ("DELETE", r"/reports/(\d+)", self.delete_report, False),
+            ("GET", r"/alerts", self.list_alerts, True),
+            ("POST", r"/alerts/acknowledge", self.acknowledge_alerts, False),
+            ("GET", r"/diseases", self.search_diseases, True),
+            ("GET", r"/diseases/([^/]+)", self.disease_info, False),
+            ("PUT", r"/diseases/([^/]+)", self.save_disease, False),
+            ("GET", r"/symptoms", self.check_symptoms, False),
+            ("POST", r"/symptoms/check", self.check_symptoms, False),
+            ("GET", r"/reminders", self.list_reminders, True),
+            ("POST", r"/reminders", self.add_reminder, False),
+            ("GET", r"/hospitals", self.hospitals, True),
+            ("GET", r"/hospitals/cities", self.hospital_cities, True),
+        ]
+        # Handler names ("GET /patients/{}/reports") label the SQL in diagnostics.
+        self.routes = [(m, re.compile(p + "$"), h, c, f"{m} {re.sub(r'[(].*?[)]', '{}', p)}")
+                       for m, p, h, c in routes]
+
+    def read(self, handler, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self._readers, bind_handler(fn, handler), *args)
+
+    # ---- Handlers: (request, *path groups) -> (status, JSON-able) ----
+    async def health(self, req):
+        return 200, {"ok": True, "requests": self.requests, "write_batches": self.writes.batches,
+                     "batched_reports": self.writes.batched_reports,
+                     "cache_hits": self.cache.hits, "cache_misses": self.cache.misses,
+                     "history_hits": self.service.history.hits, "history_misses": self.service.history.misses,
+                     "alerts_raised": self.service.anomaly.raised}
+
+    async def list_patients(self, req):
+        before = _int(req["query"], "before")
+        limit = _int(req["query"], "limit", PAGE_SIZE, 1, MAX_PAGE)
+        # ?q= narrows the list to name/contact matches, paged the same way.
+        text = (req["query"].get("q") or [""])[0]
+        if text:
+            rows = await self.read(req["name"], self.service.search_patients, text, before, limit)
+        else:
+            rows = await self.read(req["name"], self.service.list_patients, before, limit)
+        return 200, _rows(PATIENT_FIELDS, rows)
+
+    async def add_patient(self, req):
+        body = req["json"] or {}
+        pid = await self.writes.call(req["name"], self.service.add_patient, body.get("name"), body.get("age"),
+                                     body.get("gender", ""), body.get("contact", ""))
+        return 201, {"id": pid}
+
+    async def get_patient(self, req, pid):
+        patient = await self.read(req["name"], self.service.get_patient, int(pid))
+        if patient is None:
+            raise HttpError(404, "no such patient")
+        return 200, patient
+
+    async def delete_patient(self, req, pid):
+        if not await self.writes.call(req["name"], self.service.delete_patient, int(pid)):
+            raise HttpError(404, "no such patient")
+        return 204, None
+
+    async def list_reports(self, req, pid):
+        before = _int(req["query"], "before")
+        limit = _int(req["query"], "limit", PAGE_SIZE, 1, MAX_PAGE)
+        rows = await self.read(req["name"], self.service.list_reports, int(pid), before, limit)
+        return 200, _rows(REPORT_FIELDS, rows)
+
+    async def compare_reports(self, req, pid):
+        result = await self.read(req["name"], self.service.compare_reports, int(pid))
+        if result is None:
+            raise HttpError(404, "need at least 2 reports for comparison")
+        return 200, result
+
+    async def add_reports(self, req):
+        # One report object or a list of them; answers with a list in the
+        # same order (stored rows, or {"error": ...} for rejected items).
+        body = req["json"]
+        single = isinstance(body, dict)
+        items = [body] if single else body
+        if not isinstance(items, list) or not items:
+            raise HttpError(400, "expected a report object or a non-empty list of them")
+        results = _results(await self.writes.add_reports(items))
+        if single:
+            if "error" in results[0]:
+                raise HttpError(400, results[0]["error"])
+            return 201, results[0]
+        return 201, results
+
+    async def delete_report(self, req, rid):
+        if not await self.writes.call(req["name"], self.service.delete_report, int(rid)):
+            raise HttpError(404, "no such report")
+        return 204, None
+
+    async def list_alerts(self, req):
+        # Open (unacknowledged) anomaly alerts, newest first.
+        limit = _int(req["query"], "limit", ALERT_LIMIT, 1, MAX_PAGE)
+        rows = await self.read(req["name"], self.service.open_alerts, limit)
+        return 200, _rows(ALERT_FIELDS, rows)
+
+    async def patient_alerts(self, req, pid):
+        limit = _int(req["query"], "limit", ALERT_LIMIT, 1, MAX_PAGE)
+        rows = await self.read(req["name"], self.service.patient_alerts, int(pid), limit)
+        return 200, _rows(ALERT_FIELDS, rows)
+
+    async def acknowledge_alerts(self, req):
+        body = req["json"]
+        ids = body.get("ids") if isinstance(body, dict) else None
+        if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+            raise HttpError(400, "expected {\"ids\": [alert ids]}")
+        count = await self.writes.call(req["name"], self.service.acknowledge_alerts, ids)
+        return 200, {"acknowledged": count}
+
+    async def search_diseases(self, req):
+        text = (req["query"].get("q") or [""])[0]
+        rows, corrected = await self.read(req["name"], self.service.search_diseases, text)
+        return 200, {"results": [{"name": n, "details": d} for n, d in rows], "corrected": corrected}
+
+    async def disease_info(self, req, name):
+        found = await self.read(req["name"], self.service.disease_info, unquote(name))
+        if found is None:
+            raise HttpError(404, "disease not found")
+        info, searched, corrected = found
+        return 200, dict(info, searched=searched, corrected=corrected)
+
+    async def save_disease(self, req, name):
+        body = req["json"] or {}
+        created = await self.writes.call(req["name"], self.service.save_disease, unquote(name),
+                                         body.get("details", ""), body.get("symptoms", ""),
+                                         bool(body.get("treatable")), body.get("medicines", ""),
+                                         body.get("hospitals", ""))
+        return (201 if created else 200), {"name": unquote(name).strip().lower(), "created": created}
+
+    async def check_symptoms(self, req):
+        if req["method"] == "POST":
+            body = req["json"]
+            symptoms = body.get("symptoms") if isinstance(body, dict) else None
+            if not isinstance(symptoms, str) and not (
+                    isinstance(symptoms, list) and all(isinstance(s, str) for s in symptoms)):
+                raise HttpError(400, "expected {\"symptoms\": [symptom names]} or a comma separated string")
+        else:
+            symptoms = (req["query"].get("q") or [""])[0]
+        rows = await self.read(req["name"], self.service.check_symptoms, symptoms)
+        return 200, [{"name": n, "details": d, "matches": c, "matched": sorted(m), "symptoms": sorted(a)}
+                     for n, d, c, m, a in rows]
+
+    async def list_reminders(self, req):
+        user_id = _int(req["query"], "user_id", 1)
+        rows = await self.read(req["name"], self.service.reminders_for, user_id)
+        return 200, [{"medicine": m, "remind_at": r, "done": bool(d), "repeat": rep} for m, r, d, rep in rows]
+
+    async def add_reminder(self, req):
+        body = req["json"] or {}
+        rid = await self.writes.call(req["name"], self.service.add_reminder, body.get("user_id", 1),
+                                     body.get("medicine"), body.get("remind_at"), body.get("repeat"),
+                                     body.get("patient_id"))
+        return 201, {"id": rid}
+
+    async def hospitals(self, req):
+        query = req["query"]
+        city, specialty, disease = ((query.get(k) or [""])[0] for k in ("city", "specialty", "disease"))
+        before = _int(query, "before")
+        limit = _int(query, "limit", HOSPITAL_PAGE, 1, MAX_PAGE)
+        rows = await self.read(req["name"], self.service.hospitals, city, specialty, disease, before, limit)
+        return 200, _rows(HOSPITAL_FIELDS, rows)
+
+    async def hospital_cities(self, req):
+        return 200, await self.read(req["name"], self.service.hospital_cities)
+
+    # ---- HTTP plumbing ----
+    async def dispatch(self, method, target, headers, body):
+        # Returns (status, extra headers, body bytes).
+        url = urlsplit(target)
+        allowed = []
+        for route_method, pattern, handler, cached, name in self.routes:
+            m = pattern.match(url.path)
+            if not m:
+                continue
+            if route_method != method:
+                allowed.append(route_method)
+                continue
+            req = {"method": method, "query": parse_qs(url.query), "name": name}
+            if cached:
+                etag = self.cache.etag()
+                if headers.get("if-none-match") == etag:
+                    return 304, {"ETag": etag}, b""
+                hit = self.cache.get(target, etag)
+                if hit is not None:
+                    return 200, {"ETag": etag}, hit
+            try:
+                req["json"] = json.loads(body) if body else None
+            except ValueError:
+                raise HttpError(400, "body is not valid JSON")
+            status, payload = await handler(req, *m.groups())
+            data = b"" if payload is None else json.dumps(payload).encode()
+            if cached:
+                self.cache.put(target, etag, data)
+                return status, {"ETag": etag}, data
+            return status, {}, data
+        if allowed:
+            raise HttpError(405, f"use {', '.join(allowed)}")
+        raise HttpError(404, "no such endpoint")
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                for _ in range(MAX_HEADERS):
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = h.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = (headers.get("connection", "").lower() != "close"
+                              and (version != "HTTP/1.0" or headers.get("connection", "").lower() == "keep-alive"))
+                self.requests += 1
+                try:
+                    length = int(headers.get("content-length") or 0)
+                    if length > MAX_BODY:
+                        raise HttpError(413, "body too large")
+                    body = await reader.readexactly(length) if length else b""
+                    status, extra, data = await self.dispatch(method, target, headers, body)
+                except HttpError as exc:
+                    status, extra, data = exc.status, {}, json.dumps({"error": str(exc)}).encode()
+                except ValueError as exc:  # validation in the service layer
+                    status, extra, data = 400, {}, json.dumps({"error": str(exc)}).encode()
+                except Exception as exc:
+                    status, extra, data = 500, {}, json.dumps({"error": f"{type(exc).__name__}: {exc}"}).encode()
+                head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"Content-Length: {len(data)}",
+                        "Connection: " + ("keep-alive" if keep_alive else "close")]
+                if data:
+                    head.append("Content-Type: application/json")
+                head += [f"{k}: {v}" for k, v in extra.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+        server = await asyncio.start_server(self.handle, host, port)
+        write_task = asyncio.create_task(self.writes.run())
+        if ready:
+            ready(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            write_task.cancel()
+
+    def close(self):
+        self.writes.close()
+        self._readers.shutdown(wait=True)
+        self.cache.close()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve the healthcare database over HTTP/JSON")
+    parser.add_argument("db", nargs="?", default=DB_FILE)
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--readers", type=int, default=READER_POOL_SIZE, help="concurrent reader connections")
+    parser.add_argument("--slow-log", default=SLOW_LOG_FILE, help="slow-query log file ('' to disable)")
+    args = parser.parse_args(argv)
+    db = Database(args.db, readers=args.readers)
+    if args.slow_log:
+        db.tracer.enable_slow_log(args.slow_log)
+    init_db(db)
+    app = HealthcareServer(db)
+    ready = lambda server: print(f"serving {args.db} on http://{args.host}:{args.port}", file=sys.stderr, flush=True)
+    try:
+        asyncio.run(app.serve(args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        app.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
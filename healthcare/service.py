@@ -0,0 +1,335 @@
+import json
+import sqlite3
+
+from healthcare.analytics import BANDS, LABELS, METRICS, get_band_simple, triage, verdict
+from healthcare.anomaly import ALERT_LIMIT, AnomalyDetector
+from healthcare.bulk_import import import_reports
+from healthcare.coldstore import ColdStore
+from healthcare.db import MAX_ID, QUERIES, now_str, parse_bp
+from healthcare.export import export_reports
+from healthcare.history import HistoryCache
+from healthcare.hospitals import HOSPITAL_PAGE, HospitalDirectory, link_disease
+from healthcare.purge import inactive_patients, purge_patients
+from healthcare.reminders import ReminderScheduler
+from healthcare.search import PATIENT_PAGE, RESULT_LIMIT, DiseaseSearch, PatientSearch
+from healthcare.summary import stddev
+from healthcare.symptoms import SymptomIndex, split_symptoms
+
+PAGE_SIZE = 100
+PATIENT_FIELDS = ("id", "name", "age", "gender", "contact")
+REPORT_FIELDS = ("id", "month", "bp_systolic", "bp_diastolic", "sugar", "uric_acid", "created_at")
+DISEASE_FIELDS = ("details", "symptoms", "treatable", "medicines", "hospitals", "notes")
+
+
+def _number(value, name):
+    # "" / None -> None; anything else must parse as a float.
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number")
+
+
+class HealthcareService:
+    # The app's operations without Tk: the GUI handlers, the benchmarks and
+    # the HTTP server all call these. Inputs are validated here (ValueError
+    # with a user-facing message); results are plain tuples/dicts. Methods are
+    # safe to call from worker threads.
+    def __init__(self, db):
+        self.db = db
+        self.symptoms = SymptomIndex(db)
+        self.disease_search = DiseaseSearch(db)
+        self.patient_search = PatientSearch(db)
+        self.reminders = ReminderScheduler(db)
+        self.cold = ColdStore(db)
+        self.history = HistoryCache(db, self.cold)
+        self.anomaly = AnomalyDetector(db)
+        self.hospital_directory = HospitalDirectory(db)
+
+    # ---- Patients ----
+    def add_patient(self, name, age=None, gender="", contact=""):
+        name = (name or "").strip()
+        if not name:
+            raise ValueError("Name required")
+        try:
+            age = int(age) if age not in (None, "") else None
+        except (TypeError, ValueError):
+            age = None
+        with self.db.writer() as con:
+            return con.execute(QUERIES["patients.insert"],
+                               (name, age, (gender or "").strip(), (contact or "").strip(), now_str())).lastrowid
+
+    def delete_patient(self, patient_id):
+        # Removes the patient; their reports and reminders cascade. False if
+        # there was no such patient.
+        with self.db.writer() as con:
+            deleted = con.execute(QUERIES["patients.delete"], (patient_id,)).rowcount > 0
+            self.db.after_commit(self.history.invalidate, patient_id)
+        return deleted
+
+    def purge_patients(self, patient_ids, archive=False, **kwargs):
+        # Many patients at once, in chunks; see healthcare.purge.
+        try:
+            return purge_patients(self.db, patient_ids, archive, **kwargs)
+        finally:
+            for pid in patient_ids:
+                self.history.invalidate(int(pid))
+
+    def inactive_patients(self, before_month):
+        return inactive_patients(self.db, before_month)
+
+    def get_patient(self, patient_id):
+        with self.db.reader() as con:
+            row = con.execute(QUERIES["patients.get"], (patient_id,)).fetchone()
+        return dict(zip(PATIENT_FIELDS + ("created_at",), row)) if row else None
+
+    def patient_count(self):
+        with self.db.reader() as con:
+            return con.execute(QUERIES["patients.count"]).fetchone()[0]
+
+    def list_patients(self, before_id=None, limit=PAGE_SIZE):
+        # Newest first, keyset-paged: pass the last id of a page to get the next.
+        with self.db.reader() as con:
+            return con.execute(QUERIES["patients.page"], (before_id or MAX_ID, limit)).fetchall()
+
+    def search_patients(self, text, before_id=None, limit=PATIENT_PAGE):
+        # Name/contact substring matches, newest first and keyset-paged like list_patients.
+        return self.patient_search.search(text, before_id, limit)
+
+    # ---- Reports ----
+    def _report_values(self, patient_id, month, bp, sugar=None, uric_acid=None):
+        # bp is "120/80" (or just the systolic value).
+        try:
+            patient_id = int(patient_id)
+        except (TypeError, ValueError):
+            raise ValueError("patient_id must be an integer")
+        month = (month or "").strip()
+        bp_sys, bp_dia = parse_bp(str(bp or ""))
+        sugar = _number(sugar, "Sugar")
+        uric_acid = _number(uric_acid, "Uric acid")
+        if not month or bp_sys is None:
+            raise ValueError("Month and BP required.")
+        return patient_id, month, bp_sys, bp_dia, sugar, uric_acid
+
+    def add_report(self, patient_id, month, bp, sugar=None, uric_acid=None):
+        # Returns the report row (id, month, sys, dia, sugar, uric) as stored.
+        values = self._report_values(patient_id, month, bp, sugar, uric_acid)
+        created = now_str()
+        try:
+            with self.db.writer() as con:
+                rid = con.execute(QUERIES["reports.insert"], values + (created,)).lastrowid
+                self.anomaly.observe(con, [(rid,) + values], created)
+                self.db.after_commit(self.history.invalidate, patient_id)
+        except sqlite3.IntegrityError:
+            raise ValueError("No such patient")
+        return (rid,) + values[1:]
+
+    def add_reports(self, items):
+        # Batch form of add_report() for many submissions: items are dicts with
+        # patient_id, month, bp, sugar, uric_acid. Valid ones are written in a
+        # single transaction. Returns, per item, the stored row or the
+        # ValueError that rejected it.
+        out, valid = [], []
+        for item in items:
+            try:
+                values = self._report_values(item.get("patient_id"), item.get("month"), item.get("bp"),
+                                             item.get("sugar"), item.get("uric_acid"))
+            except (ValueError, AttributeError) as exc:
+                out.append(exc if isinstance(exc, ValueError) else ValueError("report must be an object"))
+                continue
+            out.append(None)
+            valid.append((len(out) - 1, values))
+        if valid:
+            created = now_str()
+            patient_ids = json.dumps(sorted({values[0] for _, values in valid}))
+            with self.db.writer() as con:
+                # Checked up front: one foreign-key failure would roll back the batch.
+                known = {pid for pid, _ in con.execute(QUERIES["patients.names"], (patient_ids,))}
+                written = []
+                for i, values in valid:
+                    if values[0] not in known:
+                        out[i] = ValueError("No such patient")
+                        continue
+                    rid = con.execute(QUERIES["reports.insert"], values + (created,)).lastrowid
+                    out[i] = (rid,) + values[1:]
+                    written.append((rid,) + values)
+                self.anomaly.observe(con, written, created)
+                for pid in known:
+                    self.db.after_commit(self.history.invalidate, pid)
+        return out
+
+    def delete_report(self, report_id):
+        with self.db.writer() as con:
+            row = con.execute(QUERIES["reports.patient"], (report_id,)).fetchone()
+            if row is None:
+                return False
+            con.execute(QUERIES["reports.delete"], (report_id,))
+            self.db.after_commit(self.history.invalidate, row[0])
+        return True
+
+    def report_count(self, patient_id):
+        with self.db.reader() as con:
+            return con.execute(QUERIES["reports.count"], (patient_id,)).fetchone()[0]
+
+    def list_reports(self, patient_id, before_id=None, limit=PAGE_SIZE):
+        # Newest first, keyset-paged like list_patients().
+        with self.db.reader() as con:
+            return con.execute(QUERIES["reports.page"], (patient_id, before_id or MAX_ID, limit)).fetchall()
+
+    def report_history(self, patient_id):
+        # The patient's History (both tiers) from the cache.
+        return self.history.get(patient_id)
+
+    def chart_rows(self, patient_id):
+        # Live and moved reports alike, in (month, id) order.
+        return self.history.get(patient_id).chart_rows()
+
+    def compare_reports(self, patient_id):
+        # Latest vs previous report, banded, plus history statistics from
+        # the summaries of both tiers, all from the cached history. None if
+        # the patient has fewer than two reports.
+        history = self.history.get(patient_id)
+        if len(history) < 2:
+            return None
+        latest, previous = history.last(2)
+        summary = history.stats
+        metrics = []
+        for k, (metric, name) in enumerate(METRICS, start=2):
+            prev_v, latest_v = previous[k], latest[k]
+            prev_band = get_band_simple(prev_v, BANDS[metric], LABELS)
+            latest_band = get_band_simple(latest_v, BANDS[metric], LABELS)
+            n = summary[f"{metric}_n"]
+            metrics.append({
+                "metric": metric, "name": name,
+                "latest": latest_v, "latest_band": latest_band,
+                "previous": prev_v, "previous_band": prev_band,
+                "verdict": verdict(prev_band, latest_band),
+                "n": n,
+                "min": summary[f"{metric}_min"] if n else None,
+                "max": summary[f"{metric}_max"] if n else None,
+                "mean": summary[f"{metric}_mean"] if n else None,
+                "stddev": stddev(summary, metric),
+            })
+        return {
+            "patient_id": patient_id,
+            "report_count": summary["report_count"],
+            "latest_month": latest[1],
+            "previous_month": previous[1],
+            "metrics": metrics,
+        }
+
+    def triage(self, month=None, worse_only=True):
+        return triage(self.db, month, worse_only, cold=self.cold)
+
+    def export_reports(self, path, patient_ids=None, **kwargs):
+        return export_reports(self.db, path, patient_ids, cold=self.cold, **kwargs)
+
+    def import_reports(self, source, mode="append", rejects_path=None, **kwargs):
+        try:
+            return import_reports(self.db, source, mode, rejects_path, detector=self.anomaly, **kwargs)
+        finally:
+            self.history.clear()
+
+    # ---- Alerts ----
+    def open_alerts(self, limit=ALERT_LIMIT):
+        # Unacknowledged anomaly alerts, newest first (ALERT_FIELDS rows).
+        with self.db.reader() as con:
+            return con.execute(QUERIES["alerts.open"], (0, limit)).fetchall()
+
+    def open_alert_count(self):
+        with self.db.reader() as con:
+            return con.execute(QUERIES["alerts.open_count"]).fetchone()[0]
+
+    def patient_alerts(self, patient_id, limit=ALERT_LIMIT):
+        with self.db.reader() as con:
+            return con.execute(QUERIES["alerts.by_patient"], (patient_id, limit)).fetchall()
+
+    def acknowledge_alerts(self, alert_ids):
+        # Returns how many were still open.
+        with self.db.writer() as con:
+            return con.execute(QUERIES["alerts.acknowledge"], (json.dumps([int(a) for a in alert_ids]),)).rowcount
+
+    # ---- Diseases ----
+    def disease_info(self, name):
+        # Exact (case-insensitive) name first, then the best full-text /
+        # typo-tolerant match. Returns (info dict, matched by search,
+        # corrected query or None), or None if nothing matches.
+        name = (name or "").strip().lower()
+        if not name:
+            raise ValueError("Enter disease name")
+        with self.db.reader() as con:
+            row = con.execute(QUERIES["diseases.by_name"], (name,)).fetchone()
+        searched, corrected = False, None
+        if row is None:
+            rows, corrected = self.disease_search.search(name, limit=1)
+            if not rows:
+                return None
+            searched, name = True, rows[0][0].lower()
+            with self.db.reader() as con:
+                row = con.execute(QUERIES["diseases.by_name"], (name,)).fetchone()
+            if row is None:
+                return None
+        info = dict(zip(DISEASE_FIELDS, row))
+        info["name"] = name
+        return info, searched, corrected
+
+    def search_diseases(self, text, limit=RESULT_LIMIT):
+        # ([(name, details)], corrected query or None) for type-ahead.
+        return self.disease_search.search(text, limit)
+
+    def save_disease(self, name, details="", symptoms="", treatable=False, medicines="", hospitals=""):
+        # Inserts or updates by name; returns True if it was a new disease.
+        # The hospital names are linked to the directory in the same write.
+        name = (name or "").strip().lower()
+        if not name:
+            raise ValueError("Name required")
+        treat = 1 if treatable else 0
+        with self.db.writer() as con:
+            row = con.execute(QUERIES["diseases.id_by_name"], (name,)).fetchone()
+            if row:
+                con.execute(QUERIES["diseases.update"], (details, symptoms, treat, medicines, hospitals, name))
+                disease_id, created = row[0], False
+            else:
+                disease_id = con.execute(QUERIES["diseases.insert"],
+                                         (name, details, symptoms, treat, medicines, hospitals, "")).lastrowid
+                created = True
+            link_disease(con, disease_id, hospitals)
+            self.symptoms.refresh_disease(con, name)
+        return created
+
+    def check_symptoms(self, symptoms):
+        # symptoms: "fever, cough" or an iterable of names. Returns
+        # (name, details, match count, matched, all symptoms), best first.
+        if isinstance(symptoms, str):
+            symptoms = split_symptoms(symptoms)
+        wanted = {s.strip().lower() for s in symptoms if s.strip()}
+        if not wanted:
+            raise ValueError("Please enter at least one symptom.")
+        return self.symptoms.check(wanted)
+
+    # ---- Hospitals and reminders ----
+    def hospitals(self, city=None, specialty=None, disease=None, before_id=None, limit=HOSPITAL_PAGE):
+        # (id, name, city, specialty, contact) in a city (optionally of one
+        # specialty) or linked to a disease, or all; newest first, keyset-paged.
+        return self.hospital_directory.lookup(city, specialty, disease, before_id, limit)
+
+    def hospital_cities(self):
+        return self.hospital_directory.cities()
+
+    def hospital_specialties(self, city):
+        return self.hospital_directory.specialties(city)
+
+    def add_reminder(self, user_id, medicine, remind_at, repeat=None, patient_id=None):
+        medicine = (medicine or "").strip()
+        if not medicine or not (remind_at or "").strip():
+            raise ValueError("Medicine name and time required.")
+        try:
+            return self.reminders.add(user_id, medicine, remind_at.strip(), patient_id, repeat)
+        except sqlite3.IntegrityError:
+            raise ValueError("No such patient")
+
+    def reminders_for(self, user_id):
+        # (medicine, remind_at, done, repeat), soonest first.
+        with self.db.reader() as con:
+            return con.execute(QUERIES["reminders.by_user"], (user_id,)).fetchall()
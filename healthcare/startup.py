@@ -0,0 +1,59 @@
+import builtins
+import sys
+import time
+
+# Imported first by the GUI so the clock starts before the heavy imports.
+T0 = time.perf_counter()
+FLAG = "--profile-startup"
+MIN_IMPORT_MS = 1.0
+
+
+class StartupProfile:
+    # Timing breakdown for --profile-startup. When enabled, every top-level
+    # import statement is timed (inclusive of what it pulls in) by wrapping
+    # builtins.__import__; mark() records the initialization phases.
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.imports = []
+        self.phases = []
+        self._last = T0
+        self._depth = 0
+        self._real_import = builtins.__import__
+        if enabled:
+            builtins.__import__ = self._timed_import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if self._depth or name in sys.modules:
+            return self._real_import(name, globals, locals, fromlist, level)
+        self._depth += 1
+        t = time.perf_counter()
+        try:
+            return self._real_import(name, globals, locals, fromlist, level)
+        finally:
+            self._depth -= 1
+            self.imports.append((name, time.perf_counter() - t))
+
+    def mark(self, label):
+        now = time.perf_counter()
+        self.phases.append((label, now - self._last))
+        self._last = now
+
+    def stop(self):
+        if builtins.__import__ == self._timed_import:
+            builtins.__import__ = self._real_import
+
+    def report(self, out=None):
+        out = out or sys.stderr
+        self.stop()
+        print("Startup profile (ms)", file=out)
+        slow = [(n, s) for n, s in self.imports if s * 1000 >= MIN_IMPORT_MS]
+        if slow:
+            print("  imports:", file=out)
+            for name, secs in sorted(slow, key=lambda i: -i[1]):
+                print(f"    {secs * 1000:8.1f}  {name}", file=out)
+        for label, secs in self.phases:
+            print(f"  {secs * 1000:8.1f}  {label}", file=out)
+        print(f"  {(self._last - T0) * 1000:8.1f}  total", file=out, flush=True)
+
+
+PROFILE = StartupProfile(FLAG in sys.argv)
@@ -0,0 +1,408 @@
+import json
+import math
+import sys
+from contextlib import contextmanager
+
+from healthcare.analytics import BANDS, LABELS, METRICS
+from healthcare.db import (DB_FILE, QUERIES, Database, add_paused_column, create_version_triggers,
+                          drop_version_triggers, migrate, pause_triggers)
+
+# patient_summary keeps one row per patient with reports: the latest and
+# previous report, and per metric a running count, sum, Welford mean/M2,
+# min/max, the latest and previous values and the band of the latest value.
+# Triggers on reports keep it current, so every writer (the dialogs, bulk
+# import, deletes) updates it in the same transaction. Bulk writers can pause
+# the triggers and merge their rows in one set-based pass (see deferred()).
+SUMMARY_TABLE = "patient_summary"
+REL_TOLERANCE = 1e-6
+# Report ordering used everywhere: newest month first, then newest id.
+NEWEST_FIRST = "ORDER BY month DESC, id DESC"
+# deferred() drops the triggers for this many reports or more: a paused
+# trigger still fires per row (about 6 us), which outweighs every reader
+# re-preparing its statements once after the schema change.
+DDL_ROWS = 10000
+
+
+def _metric_names():
+    return [m for m, _ in METRICS]
+
+
+def _band_case(col, metric):
+    parts = [f"WHEN {col} IS NULL THEN 'N/A'"]
+    for (low, high), label in zip(BANDS[metric], LABELS):
+        parts.append(f"WHEN {col} BETWEEN {low} AND {high} THEN '{label}'")
+    return f"CASE {' '.join(parts)} ELSE '{LABELS[-1]}' END"
+
+
+def summary_columns():
+    cols = ["report_count", "latest_id", "latest_month", "previous_id", "previous_month"]
+    for m in _metric_names():
+        cols += [f"{m}_n", f"{m}_sum", f"{m}_mean", f"{m}_m2", f"{m}_min", f"{m}_max",
+                 f"{m}_latest", f"{m}_previous", f"{m}_band"]
+    return cols
+
+
+def _create_table_sql():
+    lines = [
+        "patient_id INTEGER PRIMARY KEY",
+        "report_count INTEGER NOT NULL DEFAULT 0",
+        "latest_id INTEGER", "latest_month TEXT",
+        "previous_id INTEGER", "previous_month TEXT",
+    ]
+    for m in _metric_names():
+        lines += [
+            f"{m}_n INTEGER NOT NULL DEFAULT 0",
+            f"{m}_sum REAL NOT NULL DEFAULT 0.0",
+            f"{m}_mean REAL NOT NULL DEFAULT 0.0",
+            f"{m}_m2 REAL NOT NULL DEFAULT 0.0",
+            # NUMERIC keeps integer readings (BP) as integers.
+            f"{m}_min NUMERIC", f"{m}_max NUMERIC",
+            f"{m}_latest NUMERIC", f"{m}_previous NUMERIC",
+            f"{m}_band TEXT GENERATED ALWAYS AS ({_band_case(f'{m}_latest', m)}) VIRTUAL",
+        ]
+    body = ",\n            ".join(lines)
+    return f"CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE}(\n            {body}\n        )"
+
+
+def _newer(row, a_id, a_month):
+    # True when report `row` sorts before (is newer than) the stored one.
+    return f"({a_id} IS NULL OR {row}.month > {a_month} OR ({row}.month = {a_month} AND {row}.id > {a_id}))"
+
+
+def _add_sql(row):
+    # Welford: n' = n + 1, mean' = mean + (x - mean) / n', M2' = M2 + (x - mean)(x - mean').
+    # Every right-hand side sees the pre-update row.
+    sets = ["report_count = report_count + 1"]
+    for m in _metric_names():
+        x = f"{row}.{m}"
+        new_mean = f"({m}_mean + ({x} - {m}_mean) / ({m}_n + 1.0))"
+        sets += [
+            f"{m}_n = {m}_n + ({x} IS NOT NULL)",
+            f"{m}_sum = {m}_sum + coalesce({x}, 0)",
+            f"{m}_mean = CASE WHEN {x} IS NULL THEN {m}_mean ELSE {new_mean} END",
+            f"{m}_m2 = CASE WHEN {x} IS NULL THEN {m}_m2 ELSE {m}_m2 + ({x} - {m}_mean) * ({x} - {new_mean}) END",
+            f"{m}_min = CASE WHEN {x} IS NULL OR {x} >= {m}_min THEN {m}_min ELSE {x} END",
+            f"{m}_max = CASE WHEN {x} IS NULL OR {x} <= {m}_max THEN {m}_max ELSE {x} END",
+        ]
+    stats = f"UPDATE {SUMMARY_TABLE} SET {', '.join(sets)} WHERE patient_id = {row}.patient_id;"
+    # The new report becomes the latest (latest moves to previous) or the previous.
+    metrics = _metric_names()
+    shift = (f"UPDATE {SUMMARY_TABLE} SET "
+             f"(previous_id, previous_month, {', '.join(f'{m}_previous' for m in metrics)}) = "
+             f"(latest_id, latest_month, {', '.join(f'{m}_latest' for m in metrics)}), "
+             f"(latest_id, latest_month, {', '.join(f'{m}_latest' for m in metrics)}) = "
+             f"({row}.id, {row}.month, {', '.join(f'{row}.{m}' for m in metrics)}) "
+             f"WHERE patient_id = {row}.patient_id AND {_newer(row, 'latest_id', 'latest_month')};")
+    second = (f"UPDATE {SUMMARY_TABLE} SET "
+              f"(previous_id, previous_month, {', '.join(f'{m}_previous' for m in metrics)}) = "
+              f"({row}.id, {row}.month, {', '.join(f'{row}.{m}' for m in metrics)}) "
+              f"WHERE patient_id = {row}.patient_id AND {row}.id IS NOT latest_id "
+              f"AND {_newer(row, 'previous_id', 'previous_month')};")
+    return [f"INSERT OR IGNORE INTO {SUMMARY_TABLE}(patient_id) VALUES ({row}.patient_id);", stats, shift, second]
+
+
+def _remove_sql(row):
+    # Reverse Welford: mean' = (n mean - x) / (n - 1), M2' = M2 - (x - mean)(x - mean').
+    # min/max and latest/previous are re-read through the (patient_id, month)
+    # index, but only when the removed report held them.
+    sets = ["report_count = report_count - 1"]
+    for m in _metric_names():
+        x = f"{row}.{m}"
+        new_mean = f"(({m}_n * {m}_mean - {x}) / ({m}_n - 1.0))"
+        history = f"FROM reports WHERE patient_id = {row}.patient_id AND {m} IS NOT NULL"
+        sets += [
+            f"{m}_n = {m}_n - ({x} IS NOT NULL)",
+            f"{m}_sum = {m}_sum - coalesce({x}, 0)",
+            f"{m}_mean = CASE WHEN {x} IS NULL THEN {m}_mean WHEN {m}_n <= 1 THEN 0.0 ELSE {new_mean} END",
+            f"{m}_m2 = CASE WHEN {x} IS NULL THEN {m}_m2 WHEN {m}_n <= 2 THEN 0.0 "
+            f"ELSE max(0.0, {m}_m2 - ({x} - {m}_mean) * ({x} - {new_mean})) END",
+            f"{m}_min = CASE WHEN {x} IS NULL OR {x} > {m}_min THEN {m}_min ELSE (SELECT MIN({m}) {history}) END",
+            f"{m}_max = CASE WHEN {x} IS NULL OR {x} < {m}_max THEN {m}_max ELSE (SELECT MAX({m}) {history}) END",
+        ]
+    stats = f"UPDATE {SUMMARY_TABLE} SET {', '.join(sets)} WHERE patient_id = {row}.patient_id;"
+    reread = _reread_sql(f"patient_id = {row}.patient_id AND {row}.id IN (latest_id, previous_id)") + ";"
+    drop = f"DELETE FROM {SUMMARY_TABLE} WHERE patient_id = {row}.patient_id AND report_count <= 0;"
+    return [stats, reread, drop]
+
+
+def _reread_sql(where):
+    # Reloads the latest and previous report through the (patient_id, month) index.
+    metrics = _metric_names()
+    cols = f"id, month, {', '.join(metrics)}"
+    history = f"FROM reports WHERE patient_id = {SUMMARY_TABLE}.patient_id {NEWEST_FIRST}"
+    return (f"UPDATE {SUMMARY_TABLE} SET "
+            f"(latest_id, latest_month, {', '.join(f'{m}_latest' for m in metrics)}) = "
+            f"(SELECT {cols} {history} LIMIT 1), "
+            f"(previous_id, previous_month, {', '.join(f'{m}_previous' for m in metrics)}) = "
+            f"(SELECT {cols} {history} LIMIT 1 OFFSET 1) "
+            f"WHERE {where}")
+
+
+TRIGGER_EVENTS = ("insert", "delete", "update")
+
+
+def create_triggers(con):
+    watched = ", ".join(["patient_id", "month"] + _metric_names())
+    triggers = {
+        "insert": ("AFTER INSERT ON reports", _add_sql("new")),
+        "delete": ("AFTER DELETE ON reports", _remove_sql("old")),
+        # An edit is the old report leaving and the new one arriving.
+        "update": (f"AFTER UPDATE OF {watched} ON reports", _remove_sql("old") + _add_sql("new")),
+    }
+    # Skipped while reports are paused (see deferred()).
+    active = "WHEN NOT (SELECT paused FROM table_versions WHERE name = 'reports')"
+    add_paused_column(con)
+    drop_triggers(con)
+    for event, (when, body) in triggers.items():
+        con.execute(f"CREATE TRIGGER trg_reports_summary_{event} {when} {active} BEGIN\n"
+                    + "\n".join(body) + "\nEND")
+
+
+def drop_triggers(con):
+    for event in TRIGGER_EVENTS:
+        con.execute(f"DROP TRIGGER IF EXISTS trg_reports_summary_{event}")
+
+
+def create_summary(con):
+    # Table and triggers only; fill it with rebuild_summary().
+    con.execute(_create_table_sql())
+    create_triggers(con)
+
+
+def _aggregate_sql(where="", source="reports"):
+    metrics = _metric_names()
+    agg = ["patient_id", "COUNT(*) AS report_count"]
+    for m in metrics:
+        agg += [f"COUNT({m}) AS {m}_n", f"coalesce(SUM({m}), 0.0) AS {m}_sum",
+                f"coalesce(AVG({m}), 0.0) AS {m}_mean",
+                f"max(coalesce(SUM({m} * {m}) - 1.0 * SUM({m}) * SUM({m}) / COUNT({m}), 0.0), 0.0) AS {m}_m2",
+                f"MIN({m}) AS {m}_min", f"MAX({m}) AS {m}_max"]
+    return f"SELECT {', '.join(agg)} FROM {source} {where} GROUP BY patient_id"
+
+
+def _expected_sql(where=""):
+    # Recomputes summary rows from reports (all patients, or those matching
+    # `where`): one grouped pass along the patient_id index, plus two index
+    # probes per patient for the latest and previous report. M2 comes from
+    # the population variance, so it can differ from the running Welford
+    # value in the last few bits.
+    metrics = _metric_names()
+    select = ["a.patient_id", "a.report_count", "l1.id", "l1.month", "l2.id", "l2.month"]
+    for m in metrics:
+        select += [f"a.{m}_n", f"a.{m}_sum", f"a.{m}_mean", f"a.{m}_m2", f"a.{m}_min", f"a.{m}_max",
+                   f"l1.{m}", f"l2.{m}"]
+    pick = f"SELECT id FROM reports WHERE patient_id = a.patient_id {NEWEST_FIRST} LIMIT 1"
+    return (f"SELECT {', '.join(select)} "
+            f"FROM ({_aggregate_sql(where)}) a "
+            f"JOIN reports l1 ON l1.id = ({pick}) "
+            f"LEFT JOIN reports l2 ON l2.id = ({pick} OFFSET 1) "
+            f"ORDER BY a.patient_id")
+
+
+def _stored_columns():
+    return ["patient_id"] + [c for c in summary_columns() if not c.endswith("_band")]
+
+
+def rebuild_summary(con):
+    # Replaces the whole table from reports; returns the number of patients.
+    con.execute(f"DELETE FROM {SUMMARY_TABLE}")
+    cols = ", ".join(_stored_columns())
+    return con.execute(f"INSERT INTO {SUMMARY_TABLE}({cols}) {_expected_sql()}").rowcount
+
+
+def refresh_patients(con, patient_ids):
+    # Recomputes the rows of just these patients (an index probe each).
+    ids = json.dumps(sorted(patient_ids))
+    where = "WHERE patient_id IN (SELECT value FROM json_each(?))"
+    con.execute(f"DELETE FROM {SUMMARY_TABLE} {where}", (ids,))
+    cols = ", ".join(_stored_columns())
+    con.execute(f"INSERT INTO {SUMMARY_TABLE}({cols}) {_expected_sql(where)}", (ids,))
+
+
+def stats_columns():
+    # The count and running statistics, without latest/previous.
+    cols = ["report_count"]
+    for m in _metric_names():
+        cols += [f"{m}_n", f"{m}_sum", f"{m}_mean", f"{m}_m2", f"{m}_min", f"{m}_max"]
+    return cols
+
+
+def create_stats_table(con, table):
+    # A per-patient table of stats_columns() for reports kept outside the
+    # reports table; rows go with their patient. Filled by merge_stats().
+    lines = ["patient_id INTEGER PRIMARY KEY REFERENCES patients(id) ON DELETE CASCADE",
+             "report_count INTEGER NOT NULL DEFAULT 0"]
+    for m in _metric_names():
+        lines += [f"{m}_n INTEGER NOT NULL DEFAULT 0", f"{m}_sum REAL NOT NULL DEFAULT 0.0",
+                  f"{m}_mean REAL NOT NULL DEFAULT 0.0", f"{m}_m2 REAL NOT NULL DEFAULT 0.0",
+                  f"{m}_min NUMERIC", f"{m}_max NUMERIC"]
+    body = ",\n            ".join(lines)
+    con.execute(f"CREATE TABLE IF NOT EXISTS {table}(\n            {body}\n        )")
+
+
+def merge_stats(con, table, where, params=(), source="reports"):
+    # Combines the per-patient aggregates of the `source` rows matching
+    # `where` with the stored ones (Chan et al.'s parallel form of Welford).
+    metrics = _metric_names()
+    cols = ["patient_id", "report_count"]
+    sets = ["report_count = report_count + excluded.report_count"]
+    for m in metrics:
+        cols += [f"{m}_n", f"{m}_sum", f"{m}_mean", f"{m}_m2", f"{m}_min", f"{m}_max"]
+        n = f"({m}_n + excluded.{m}_n)"
+        delta = f"(excluded.{m}_mean - {m}_mean)"
+        sets += [
+            f"{m}_n = {n}",
+            f"{m}_sum = {m}_sum + excluded.{m}_sum",
+            f"{m}_mean = CASE WHEN {n} = 0 THEN 0.0 ELSE {m}_mean + {delta} * excluded.{m}_n / {n} END",
+            f"{m}_m2 = CASE WHEN {n} = 0 THEN 0.0 "
+            f"ELSE {m}_m2 + excluded.{m}_m2 + {delta} * {delta} * {m}_n * excluded.{m}_n / {n} END",
+            f"{m}_min = coalesce(min({m}_min, excluded.{m}_min), {m}_min, excluded.{m}_min)",
+            f"{m}_max = coalesce(max({m}_max, excluded.{m}_max), {m}_max, excluded.{m}_max)",
+        ]
+    con.execute(f"INSERT INTO {table}({', '.join(cols)}) "
+                f"SELECT * FROM ({_aggregate_sql(where, source)}) WHERE true "
+                f"ON CONFLICT(patient_id) DO UPDATE SET {', '.join(sets)}", params)
+
+
+def combine_stats(a, b):
+    # merge_stats() for two dicts holding stats_columns() (either may be
+    # None); other keys of `a` are kept.
+    if a is None or b is None:
+        return a if b is None else b
+    out = dict(a)
+    out["report_count"] = a["report_count"] + b["report_count"]
+    for m in _metric_names():
+        na, nb = a[f"{m}_n"], b[f"{m}_n"]
+        if not nb:
+            continue
+        if not na:
+            for key in ("n", "sum", "mean", "m2", "min", "max"):
+                out[f"{m}_{key}"] = b[f"{m}_{key}"]
+            continue
+        n = na + nb
+        delta = b[f"{m}_mean"] - a[f"{m}_mean"]
+        out[f"{m}_n"] = n
+        out[f"{m}_sum"] = a[f"{m}_sum"] + b[f"{m}_sum"]
+        out[f"{m}_mean"] = a[f"{m}_mean"] + delta * nb / n
+        out[f"{m}_m2"] = a[f"{m}_m2"] + b[f"{m}_m2"] + delta * delta * na * nb / n
+        out[f"{m}_min"] = min(a[f"{m}_min"], b[f"{m}_min"])
+        out[f"{m}_max"] = max(a[f"{m}_max"], b[f"{m}_max"])
+    return out
+
+
+def merge_appended(con, after_id):
+    # Folds reports with id > after_id into the rollup: their per-patient
+    # aggregates are combined with the stored ones, so only the new rows are
+    # read. NOT INDEXED keeps the planner on the rowid range instead of
+    # walking the whole patient index.
+    merge_stats(con, SUMMARY_TABLE, "WHERE id > ?", (after_id,), "reports NOT INDEXED")
+    con.execute(_reread_sql("patient_id IN (SELECT patient_id FROM reports WHERE id > ?)"), (after_id,))
+
+
+@contextmanager
+def deferred(con, rows=None):
+    # For bulk writes inside one writer transaction; rows is how many reports
+    # the caller expects to write (None for many). Below DDL_ROWS the per-row
+    # triggers are paused with a flag they check, which changes no schema,
+    # so the readers' prepared statements stay valid; from DDL_ROWS up they
+    # are dropped and recreated, as their per-row cost would dominate. DDL is
+    # transactional in SQLite, so other connections never see the table
+    # without its triggers, and a rollback restores them. Afterwards new
+    # reports are merged in and any patient whose existing reports the
+    # caller changed (added to the yielded set) is recomputed. The reports
+    # change counter is bumped once, by at least the number of rows written.
+    changed = set()
+    after_id = con.execute(QUERIES["reports.max_id"]).fetchone()[0]
+    ddl = rows is None or rows >= DDL_ROWS
+    if ddl:
+        drop_triggers(con)
+        drop_version_triggers(con, "reports")
+    else:
+        pause_triggers(con, "reports")
+    before = con.total_changes
+    yield changed
+    con.execute(QUERIES["versions.bump"], (con.total_changes - before, "reports"))
+    if not ddl:
+        pause_triggers(con, "reports", False)
+    merge_appended(con, after_id)
+    if changed:
+        refresh_patients(con, changed)
+    if ddl:
+        create_triggers(con)
+        create_version_triggers(con, "reports")
+
+
+def _same(a, b):
+    if a is None or b is None:
+        return a is b
+    if isinstance(a, str) or isinstance(b, str):
+        return a == b
+    return math.isclose(a, b, rel_tol=REL_TOLERANCE, abs_tol=REL_TOLERANCE)
+
+
+def check_summary(con, limit=100):
+    # Compares the stored rollup with a fresh recomputation. Returns up to
+    # `limit` (patient_id, column, expected, stored) differences; a missing
+    # or stray row is reported with column "row".
+    cols = _stored_columns()
+    stored = con.execute(f"SELECT {', '.join(cols)} FROM {SUMMARY_TABLE} ORDER BY patient_id")
+    expected = con.execute(_expected_sql())
+    problems = []
+    want, have = next(expected, None), next(stored, None)
+    while (want is not None or have is not None) and len(problems) < limit:
+        if have is None or (want is not None and want[0] < have[0]):
+            problems.append((want[0], "row", "present", None))
+            want = next(expected, None)
+        elif want is None or have[0] < want[0]:
+            problems.append((have[0], "row", None, "present"))
+            have = next(stored, None)
+        else:
+            for name, w, h in zip(cols[1:], want[1:], have[1:]):
+                if not _same(w, h):
+                    problems.append((want[0], name, w, h))
+            want, have = next(expected, None), next(stored, None)
+    return problems[:limit]
+
+
+def patient_summary(db, patient_id):
+    # One indexed row read: {column: value}, or None if the patient has no reports.
+    with db.reader() as con:
+        row = con.execute(QUERIES["summary.by_patient"], (patient_id,)).fetchone()
+    if row is None:
+        return None
+    return dict(zip(["patient_id"] + summary_columns(), row))
+
+
+def stddev(summary, metric):
+    n = summary[f"{metric}_n"]
+    return math.sqrt(summary[f"{metric}_m2"] / n) if n else None
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Maintain the patient_summary rollup")
+    parser.add_argument("db", nargs="?", default=DB_FILE)
+    parser.add_argument("--rebuild", action="store_true", help="recompute the table from reports")
+    parser.add_argument("--check", action="store_true", help="compare the table with a fresh recomputation")
+    args = parser.parse_args(argv)
+    db = Database(args.db, readers=1)
+    status = 0
+    try:
+        migrate(db)
+        if args.rebuild:
+            with db.writer() as con:
+                print(f"rebuilt {rebuild_summary(con):,} patient summaries", file=sys.stderr)
+        if args.check:
+            with db.reader() as con:
+                problems = check_summary(con)
+            for pid, column, want, have in problems:
+                print(f"patient {pid}: {column} expected {want!r}, stored {have!r}")
+            print(f"{len(problems)} differences" if problems else "patient_summary is consistent", file=sys.stderr)
+            status = 1 if problems else 0
+    finally:
+        db.close()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
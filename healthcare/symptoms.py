@@ -0,0 +1,98 @@
+import heapq
+import threading
+
+from healthcare.db import QUERIES
+
+TOP_K = 10
+
+
+def split_symptoms(text):
+    return [s.strip().lower() for s in (text or "").split(",") if s.strip()]
+
+
+class SymptomIndex:
+    # Inverted index symptom -> disease ids, built once from the diseases
+    # table. table_versions (bumped by triggers on diseases) tells us whether
+    # another writer changed the catalogue since we last looked.
+    def __init__(self, db):
+        self.db = db
+        self.version = None
+        self.postings = {}
+        self.diseases = {}
+        self._lock = threading.Lock()
+
+    def _read_version(self, con):
+        row = con.execute(QUERIES["diseases.version"]).fetchone()
+        return row[0] if row else 0
+
+    def _add(self, did, name, details, symptoms):
+        terms = frozenset(split_symptoms(symptoms))
+        self.diseases[did] = (name, details, terms)
+        for term in terms:
+            self.postings.setdefault(term, set()).add(did)
+
+    def _remove(self, did):
+        old = self.diseases.pop(did, None)
+        if old is None:
+            return
+        for term in old[2]:
+            ids = self.postings.get(term)
+            if ids is not None:
+                ids.discard(did)
+                if not ids:
+                    del self.postings[term]
+
+    def _rebuild(self, con):
+        self.postings = {}
+        self.diseases = {}
+        self.version = self._read_version(con)
+        for did, name, details, symptoms in con.execute(QUERIES["diseases.symptoms"]):
+            self._add(did, name, details, symptoms)
+
+    def ensure_fresh(self):
+        with self.db.reader() as con:
+            with self._lock:
+                if self.version is None or self._read_version(con) != self.version:
+                    self._rebuild(con)
+
+    def refresh_disease(self, con, name):
+        # Call with the connection that is saving the disease; the index
+        # follows once the write commits.
+        row = con.execute(QUERIES["diseases.symptoms_by_name"], (name,)).fetchone()
+        self.db.after_commit(self._patch, con, self._read_version(con), row)
+
+    def _patch(self, con, version, row):
+        # If the saved disease was the only change since the last sync, patch
+        # the index in place.
+        with self._lock:
+            if self.version is None:
+                return
+            if version != self.version + 1:
+                self._rebuild(con)
+                return
+            if row is not None:
+                self._remove(row[0])
+                self._add(*row)
+            self.version = version
+
+    def _match(self, wanted, k):
+        counts = {}
+        for term in wanted:
+            for did in self.postings.get(term, ()):
+                counts[did] = counts.get(did, 0) + 1
+        best = heapq.nsmallest(k, counts.items(), key=lambda kv: (-kv[1], self.diseases[kv[0]][0]))
+        results = []
+        for did, hits in best:
+            name, details, terms = self.diseases[did]
+            results.append((name, details, hits, wanted & terms, terms))
+        return results
+
+    def check(self, symptoms, k=TOP_K):
+        # Returns (name, details, match count, matched, all symptoms), best first.
+        return self.check_many([symptoms], k)[0]
+
+    def check_many(self, symptom_sets, k=TOP_K):
+        self.ensure_fresh()
+        with self._lock:
+            return [self._match(frozenset(s.strip().lower() for s in wanted if s.strip()), k)
+                    for wanted in symptom_sets]
@@ -0,0 +1,155 @@
+import queue
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from healthcare.instrument import bind_handler, current_handler, register_internal
+
+POLL_MS = 20
+
+register_internal(__file__)
+
+
+class Task:
+    def __init__(self, key=None):
+        self.key = key
+        self.future = None
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+
+class TaskRunner:
+    # Runs blocking work (SQL, file I/O) on a small thread pool. Worker threads
+    # never touch Tk: finished tasks are queued and the Tk thread drains the
+    # queue with after() while anything is outstanding, then stops polling.
+    def __init__(self, root, workers=2, on_busy=None):
+        self.root = root
+        self.on_busy = on_busy
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="healthcare-task")
+        self._done = queue.Queue()
+        self._calls = queue.Queue()
+        self._pending = set()
+        self._by_key = {}
+        self._after_id = None
+        self._tk_thread = threading.current_thread()
+        self._wake_lock = threading.Lock()
+        self._waking = False
+
+    def submit(self, fn, *args, on_done=None, on_error=None, key=None, with_cancel=False):
+        # A task with the same key as a pending one supersedes it, so repeated
+        # clicks on Refresh only ever deliver the newest result.
+        if key is not None and key in self._by_key:
+            self._by_key[key].cancel()
+        task = Task(key)
+        kwargs = {"cancel": task.cancel_event} if with_cancel else {}
+        # SQL run by the task is credited to the handler that submitted it.
+        task.future = self._pool.submit(bind_handler(fn, current_handler()), *args, **kwargs)
+        return self._track(task, on_done, on_error)
+
+    def watch(self, future, on_done=None, on_error=None, key=None):
+        # Like submit() for work already running elsewhere (e.g. a
+        # WriteBehind write): on_done/on_error run on the Tk thread when the
+        # concurrent.futures.Future settles.
+        if key is not None and key in self._by_key:
+            self._by_key[key].cancel()
+        task = Task(key)
+        task.future = future
+        return self._track(task, on_done, on_error)
+
+    def _track(self, task, on_done, on_error):
+        task.future.add_done_callback(lambda f: self._done.put((task, on_done, on_error)))
+        self._pending.add(task)
+        if task.key is not None:
+            self._by_key[task.key] = task
+        if len(self._pending) == 1 and self.on_busy:
+            self.on_busy(True)
+        self._schedule()
+        return task
+
+    def post(self, fn, *args):
+        # Safe from worker threads: fn(*args) runs on the Tk thread at the
+        # next drain (used for progress updates from running tasks), which a
+        # worker asks for with one after_idle() at a time; _after_id is only
+        # touched on the Tk thread.
+        self._calls.put((fn, args))
+        if threading.current_thread() is self._tk_thread:
+            self._schedule()
+            return
+        with self._wake_lock:
+            if self._waking:
+                return
+            self._waking = True
+        self.root.after_idle(self._wake)
+
+    def cancel_all(self):
+        for task in list(self._pending):
+            task.cancel()
+
+    def busy(self):
+        return bool(self._pending)
+
+    def _schedule(self):
+        if self._after_id is None:
+            self._after_id = self.root.after(POLL_MS, self._drain)
+
+    def _wake(self):
+        with self._wake_lock:
+            self._waking = False
+        self._schedule()
+
+    def _call(self, fn, *args):
+        # A callback that raises is reported like any Tk callback error; the
+        # drain carries on, so other results are still delivered and the
+        # busy state still clears.
+        try:
+            fn(*args)
+        except Exception as exc:
+            self.root.report_callback_exception(type(exc), exc, exc.__traceback__)
+
+    def _drain(self):
+        self._after_id = None
+        while True:
+            try:
+                fn, args = self._calls.get_nowait()
+            except queue.Empty:
+                break
+            self._call(fn, *args)
+        while True:
+            try:
+                task, on_done, on_error = self._done.get_nowait()
+            except queue.Empty:
+                break
+            self._pending.discard(task)
+            if task.key is not None and self._by_key.get(task.key) is task:
+                del self._by_key[task.key]
+            if task.cancelled():
+                continue
+            try:
+                result = task.future.result()
+            except CancelledError:
+                continue
+            except Exception as exc:
+                if on_error:
+                    self._call(on_error, exc)
+                else:
+                    self.root.report_callback_exception(type(exc), exc, exc.__traceback__)
+                continue
+            if on_done:
+                self._call(on_done, result)
+        if self._pending:
+            self._schedule()
+        elif self.on_busy:
+            self.on_busy(False)
+
+    def shutdown(self):
+        self.cancel_all()
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        self._pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,234 @@
+import threading
+from tkinter import ttk
+
+
+class VirtualTable(ttk.Frame):
+    # Treeview that only holds the rows currently on screen. Rows come from a
+    # KeysetPager (or a HistoryPager) as the user scrolls; the scrollbar is
+    # driven by the pager's cached row count instead of the Treeview's own
+    # item list. Items are keyed by row id and render() only touches the
+    # ones that changed.
+    # count_text is a format string or a function of the row count.
+    # Selection is kept by id in self.selected, so rows selected with
+    # Ctrl/Shift-click stay selected while they are scrolled out of view.
+    #
+    # With a runner (TaskRunner) the pager is only used on its worker
+    # threads, one load at a time: render() reads the window there and shows
+    # it when it arrives, and updates made from the Tk thread (refresh,
+    # apply_changes, deleted rows) are queued for the next load to apply.
+    def __init__(self, master, columns, height=15, width=100, count_text="{:,} rows", runner=None):
+        super().__init__(master)
+        self.pager = None
+        self.offset = 0
+        self.visible = height
+        self.count_text = count_text
+        self.runner = runner
+        self.count = 0    # row count as of the last load
+        self._edits = []   # (pager, fn) waiting for the next load
+        self._edits_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loads = 0   # the latest render() request; older results are dropped
+        self._after_load = None
+        self.shown = {}   # iid -> row currently in the Treeview
+        self.selected = set()   # iids, including rows not currently shown
+        self.tree = ttk.Treeview(self, columns=columns, show="headings", height=height)
+        for c in columns:
+            self.tree.heading(c, text=c.upper())
+            self.tree.column(c, width=width)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.count_label = ttk.Label(self, text="")
+        self.count_label.pack(side="bottom", anchor="w")
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1, "units", 3))
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-1, "units", 3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(1, "units", 3))
+        self.tree.bind("<Up>", lambda e: self._step_selection(-1))
+        self.tree.bind("<Down>", lambda e: self._step_selection(1))
+        self.tree.bind("<Prior>", lambda e: self.scroll(-1, "pages"))
+        self.tree.bind("<Next>", lambda e: self.scroll(1, "pages"))
+        self.tree.bind("<<TreeviewSelect>>", self._on_select, add="+")
+        # A plain click starts a new selection; with Ctrl or Shift it extends it.
+        self.tree.bind("<Button-1>", lambda e: self.selected.clear())
+        self.tree.bind("<Control-Button-1>", lambda e: None)
+        self.tree.bind("<Shift-Button-1>", lambda e: None)
+
+    def set_source(self, pager, offset=0):
+        self.pager = pager
+        self.offset = offset
+        with self._edits_lock:
+            self._edits = []
+        self.render()
+
+    def clear(self):
+        self.pager = None
+        self.offset = 0
+        self.count = 0
+        with self._edits_lock:
+            self._edits = []
+        self.tree.delete(*self.tree.get_children())
+        self.shown = {}
+        self.selected = set()
+        self.scrollbar.set(0, 1)
+        self.count_label.config(text="")
+
+    def _edit(self, fn):
+        # fn(pager) now, or on the worker before the next load.
+        if self.runner is None:
+            fn(self.pager)
+            return
+        with self._edits_lock:
+            self._edits.append((self.pager, fn))
+
+    def refresh(self):
+        if self.pager is None:
+            return
+        self._edit(lambda pager: pager.invalidate())
+        self.render()
+
+    def apply_changes(self, changes):
+        # changes: the result of pager.changes(), typically fetched on a worker.
+        if self.pager is None or changes is None:
+            return
+        self._edit(lambda pager: pager.apply_changes(changes))
+        self.render()
+
+    def delete_row(self, row_id):
+        self.delete_rows([row_id])
+
+    def delete_rows(self, row_ids):
+        # Rows this app deleted: one pager update each, then a single render.
+        if self.pager is None:
+            return
+        row_ids = list(row_ids)
+        def delete(pager):
+            for row_id in row_ids:
+                pager.delete(row_id)
+        self._edit(delete)
+        for row_id in row_ids:
+            self.selected.discard(str(row_id))
+        self.render()
+
+    def selected_ids(self):
+        return sorted((int(iid) for iid in self.selected), reverse=True)
+
+    def total(self):
+        return self.count if self.pager else 0
+
+    def render(self):
+        if self.pager is None:
+            return
+        self._loads += 1
+        request = (self._loads, self.pager, self.offset, self.visible)
+        if self.runner is None:
+            self._loaded(self._load(*request))
+        else:
+            self.runner.submit(self._load, *request, on_done=self._loaded, key=("virtual_table", str(self)))
+
+    def _load(self, seq, pager, offset, visible):
+        # Worker side (or inline without a runner): queued edits, then the window.
+        with self._load_lock:
+            with self._edits_lock:
+                edits = [fn for target, fn in self._edits if target is pager]
+                self._edits = [(target, fn) for target, fn in self._edits if target is not pager]
+            for fn in edits:
+                fn(pager)
+            total = pager.count()
+            offset = max(0, min(offset, total - visible))
+            return seq, pager, offset, total, pager.rows(offset, visible)
+
+    def _loaded(self, result):
+        seq, pager, offset, total, rows = result
+        if seq != self._loads or pager is not self.pager:
+            return   # a newer render() is on its way
+        self.offset = offset
+        self.count = total
+        self._show(rows)
+        self.tree.yview_moveto(0)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.visible) / total))
+        else:
+            self.scrollbar.set(0, 1)
+        text = self.count_text(total) if callable(self.count_text) else self.count_text.format(total)
+        self.count_label.config(text=text)
+        after, self._after_load = self._after_load, None
+        if after:
+            after()
+
+    def _show(self, rows):
+        # Both the Treeview and rows are ordered newest id first, so after
+        # dropping the items that left, the survivors are already in place
+        # and new rows are inserted at their index. Unchanged rows cost no
+        # Tk call; selection on surviving rows is kept.
+        wanted = {str(row[0]): row for row in rows}
+        gone = [iid for iid in self.shown if iid not in wanted]
+        if gone:
+            # Out of self.shown first, so _on_select keeps them selected.
+            for iid in gone:
+                del self.shown[iid]
+            self.tree.delete(*gone)
+        reselect = []
+        for index, (iid, row) in enumerate(wanted.items()):
+            old = self.shown.get(iid)
+            if old is None:
+                self.tree.insert("", index, iid=iid, values=row)
+                if iid in self.selected:
+                    reselect.append(iid)
+            elif old != row:
+                self.tree.item(iid, values=row)
+            self.shown[iid] = row
+        if reselect:
+            self.tree.selection_add(*reselect)
+
+    def _on_select(self, event=None):
+        self.selected = (self.selected - self.shown.keys()) | set(self.tree.selection())
+
+    def scroll(self, amount, what="units", step=1):
+        if self.pager is None:
+            return "break"
+        delta = amount * (self.visible if what == "pages" else step)
+        self.offset += delta
+        self.render()
+        return "break"
+
+    def _on_scrollbar(self, *args):
+        if self.pager is None:
+            return
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * self.total())
+            self.render()
+        elif args[0] == "scroll":
+            self.scroll(int(args[1]), args[2])
+
+    def _on_resize(self, event):
+        rowheight = ttk.Style().lookup("Treeview", "rowheight") or 20
+        visible = max(1, (event.height - 24) // int(rowheight))
+        if visible != self.visible:
+            self.visible = visible
+            self.render()
+
+    def _step_selection(self, direction):
+        items = self.tree.get_children()
+        if not items:
+            return "break"
+        focus = self.tree.focus()
+        idx = items.index(focus) if focus in items else -1
+        target = idx + direction
+        if 0 <= target < len(items):
+            self._select(items[target])
+        else:
+            # The row scrolled in is selected once the window has loaded.
+            self._after_load = lambda: self._select_edge(direction)
+            self.scroll(direction)
+        return "break"
+
+    def _select_edge(self, direction):
+        items = self.tree.get_children()
+        if items:
+            self._select(items[0] if direction < 0 else items[-1])
+
+    def _select(self, iid):
+        self.selected.clear()
+        self.tree.selection_set(iid)
+        self.tree.focus(iid)
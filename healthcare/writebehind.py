@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from healthcare.db import PRAGMAS
+from healthcare.instrument import bind_handler, current_handler, register_internal
+
+BATCH_ROWS = 50
+BATCH_DELAY = 0.020          # seconds the first queued write may wait
+SYNCHRONOUS = "FULL"         # batch commits are fsynced before anyone is acked
+DEFAULT_SYNCHRONOUS = dict(PRAGMAS)["synchronous"]
+
+register_internal(__file__)
+
+
+class WriteBehind:
+    # Group commit for small writes. submit(fn, *args) queues fn to run on the
+    # writer thread and returns a Future; queued writes are applied together
+    # in one transaction once BATCH_ROWS are waiting or the oldest has waited
+    # BATCH_DELAY, so a burst of inserts pays for one commit and one fsync
+    # instead of one each. fn is normally a HealthcareService method: its own
+    # db.writer() block joins the batch transaction.
+    #
+    # Each write runs under its own SAVEPOINT, so one that raises (bad input)
+    # is rolled back alone and only its Future gets the exception, and the
+    # cache updates it registered with db.after_commit() are dropped with it;
+    # the rest run once the batch commits. Futures are resolved after the
+    # batch has committed with synchronous=FULL: an acknowledged write is on
+    # disk. flush() waits for everything queued so far; close() flushes and
+    # stops the thread.
+    def __init__(self, db, max_rows=BATCH_ROWS, max_delay=BATCH_DELAY, synchronous=SYNCHRONOUS):
+        self.db = db
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.synchronous = synchronous
+        self.batches = 0
+        self.writes = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._first_at = None
+        self._closed = False
+        self._busy = False
+        self._thread = threading.Thread(target=self._run, name="healthcare-writebehind", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        fut = Future()
+        # Running from the start: cancelling a UI task that watches this
+        # future must not drop a write that is already queued.
+        fut.set_running_or_notify_cancel()
+        call = bind_handler(fn, current_handler())
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("WriteBehind is closed")
+            if not self._items:
+                self._first_at = time.monotonic()
+            self._items.append((call, args, kwargs, fut))
+            if len(self._items) == 1 or len(self._items) >= self.max_rows:
+                self._cond.notify_all()
+        return fut
+
+    def pending(self):
+        with self._cond:
+            return len(self._items) + (1 if self._busy else 0)
+
+    def flush(self, timeout=None):
+        # Blocks until every write submitted before the call has committed;
+        # False on timeout.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._first_at = 0.0   # do not wait out the delay
+            self._cond.notify_all()
+            while self._items or self._busy:
+                left = None if deadline is None else deadline - time.monotonic()
+                if left is not None and left <= 0:
+                    return False
+                self._cond.wait(left)
+        return True
+
+    def close(self, timeout=None):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _take(self):
+        # Waits for a full batch or the delay to run out; None once closed
+        # and drained.
+        with self._cond:
+            while True:
+                if self._items:
+                    wait = self._first_at + self.max_delay - time.monotonic()
+                    if self._closed or len(self._items) >= self.max_rows or wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                elif self._closed:
+                    return None
+                else:
+                    self._cond.wait()
+            # Leftovers keep their _first_at and go out in the next batch.
+            batch = [self._items.popleft() for _ in range(min(len(self._items), self.max_rows))]
+            self._busy = True
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            try:
+                results = self._apply(batch)
+            except BaseException as exc:
+                # The commit itself failed: nothing in the batch was written.
+                results = [(fut, None, exc) for *_, fut in batch]
+            with self._cond:
+                self._busy = False
+                self.batches += 1
+                self.writes += len(batch)
+                self._cond.notify_all()
+            for fut, result, exc in results:
+                if exc is None:
+                    fut.set_result(result)
+                else:
+                    fut.set_exception(exc)
+
+    def _apply(self, batch):
+        results = []
+        with self.db.writer() as con:
+            con.execute(f"PRAGMA synchronous={self.synchronous}")
+            try:
+                con.execute("BEGIN IMMEDIATE")
+                for call, args, kwargs, fut in batch:
+                    try:
+                        with self.db.savepoint("write_behind"):
+                            result = call(*args, **kwargs)
+                    except Exception as exc:
+                        results.append((fut, None, exc))
+                    else:
+                        results.append((fut, result, None))
+                con.commit()
+            finally:
+                if con.in_transaction:
+                    con.rollback()
+                con.execute(f"PRAGMA synchronous={DEFAULT_SYNCHRONOUS}")
+        return results
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from healthcare.db import Database, init_db
+
+
+@pytest.fixture
+def db(tmp_path):
+    # A fresh, migrated and seeded database with a reader pool, as the app opens it.
+    database = Database(str(tmp_path / "test.db"), readers=2)
+    init_db(database)
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def service(db):
+    from healthcare.service import HealthcareService
+    svc = HealthcareService(db)
+    yield svc
+    svc.cold.close()
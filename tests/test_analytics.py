@@ -0,0 +1,22 @@
+from healthcare.coldstore import move_cold
+
+
+def test_triage_compares_against_moved_reports(service):
+    pid = service.add_patient("Moved", 60)
+    service.add_report(pid, "2019-01", "110/70", 90, 5)
+    service.add_report(pid, "2019-02", "115/75", 95, 5)
+    assert move_cold(service.db, "2020-01", pause=0).moved == 2
+    # One live report left: the previous one comes from the cold tier.
+    service.add_report(pid, "2024-05", "190/125", 250, 14)
+    rows = service.triage()
+    assert [(r[0], r[2], r[3]) for r in rows] == [(pid, "2024-05", "2019-02")]
+    assert rows[0][-2] == 4
+
+
+def test_triage_of_a_patient_with_only_cold_reports(service):
+    pid = service.add_patient("Cold", 60)
+    service.add_report(pid, "2018-03", "110/70", 90, 5)
+    service.add_report(pid, "2018-04", "150/95", 90, 5)
+    move_cold(service.db, "2020-01", pause=0)
+    rows = service.triage(worse_only=False)
+    assert [(r[0], r[2], r[3]) for r in rows] == [(pid, "2018-04", "2018-03")]
@@ -0,0 +1,33 @@
+from healthcare.analytics import BANDS, LABELS, METRICS, get_band_simple
+from healthcare.anomaly import ALERT_FIELDS, fold, new_state, replay
+
+
+def test_alert_bands_match_report_bands():
+    values = {"bp_systolic": [60, 89.5, 90, 139.5, 181, 400], "bp_diastolic": [59.5, 80.5, 121],
+              "sugar": [69.5, 100.5, 125.5, 200.5, 300], "uric_acid": [1, 2.5, 7.5, 8.5, 12.5, 20]}
+    for k, (metric, _) in enumerate(METRICS):
+        for x in values[metric]:
+            state, alerts = new_state(), []
+            row = [1, 1, "2024-01", None, None, None, None]
+            row[3 + k] = x
+            fold(state, row, alerts, "")
+            want = get_band_simple(x, BANDS[metric], LABELS)
+            assert LABELS[state[5 + 4 * k]] == want, (metric, x)
+            assert bool(alerts) == (want == "Extreme"), (metric, x)
+
+
+def test_reports_raise_alerts_in_the_compared_band(service):
+    pid = service.add_patient("Alerted", 55)
+    for m in range(1, 8):
+        service.add_report(pid, f"2024-{m:02d}", "120/80", 95 + m % 2, 5)
+    service.add_report(pid, "2024-08", "120/80", 96, 8.5)
+    alerts = [dict(zip(ALERT_FIELDS, a)) for a in service.patient_alerts(pid)]
+    assert {(a["metric"], a["kind"], a["band"]) for a in alerts} == {("uric_acid", "extreme", "Extreme"),
+                                                                     ("uric_acid", "jump", "Extreme")}
+    uric = service.compare_reports(pid)["metrics"][-1]
+    assert (uric["metric"], uric["latest_band"]) == ("uric_acid", "Extreme")
+    with service.db.reader() as con:
+        before = con.execute("SELECT * FROM anomaly_state").fetchall()
+    replay(service.db)
+    with service.db.reader() as con:
+        assert con.execute("SELECT * FROM anomaly_state").fetchall() == before
@@ -0,0 +1,53 @@
+import importlib.util
+import os
+from types import SimpleNamespace
+
+import pytest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "final code python.py")
+
+
+@pytest.fixture(scope="module")
+def app_module():
+    spec = importlib.util.spec_from_file_location("healthcare_app", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def app(app_module, monkeypatch):
+    # No display here, so the handlers run against a stand-in for the window
+    # whose Reports tab has never been opened.
+    shown = []
+    monkeypatch.setattr(app_module.messagebox, "showinfo", lambda title, text: shown.append(text))
+    App = app_module.HealthcareApp
+    stub = SimpleNamespace(tab_reports="reports", tab_builders={"reports": None}, shown=shown,
+                           statuses=[], deleted=[])
+    stub.set_status = stub.statuses.append
+    stub.p_view = SimpleNamespace(delete_rows=stub.deleted.extend)
+    stub.refresh_reports_table = lambda: App.refresh_reports_table(stub)
+    return stub
+
+
+class Result:
+    patients = 2
+
+    def summary(self):
+        return "Deleted 2 patients"
+
+
+def test_purge_before_the_reports_tab_is_built(app_module, app):
+    submitted = []
+    app.service = SimpleNamespace(purge_patients=None)
+    app.tasks = SimpleNamespace(submit=lambda *args, **kwargs: submitted.append(kwargs))
+    app_module.HealthcareApp.run_purge(app, [3, 4], False)
+    submitted[0]["on_done"](Result())
+    assert app.deleted == [3, 4]
+    assert app.shown == ["Deleted 2 patients"]
+
+
+def test_cold_move_before_the_reports_tab_is_built(app_module, app):
+    result = SimpleNamespace(moved=5, summary=lambda: "Moved 5 reports to the cold tier\nin 1 segment")
+    app_module.HealthcareApp.cold_move_done(app, result)
+    assert app.statuses == ["Moved 5 reports to the cold tier"]
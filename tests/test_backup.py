@@ -0,0 +1,85 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import pytest
+
+from healthcare.backup import backup, list_snapshots, prune, restore, verify
+from healthcare.coldstore import ColdStore, move_cold
+from healthcare.db import Database
+
+
+def test_backup_verify_restore_round_trip(service, tmp_path):
+    db = service.db
+    pid = service.add_patient("Backed Up", 45)
+    service.add_report(pid, "2018-06", "120/80", 95, 5)
+    service.add_report(pid, "2024-06", "130/85", 105, 6)
+    move_cold(db, "2020-01", pause=0)
+    dest = str(tmp_path / "backups")
+    result = backup(db, dest, pause=0)
+    assert list_snapshots(dest)[0][0] == result.path
+    ok, message = verify(result.path)
+    assert ok, message
+
+    damaged = str(tmp_path / "healthcare-20200101-000000.db.gz")
+    with open(result.path, "rb") as src, open(damaged, "wb") as out:
+        out.write(src.read()[:200])
+    assert verify(damaged)[0] is False
+    with pytest.raises(ValueError):
+        restore(damaged, str(tmp_path / "never.db"))
+
+    service.add_patient("After the snapshot")
+    service.cold.close()
+    db.close()
+    restore(result.path, db.path)
+    assert any(name.startswith("test.db.before-restore-") for name in os.listdir(tmp_path))
+    restored = Database(db.path, readers=1)
+    cold = ColdStore(restored)
+    try:
+        with restored.reader() as con:
+            assert con.execute("SELECT name FROM patients WHERE name LIKE '%snapshot%'").fetchall() == []
+            assert [r[2] for r in cold.rows(pid, con)] == ["2018-06"]
+            assert con.execute("SELECT month FROM reports WHERE patient_id=?", (pid,)).fetchall() == [("2024-06",)]
+    finally:
+        cold.close()
+        restored.close()
+
+
+def test_prune_keeps_the_newest_and_one_per_day(tmp_path):
+    stamps = ["20240110-060000", "20240110-120000", "20240110-180000", "20240109-120000", "20231201-120000"]
+    for stamp in stamps:
+        (tmp_path / f"healthcare-{stamp}.db.gz").write_bytes(b"")
+    removed = prune(str(tmp_path), keep_last=2, keep_daily=3, now=datetime(2024, 1, 10, 20))
+    assert sorted(os.path.basename(p) for p in removed) == ["healthcare-20231201-120000.db.gz",
+                                                            "healthcare-20240110-060000.db.gz"]
+
+
+def test_backup_frees_the_writer_between_steps(service):
+    db = service.db
+    for i in range(200):
+        service.add_patient(f"Step {i}", 40)
+    written = []
+
+    def write_elsewhere(copied, total):
+        # From another thread, so it only gets in if the step let go of the lock.
+        if not written:
+            t = threading.Thread(target=lambda: written.append(service.add_patient("During", 50)))
+            t.start()
+            t.join(5)
+            assert written
+
+    target = sqlite3.connect(":memory:")
+    steps, _ = db.backup(target, pages=1, pause=0, progress=write_elsewhere)
+    assert steps > 1
+    assert target.execute("SELECT name FROM patients WHERE id=?", (written[0],)).fetchone() == ("During",)
+
+    def cancel(copied, total):
+        raise RuntimeError("stop")
+
+    with pytest.raises(RuntimeError):
+        db.backup(sqlite3.connect(":memory:"), pages=1, pause=0, progress=cancel)
+    after = threading.Thread(target=lambda: written.append(service.add_patient("After", 50)))
+    after.start()
+    after.join(5)
+    assert len(written) == 2
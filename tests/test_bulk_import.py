@@ -0,0 +1,27 @@
+import io
+
+
+def _csv(*lines):
+    return io.StringIO("patient_id,month,bp,sugar,uric_acid\n" + "".join(line + "\n" for line in lines))
+
+
+def test_rejects_file_is_only_created_for_rejected_rows(service, tmp_path):
+    pid = service.add_patient("Import", 30)
+    rejects = tmp_path / "reports.rejects.csv"
+    rejects.write_text("the user's own file\n")
+    result = service.import_reports(_csv(f"{pid},2024-01,120/80,95,5"), "append", str(rejects))
+    assert (result.inserted, result.rejected) == (1, 0)
+    assert rejects.read_text() == "the user's own file\n"
+
+    fresh = tmp_path / "fresh.rejects.csv"
+    service.import_reports(_csv(f"{pid},2024-02,120/80,95,5"), "append", str(fresh))
+    assert not fresh.exists()
+
+    result = service.import_reports(_csv(f"{pid},2024-03,high,95,5", f"{pid + 1},2024-03,120/80,95,5"),
+                                    "append", str(fresh))
+    assert result.reasons == {"bad bp": 1, "unknown patient": 1}
+    assert fresh.read_text().splitlines() == [
+        "line,reason,patient_id,month,bp,sugar,uric_acid",
+        f"2,bad bp,{pid},2024-03,high,95,5",
+        f"3,unknown patient,{pid + 1},2024-03,120/80,95,5",
+    ]
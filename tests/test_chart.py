@@ -0,0 +1,34 @@
+import pytest
+
+from healthcare.chart import Series, lttb, minmax, month_index, month_label
+
+
+def test_series_stays_sorted_by_month_and_id():
+    s = Series()
+    for key, y in [((24290, 7), 1.0), ((24288, 9), 2.0), ((24290, 3), 3.0), ((24288, 9), 4.0)]:
+        s.insert(key, y)
+    assert s.keys == [(24288, 9), (24290, 3), (24290, 7)]
+    assert (s.xs, s.ys) == ([24288, 24290, 24290], [4.0, 3.0, 1.0])
+    s.remove((24290, 3))
+    s.remove((1, 1))
+    assert s.ys == [4.0, 1.0]
+
+
+def test_month_axis_round_trips():
+    assert month_label(month_index("2024-12")) == "2024-12"
+    assert month_index("bad") is None
+
+
+@pytest.mark.parametrize("sample", [lttb, minmax])
+def test_downsampling_keeps_the_ends_and_the_peak(sample):
+    np = pytest.importorskip("numpy")
+    xs = np.arange(5000, dtype=float)
+    ys = np.sin(xs / 100)
+    ys[2345] = 50.0
+    x, y = sample(xs, ys, 400)
+    assert len(x) <= 400
+    assert np.all(np.diff(x) > 0)
+    assert 50.0 in y
+    if sample is lttb:
+        assert (x[0], x[-1]) == (0, 4999)
+    assert sample(xs[:10], ys[:10], 400)[0].tolist() == xs[:10].tolist()
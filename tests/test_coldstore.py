@@ -0,0 +1,54 @@
+import csv
+
+from healthcare.coldstore import check, move_cold
+from healthcare.db import migrate
+from healthcare.purge import inactive_patients
+
+
+def test_move_round_trips_every_report(service, tmp_path):
+    pid = service.add_patient("Round Trip", 50)
+    rows = [("2017-03", "118/76", 92.5, 4.25), ("2018-11", "135", None, None), ("2019-12", "160/100", 240.0, 11.0),
+            ("2023-02", "125/82", 101.0, 6.0)]
+    for month, bp, sugar, uric in rows:
+        service.add_report(pid, month, bp, sugar, uric)
+    live_history = service.report_history(pid).rows()
+    live_export = str(tmp_path / "live.csv")
+    service.export_reports(live_export)
+
+    result = move_cold(service.db, "2020-01", pause=0)
+    assert (result.moved, result.patients, result.kept) == (3, 1, 0)
+    service.history.clear()
+    assert service.report_history(pid).rows() == live_history
+    with service.db.reader() as con:
+        assert con.execute("SELECT month FROM reports").fetchall() == [("2023-02",)]
+    cold_export = str(tmp_path / "cold.csv")
+    service.export_reports(cold_export)
+    with open(live_export) as a, open(cold_export) as b:
+        assert list(csv.reader(a)) == list(csv.reader(b))
+    assert check(service.db) == []
+    assert move_cold(service.db, "2020-01", pause=0).moved == 0
+
+
+def test_patient_with_recent_cold_reports_is_not_inactive(service):
+    moved = service.add_patient("Moved", 50)
+    idle = service.add_patient("Idle", 50)
+    service.add_report(moved, "2019-10", "120/80", 95, 5)
+    service.add_report(idle, "2016-01", "120/80", 95, 5)
+    move_cold(service.db, "2020-01", pause=0)
+    with service.db.writer() as con:
+        con.execute("UPDATE patients SET created_at = '2015-01-01 00:00:00'")
+    assert inactive_patients(service.db, "2019-06") == [idle]
+    assert inactive_patients(service.db, "2019-11") == [moved, idle]
+
+
+def test_upgrade_backfills_the_latest_cold_month(service):
+    pid = service.add_patient("Upgraded", 50)
+    service.add_report(pid, "2018-02", "120/80", 95, 5)
+    service.add_report(pid, "2019-07", "120/80", 95, 5)
+    move_cold(service.db, "2020-01", pause=0)
+    with service.db.writer() as con:
+        con.execute("ALTER TABLE cold_patients DROP COLUMN last_month")
+        con.execute("DELETE FROM schema_version WHERE version >= 13")
+    assert migrate(service.db)[0] == 13
+    with service.db.reader() as con:
+        assert con.execute("SELECT last_month FROM cold_patients").fetchall() == [("2019-07",)]
@@ -0,0 +1,26 @@
+from healthcare.db import FULL_SCAN_OK, QUERIES, SCHEMA_VERSION, check_query_plans, migrate, schema_version
+
+
+def test_shipped_queries_use_indexes(db):
+    with db.reader() as con:
+        assert check_query_plans(con) == []
+
+
+def test_full_scan_exceptions_name_shipped_queries():
+    assert set(FULL_SCAN_OK) <= set(QUERIES)
+
+
+def test_migrate_is_idempotent(db):
+    assert migrate(db) == []
+    with db.reader() as con:
+        assert schema_version(con) == SCHEMA_VERSION
+
+
+def test_every_change_counter_uses_the_shared_triggers(db):
+    with db.reader() as con:
+        tables = [name for name, in con.execute("SELECT name FROM table_versions")]
+        triggers = dict(con.execute("SELECT name, sql FROM sqlite_master WHERE type='trigger' AND name LIKE '%_version_%'"))
+    assert "reminders" in tables
+    for table in tables:
+        for event in ("insert", "update", "delete"):
+            assert f"WHERE name = '{table}' AND NOT paused" in triggers[f"trg_{table}_version_{event}"]
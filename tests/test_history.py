@@ -0,0 +1,35 @@
+from healthcare.coldstore import move_cold
+from healthcare.history import HistoryPager
+
+
+def test_pager_delete_drops_the_row_without_reloading(service):
+    pid = service.add_patient("Pager", 40)
+    ids = [service.add_report(pid, f"2024-{m:02d}", "120/80", 90 + m, 5)[0] for m in range(1, 6)]
+    pager = HistoryPager(service.history, pid)
+    assert pager.count() == 5
+    misses = service.history.misses
+
+    service.delete_report(ids[2])
+    pager.delete(ids[2])
+    assert pager.count() == 4
+    assert [r[0] for r in pager.rows(0, 10)] == [ids[4], ids[3], ids[1], ids[0]]
+    assert service.history.misses == misses
+    pager.delete(12345)
+    assert pager.count() == 4
+
+    fresh = pager.changes()
+    assert fresh is not None and fresh.table_rows(0, 10) == pager.rows(0, 10)
+
+
+def test_delete_keeps_cold_rows_out_of_the_table(service):
+    pid = service.add_patient("Tiers", 40)
+    service.add_report(pid, "2018-01", "120/80", 95, 5)
+    feb = service.add_report(pid, "2024-02", "125/80", 97, 5)[0]
+    jan = service.add_report(pid, "2024-01", "130/80", 99, 5)[0]
+    move_cold(service.db, "2020-01", pause=0)
+    service.history.clear()
+    pager = HistoryPager(service.history, pid)
+    assert [r[0] for r in pager.rows(0, 10)] == [jan, feb]
+    pager.delete(jan)
+    assert [r[0] for r in pager.rows(0, 10)] == [feb]
+    assert [r[1] for r in pager.history.rows()] == ["2018-01", "2024-02"]
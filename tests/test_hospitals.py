@@ -0,0 +1,56 @@
+import io
+
+import pytest
+
+from healthcare.hospitals import HospitalDirectory, load_directory, split_names
+
+DIRECTORY = """Name,City,Specialty,Contact
+Apollo Hospitals,Chennai,General,044-1
+Apollo Hospitals, Delhi ,Cardiology,011-1
+City Heart Centre,Delhi,Cardiology,011-2
+City Eye Clinic,Delhi,Eye Care,011-3
+AIIMS Delhi,Delhi,General,011-4
+,Delhi,General,011-5
+Apollo Hospitals,Chennai,General,044-9
+"""
+
+
+def test_split_names_drops_blanks_and_repeats():
+    assert split_names("AIIMS Delhi, apollo;  Apollo\n\n City  Heart ") == ["AIIMS Delhi", "apollo", "City Heart"]
+
+
+def test_load_links_and_looks_up(service):
+    service.save_disease("Heart Trouble", hospitals="Apollo, City, AIIMS Delhi, Nowhere")
+    result = load_directory(service.db, io.StringIO(DIRECTORY), replace=True)
+    assert (result.removed, result.read, result.inserted, result.skipped, result.rejected) == (4, 7, 5, 1, 1)
+    # "Apollo" names one chain (both branches); "City" starts two names and links neither.
+    assert result.unmatched["City"] == result.unmatched["Nowhere"] == 1
+    assert "Apollo" not in result.unmatched and "AIIMS Delhi" not in result.unmatched
+
+    directory = service.hospital_directory
+    by_disease = directory.lookup(disease="heart trouble")
+    assert sorted((name, city) for _, name, city, _, _ in by_disease) == [
+        ("AIIMS Delhi", "Delhi"), ("Apollo Hospitals", "Chennai"), ("Apollo Hospitals", "Delhi")]
+    assert [r[1] for r in directory.lookup("delhi", "cardiology")] == ["City Heart Centre", "Apollo Hospitals"]
+    assert directory.cities() == ["Chennai", "Delhi"]
+    with pytest.raises(ValueError):
+        directory.lookup(specialty="General")
+
+    page = directory.lookup("Delhi", limit=2)
+    rest = directory.lookup("Delhi", before_id=page[-1][0], limit=10)
+    assert [r[1] for r in page + rest] == ["AIIMS Delhi", "City Eye Clinic", "City Heart Centre", "Apollo Hospitals"]
+    pager = directory.pager("Delhi", page_size=2)
+    assert pager.count() == 4 and pager.rows(2, 2) == rest
+
+
+def test_cached_lookups_follow_changes(service):
+    load_directory(service.db, io.StringIO(DIRECTORY), replace=True)
+    directory = service.hospital_directory
+    first = directory.lookup("Chennai")
+    hits = directory.hits
+    assert directory.lookup("Chennai") == first and directory.hits == hits + 1
+    result = load_directory(service.db, io.StringIO("name,city\nGovt Hospital,Chennai\n"), replace=True)
+    assert (result.removed, result.inserted) == (5, 1)
+    assert [r[1] for r in directory.lookup("Chennai")] == ["Govt Hospital"]
+    service.save_disease("Fever", hospitals="Govt Hospital")
+    assert [r[1] for r in directory.lookup(disease="Fever")] == ["Govt Hospital"]
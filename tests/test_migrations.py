@@ -0,0 +1,76 @@
+import sqlite3
+
+from healthcare.db import SCHEMA_VERSION, Database, check_query_plans, init_db, migrate
+from healthcare.summary import check_summary
+
+# The schema the app created before migrations existed.
+BASELINE = """
+CREATE TABLE users(id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE, password TEXT,
+                   role TEXT DEFAULT 'patient');
+CREATE TABLE patients(id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, age INTEGER, gender TEXT,
+                      contact TEXT, created_at TEXT);
+CREATE TABLE reports(id INTEGER PRIMARY KEY AUTOINCREMENT, patient_id INTEGER NOT NULL, month TEXT NOT NULL,
+                     bp_systolic INTEGER, bp_diastolic INTEGER, sugar REAL, uric_acid REAL, created_at TEXT,
+                     FOREIGN KEY(patient_id) REFERENCES patients(id));
+CREATE TABLE diseases(id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE, details TEXT, symptoms TEXT,
+                      treatable INTEGER, medicines TEXT, hospitals TEXT, notes TEXT);
+CREATE TABLE reminders(id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, patient_id INTEGER,
+                       medicine TEXT, remind_at TEXT, done INTEGER DEFAULT 0, created_at TEXT);
+CREATE TABLE hospitals(id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, city TEXT, contact TEXT);
+INSERT INTO patients(name, age, gender, contact, created_at) VALUES ('Asha', 61, 'F', '98100', '2020-01-05 10:00:00');
+INSERT INTO reports(patient_id, month, bp_systolic, bp_diastolic, sugar, uric_acid, created_at)
+    VALUES (1, '2024-01', 130, 85, 110, 6.5, '2024-01-10 09:00:00'),
+           (1, '2024-02', 150, 95, 180, 8.0, '2024-02-10 09:00:00');
+INSERT INTO reminders(user_id, patient_id, medicine, remind_at) VALUES (1, 1, 'Metformin', '2024-03-01 08:00');
+INSERT INTO hospitals(name, city, contact) VALUES ('City Care', 'Pune', '020-1');
+INSERT INTO diseases(name, details, symptoms, treatable, medicines, hospitals, notes)
+    VALUES ('Test Fever', '', 'fever, chills', 1, '', 'City Care, Nowhere', '');
+"""
+
+
+def test_baseline_database_upgrades_in_place(tmp_path):
+    path = str(tmp_path / "old.db")
+    con = sqlite3.connect(path)
+    con.executescript(BASELINE)
+    con.close()
+    db = Database(path, readers=1)
+    try:
+        assert init_db(db) is True
+        assert init_db(db) is False
+        with db.reader() as con:
+            assert con.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+            assert check_query_plans(con) == []
+            assert check_summary(con) == []
+            assert con.execute("SELECT name, age FROM patients").fetchall() == [("Asha", 61)]
+            assert con.execute("SELECT count(*) FROM reports").fetchone()[0] == 2
+            linked = con.execute("SELECT h.name FROM disease_hospitals l JOIN hospitals h ON h.id = l.hospital_id "
+                                 "JOIN diseases d ON d.id = l.disease_id WHERE d.name = 'Test Fever'").fetchall()
+            assert linked == [("City Care",)]
+        with db.writer() as con:
+            con.execute("DELETE FROM patients WHERE id = 1")
+        with db.reader() as con:
+            assert con.execute("SELECT (SELECT count(*) FROM reports) + (SELECT count(*) FROM reminders)"
+                               " + (SELECT count(*) FROM patient_summary)").fetchone()[0] == 0
+    finally:
+        db.close()
+
+
+def test_counter_and_rollup_triggers_become_pausable(db):
+    # A database from before the paused flag: old trigger bodies, no column.
+    with db.writer() as con:
+        triggers = {name: sql for name, sql in con.execute("SELECT name, sql FROM sqlite_master WHERE type='trigger'")
+                    if "paused" in sql}
+        for name in triggers:
+            con.execute(f"DROP TRIGGER {name}")
+        con.execute("ALTER TABLE table_versions DROP COLUMN paused")
+        for sql in triggers.values():
+            con.execute(sql.replace(" AND NOT paused", "").replace(
+                " WHEN NOT (SELECT paused FROM table_versions WHERE name = 'reports')", ""))
+        con.execute("DELETE FROM schema_version WHERE version = 14")
+        assert not [sql for sql, in con.execute("SELECT sql FROM sqlite_master WHERE sql LIKE '%paused%'")]
+    assert migrate(db) == [14]
+    with db.reader() as con:
+        sql = dict(con.execute("SELECT name, sql FROM sqlite_master WHERE type='trigger'"))
+    assert {name: sql[name] for name in triggers} == triggers
+    assert "NOT paused" in sql["trg_reports_version_insert"] and "paused" in sql["trg_reports_summary_insert"]
+    assert "NOT paused" in sql["trg_diseases_version_update"]
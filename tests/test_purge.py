@@ -0,0 +1,43 @@
+from healthcare.coldstore import move_cold
+from healthcare.purge import purge_patients
+from healthcare.summary import check_summary
+
+PER_PATIENT = ["reports", "reminders", "patient_summary", "cold_patients", "cold_summary", "anomaly_state", "alerts"]
+
+
+def _counts(con, pid):
+    return {t: con.execute(f"SELECT count(*) FROM {t} WHERE patient_id=?", (pid,)).fetchone()[0]
+            for t in PER_PATIENT}
+
+
+def test_purge_cascades_and_archives_both_tiers(service):
+    gone = service.add_patient("Gone", 70)
+    kept = service.add_patient("Kept", 70)
+    for pid in (gone, kept):
+        service.add_report(pid, "2018-01", "120/80", 95, 5)
+        service.add_report(pid, "2024-01", "210/130", 320, 15)   # raises alerts
+        service.add_reminder(1, "Aspirin", "2030-01-01 08:00", patient_id=pid)
+    move_cold(service.db, "2020-01", pause=0)
+    with service.db.reader() as con:
+        before = _counts(con, kept)
+    assert all(before.values())
+
+    result = service.purge_patients([gone, gone, 999], archive=True, pause=0)
+    assert (result.requested, result.patients, result.reports, result.reminders) == (2, 1, 2, 1)
+    with service.db.reader() as con:
+        assert set(_counts(con, gone).values()) == {0}
+        assert _counts(con, kept) == before
+        assert con.execute("SELECT name FROM patients_archive").fetchall() == [("Gone",)]
+        assert con.execute("SELECT month FROM reports_archive WHERE patient_id=? ORDER BY month",
+                           (gone,)).fetchall() == [("2018-01",), ("2024-01",)]
+        assert con.execute("SELECT count(*) FROM reminders_archive").fetchone()[0] == 1
+        assert check_summary(con) == []
+
+
+def test_purge_without_archive_leaves_no_copies(service):
+    pid = service.add_patient("Plain", 30)
+    service.add_report(pid, "2024-01", "120/80", 95, 5)
+    assert purge_patients(service.db, [pid], pause=0).patients == 1
+    with service.db.reader() as con:
+        assert con.execute("SELECT (SELECT count(*) FROM patients) + (SELECT count(*) FROM reports)"
+                           " + (SELECT count(*) FROM patients_archive)").fetchone()[0] == 0
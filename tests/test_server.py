@@ -0,0 +1,32 @@
+import asyncio
+import json
+
+import pytest
+
+from healthcare.server import HealthcareServer, HttpError
+
+
+@pytest.fixture
+def server(service):
+    srv = HealthcareServer(service.db, service)
+    yield srv
+    srv.close()
+
+
+def _post(server, path, payload):
+    return asyncio.run(server.dispatch("POST", path, {}, json.dumps(payload).encode()))
+
+
+@pytest.mark.parametrize("payload", [{"symptoms": [1, 2]}, {"symptoms": ["fever", None]}, {"symptoms": {"a": 1}},
+                                     {}, ["fever"]])
+def test_malformed_symptoms_are_a_bad_request(server, payload):
+    with pytest.raises(HttpError) as exc:
+        _post(server, "/symptoms/check", payload)
+    assert exc.value.status == 400
+
+
+def test_symptoms_as_a_list_or_a_string(server):
+    by_list = _post(server, "/symptoms/check", {"symptoms": ["Fever", "cough"]})
+    by_text = _post(server, "/symptoms/check", {"symptoms": "fever, cough"})
+    assert by_list[0] == 200 and by_list[2] == by_text[2]
+    assert json.loads(by_list[2])
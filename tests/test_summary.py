@@ -0,0 +1,71 @@
+import io
+
+from healthcare.summary import check_summary, patient_summary, rebuild_summary
+
+
+def test_triggers_keep_the_rollup_exact(service):
+    a = service.add_patient("A", 50)
+    b = service.add_patient("B", 50)
+    service.add_report(a, "2024-01", "120/80", 95, 5)
+    middle = service.add_report(a, "2024-02", "150/95", 180, 9)[0]
+    service.add_report(a, "2024-03", "130/85", None, 6)
+    only = service.add_report(b, "2024-01", "110/70", 90, 4)[0]
+    with service.db.writer() as con:
+        con.execute("UPDATE reports SET sugar = 130, month = '2024-04' WHERE id = ?", (middle,))
+    service.delete_report(only)
+    with service.db.reader() as con:
+        assert check_summary(con) == []
+    s = patient_summary(service.db, a)
+    assert (s["report_count"], s["latest_month"], s["previous_month"]) == (3, "2024-04", "2024-03")
+    assert s["sugar_n"] == 2 and s["sugar_max"] == 130
+    assert patient_summary(service.db, b) is None
+
+
+def test_deferred_bulk_import_merges_into_the_rollup(service):
+    pid = service.add_patient("Bulk", 40)
+    service.add_report(pid, "2023-12", "120/80", 95, 5)
+    def csv(sugar):
+        return io.StringIO("patient_id,month,bp,sugar,uric_acid\n" + "".join(
+            f"{pid},2024-{m:02d},{110 + m}/{70 + m},{sugar + m},{4 + m / 10}\n" for m in range(1, 13)))
+    service.import_reports(csv(90), "append")
+    service.import_reports(csv(150), "upsert")
+    with service.db.reader() as con:
+        assert check_summary(con) == []
+    s = patient_summary(service.db, pid)
+    assert (s["report_count"], s["sugar_max"]) == (13, 162)
+    with service.db.writer() as con:
+        con.execute("DELETE FROM patient_summary")
+        assert len(check_summary(con)) == 1
+        rebuild_summary(con)
+        assert check_summary(con) == []
+
+
+def test_bulk_writes_pause_triggers_without_schema_changes(service):
+    pid = service.add_patient("Paused", 40)
+    with service.db.reader() as con:
+        schema = con.execute("PRAGMA schema_version").fetchone()[0]
+        version = con.execute("SELECT version FROM table_versions WHERE name = 'reports'").fetchone()[0]
+    csv = io.StringIO("patient_id,month,bp\n" + "".join(f"{pid},2024-{m:02d},120/80\n" for m in range(1, 13)))
+    service.import_reports(csv, "append")
+    service.add_report(pid, "2025-01", "130/85")
+    with service.db.reader() as con:
+        assert con.execute("PRAGMA schema_version").fetchone()[0] == schema
+        assert con.execute("SELECT version FROM table_versions WHERE name = 'reports'").fetchone()[0] >= version + 13
+        assert con.execute("SELECT paused FROM table_versions WHERE name = 'reports'").fetchone() == (0,)
+        assert check_summary(con) == []
+    assert patient_summary(service.db, pid)["report_count"] == 13
+
+
+def test_large_bulk_writes_drop_and_restore_triggers(service):
+    pid = service.add_patient("Dropped", 40)
+    with service.db.reader() as con:
+        schema = con.execute("PRAGMA schema_version").fetchone()[0]
+    csv = io.StringIO("patient_id,month,bp\n" + "".join(f"{pid},2024-{m:02d},120/80\n" for m in range(1, 13)))
+    service.import_reports(csv, "append", batch_size=5)   # full first batch: a large import
+    service.add_report(pid, "2025-01", "130/85")
+    with service.db.reader() as con:
+        assert con.execute("PRAGMA schema_version").fetchone()[0] > schema
+        assert con.execute("SELECT count(*) FROM sqlite_master WHERE type='trigger' AND tbl_name='reports' "
+                           "AND name LIKE 'trg_reports_%'").fetchone()[0] == 6
+        assert check_summary(con) == []
+    assert patient_summary(service.db, pid)["report_count"] == 13
@@ -0,0 +1,68 @@
+import threading
+
+from healthcare.tasks import TaskRunner
+
+
+class FakeRoot:
+    # Just enough of Tk for TaskRunner: after() and after_idle() callbacks
+    # run when the test calls run_pending(), and callback errors are
+    # collected.
+    def __init__(self):
+        self.scheduled = []
+        self.errors = []
+
+    def after(self, ms, fn):
+        self.scheduled.append(fn)
+        return len(self.scheduled)
+
+    def after_idle(self, fn):
+        self.scheduled.append(fn)
+
+    def after_cancel(self, after_id):
+        pass
+
+    def report_callback_exception(self, exc_type, exc, tb):
+        self.errors.append(exc)
+
+    def run_pending(self):
+        while self.scheduled:
+            self.scheduled.pop(0)()
+
+
+def test_a_failing_callback_does_not_stop_the_drain():
+    root = FakeRoot()
+    busy = []
+    runner = TaskRunner(root, on_busy=busy.append)
+    delivered = []
+    gate = threading.Event()
+
+    def broken(_):
+        raise AttributeError("r_pid_var")
+    runner.post(broken, None)
+    runner.post(delivered.append, "posted")
+    first = runner.submit(gate.wait, on_done=broken)
+    second = runner.submit(gate.wait, on_done=delivered.append)
+    gate.set()
+    first.future.result()
+    second.future.result()
+    root.run_pending()
+    assert delivered == ["posted", True]
+    assert [str(e) for e in root.errors] == ["r_pid_var", "r_pid_var"]
+    assert not runner.busy() and busy == [True, False]
+    runner.shutdown()
+
+
+def test_a_post_from_a_worker_schedules_a_drain():
+    root = FakeRoot()
+    runner = TaskRunner(root)
+    delivered = []
+    worker = threading.Thread(target=lambda: [runner.post(delivered.append, n) for n in range(3)])
+    worker.start()
+    worker.join()
+    assert len(root.scheduled) == 1 and not delivered
+    root.run_pending()
+    assert delivered == [0, 1, 2]
+    runner.post(delivered.append, 3)
+    root.run_pending()
+    assert delivered == [0, 1, 2, 3] and not root.errors
+    runner.shutdown()
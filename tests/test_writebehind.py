@@ -0,0 +1,38 @@
+import pytest
+
+from healthcare.db import QUERIES
+from healthcare.writebehind import WriteBehind
+
+
+def test_cache_updates_wait_for_the_batch_commit(service):
+    service.symptoms.ensure_fresh()
+    pid = service.add_patient("Batched", 40)
+    service.history.get(pid)
+    invalidations = service.history.invalidations
+
+    def save_then_fail(name):
+        service.save_disease(name, symptoms="hiccups")
+        raise ValueError("rejected")
+
+    writes = WriteBehind(service.db, max_delay=60)
+    try:
+        kept = writes.submit(service.save_disease, "kept", symptoms="hangnail")
+        dropped = writes.submit(save_then_fail, "dropped")
+        report = writes.submit(service.add_report, pid, "2024-01", "120/80", 95, 5)
+        # Still inside the batch transaction: nothing has reached the caches.
+        probe = writes.submit(lambda: ("hangnail" in service.symptoms.postings, service.history.invalidations,
+                                       service.anomaly.observed))
+        assert writes.flush(5)
+    finally:
+        writes.close()
+
+    assert kept.result() is True and report.result()[1] == "2024-01"
+    with pytest.raises(ValueError):
+        dropped.result()
+    assert probe.result() == (False, invalidations, 0)
+    assert "hangnail" in service.symptoms.postings and "hiccups" not in service.symptoms.postings
+    with service.db.reader() as con:
+        assert service.symptoms.version == con.execute(QUERIES["diseases.version"]).fetchone()[0]
+    assert service.anomaly.observed == 1
+    assert service.history.invalidations == invalidations + 1
+    assert [r[1] for r in service.history.get(pid).rows()] == ["2024-01"]